@@ -0,0 +1,361 @@
+"""
+Anonymize columns of a (large) csv, excel, parquet or feather file without the web
+interface, e.g.
+
+    python anonymize.py survey.csv survey_anonymized.csv --columns answer comment
+
+The file is read and written in chunks, so memory use does not depend on its size.
+With --job-dir finished chunks are kept, a run that is restarted after a crash
+continues after the last finished chunk.
+With --only-anonymized only the anonymized columns (and --id-column) are read.
+The output format follows the extension of the output file (csv, csv.gz, xlsx, parquet).
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from src.anon import ENTITY_PLACEHOLDERS, REGEX_RULES, anon_pipeline_batch
+from src.cache import ResultCache, result_identity
+from src.cascade import add_cascade_arguments, cascade_from_args
+from src.executor import StageStats, anon_pipeline_staged
+from src.export import COMPRESSIONS, WRITERS, anonymized_only, format_of, open_writer
+from src.formats import arrow_schema, input_format, iter_chunks, list_columns
+from src.gazetteer import Gazetteer
+from src.jobs import JobMismatch, ResumableJob, file_hash
+from src.metrics import Aggregator, LogSink, add_sink, prometheus_text, timer
+from src.model import BACKEND, BACKENDS, MODEL_NAME, get_pipeline, model_identity
+from src.ner import TOKEN_BUDGET
+from src.plan import anonymize_column
+from src.pool import WorkerPool, anon_pipeline_parallel
+from src.pseudonyms import EntityIndex
+from src.vault import MappingVault
+
+ENTITIES = list(ENTITY_PLACEHOLDERS) + [placeholder for placeholder, _ in REGEX_RULES]
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Anonymize German (survey) texts in a file")
+    parser.add_argument("input", help="csv, xls(x), parquet or feather file to anonymize")
+    parser.add_argument("output", help="file for the anonymized data")
+    parser.add_argument(
+        "--columns", nargs="+", required=True, help="column(s) that should be anonymized"
+    )
+    parser.add_argument(
+        "--entities",
+        nargs="+",
+        choices=ENTITIES,
+        default=ENTITIES,
+        help="entities to anonymize (default: all)",
+    )
+    parser.add_argument(
+        "--keep-adresses",
+        action="store_true",
+        help="preserve terms of adress (e.g. Frau/Herr)",
+    )
+    parser.add_argument(
+        "--remove-context",
+        action="store_true",
+        help="replace entities with XXX instead of e.g. PERSON_1",
+    )
+    parser.add_argument(
+        "--consistent",
+        action="store_true",
+        help="same placeholder for the same entity in all rows and columns, "
+        "instead of numbering per cell",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1000, help="rows per chunk")
+    parser.add_argument(
+        "--job-dir",
+        help="directory keeping finished chunks, rerun the same command to resume after "
+        "a crash - the output file is written once all chunks are done",
+    )
+    parser.add_argument(
+        "--token-budget", type=int, default=TOKEN_BUDGET, help="tokens per model batch"
+    )
+    parser.add_argument(
+        "--model",
+        default=MODEL_NAME,
+        help=f"name or directory of the model, e.g. prepared for mmap (default: {MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default=BACKEND,
+        help=f"inference backend of the model (default: {BACKEND})",
+    )
+    add_cascade_arguments(parser)
+    parser.add_argument(
+        "--gazetteer",
+        help="file of known names, one 'PER/LOC/ORG<tab>name' per line, found besides the model",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="only anonymize the names of --gazetteer, without running the model",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes sharing the model (default: 1, no pool)",
+    )
+    parser.add_argument(
+        "--threads-per-worker", type=int, default=1, help="torch threads of every worker"
+    )
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        help="run regex, tokenization, model and decoding concurrently on batches of texts "
+        "and print the utilization of every stage",
+    )
+    parser.add_argument(
+        "--cache-db",
+        help="sqlite file caching results across runs, e.g. to rerun with other output options",
+    )
+    parser.add_argument(
+        "--vault",
+        help="sqlite file keeping the original text of every placeholder, "
+        "see reidentify.py - keep it as safe as the input file",
+    )
+    parser.add_argument(
+        "--job", help="name of the run in the vault (default: name of the output file)"
+    )
+    parser.add_argument(
+        "--metrics",
+        help="file for timings and counters per stage in Prometheus text format, "
+        "rewritten after every chunk",
+    )
+    parser.add_argument(
+        "--log-metrics",
+        action="store_true",
+        help="log every timing and counter as a json line to stderr",
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(WRITERS),
+        help="format of the output file (default: by its extension, else csv)",
+    )
+    parser.add_argument(
+        "--compression",
+        choices=["none", "gzip", "snappy", "zstd"],
+        help="compression of the output file (default: gzip for .gz, snappy for parquet)",
+    )
+    parser.add_argument(
+        "--only-anonymized",
+        action="store_true",
+        help="write only the anonymized columns, without the original data",
+    )
+    parser.add_argument(
+        "--id-column", help="column written with --only-anonymized to match the rows"
+    )
+    parser.add_argument("--sep", default=",", help="field delimiter of the csv files")
+    return parser.parse_args(args)
+
+
+def anonymize_chunk(
+    chunk, columns, args, nlp=None, cache=None, gazetteer=None, index=None, vault=None, pool=None
+):
+    """
+    add a column <column>_anonymized for every column to anonymize, the mappings of
+    the rows go to the vault. with --workers the texts run on pool, the WorkerPool of
+    the run. returns the chunk and the number of model calls saved by planning
+    """
+    saved = 0
+    for column in columns:
+        if args.workers > 1:
+            runner = anon_pipeline_parallel
+            options = {"pool": pool}
+        elif args.staged:
+            runner = anon_pipeline_staged
+            options = {"stats": args.stage_stats}
+        else:
+            runner = anon_pipeline_batch
+            options = {}
+
+        documents, report = anonymize_column(
+            chunk[column],
+            args.entities,
+            args.keep_adresses,
+            runner=runner,
+            token_budget=args.token_budget,
+            nlp=nlp,
+            cache=cache,
+            gazetteer=gazetteer,
+            fast=args.fast,
+            index=index,
+            **options,
+        )
+        saved += report["model_calls_saved"]
+
+        if vault is not None:
+            vault.put_many(args.job, column, chunk.index, documents)
+
+        with timer("serialize"):
+            chunk[f"{column}_anonymized"] = [
+                document.to_text(context=not args.remove_context) for document in documents
+            ]
+    return chunk, saved
+
+
+def job_options(args):
+    """the options that change the output of a chunk"""
+    return {
+        "columns": args.columns,
+        "entities": sorted(args.entities),
+        "keep_adresses": args.keep_adresses,
+        "remove_context": args.remove_context,
+        "consistent": args.consistent,
+        "only_anonymized": args.only_anonymized,
+        "id_column": args.id_column,
+        "sep": args.sep,
+    }
+
+
+def write_metrics(path, aggregator):
+    """replace the file at once, e.g. for the textfile collector of the node exporter"""
+    with open(f"{path}.tmp", "w") as output:
+        output.write(prometheus_text(aggregator))
+    os.replace(f"{path}.tmp", path)
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    aggregator = None
+    if args.metrics:
+        aggregator = Aggregator()
+        add_sink(aggregator)
+    if args.log_metrics:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        add_sink(LogSink())
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        sys.exit("Error: input and output must be different files")
+
+    args.format = args.format or format_of(args.output)
+    if args.compression is None:
+        gzipped = args.format == "csv" and args.output.lower().endswith(".gz")
+        args.compression = "gzip" if gzipped else COMPRESSIONS[args.format][0]
+    elif args.compression == "none":
+        args.compression = None
+    if args.compression not in COMPRESSIONS[args.format]:
+        sys.exit(f"Error: {args.format} does not support compression {args.compression}")
+
+    try:
+        source_format = input_format(args.input)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+    keep = [args.id_column] if args.id_column else []
+    available = list_columns(args.input, source_format, args.sep)
+    missing = [column for column in keep + args.columns if column not in available]
+    if missing:
+        sys.exit(f"Error: column(s) not found in input-file: {', '.join(missing)}")
+
+    if args.fast and not args.gazetteer:
+        sys.exit("Error: --fast requires --gazetteer")
+    if args.staged and args.workers > 1:
+        sys.exit("Error: --staged runs in one process, use it without --workers")
+    args.stage_stats = StageStats() if args.staged else None
+    gazetteer = Gazetteer.load(args.gazetteer) if args.gazetteer else None
+    uses_model = any([e in ENTITY_PLACEHOLDERS for e in args.entities]) and not args.fast
+    cascade = cascade_from_args(args) if args.cascade and uses_model else None
+    model = cascade.identity if cascade is not None else model_identity(args.model, args.backend)
+    identity = result_identity(model, gazetteer, args.fast)
+
+    index = EntityIndex() if args.consistent else None
+
+    job = None
+    if args.job_dir:
+        try:
+            job = ResumableJob.open(
+                args.job_dir, file_hash(args.input), job_options(args), identity, args.chunk_size
+            )
+        except JobMismatch as e:
+            sys.exit(f"Error: {e}")
+        if args.consistent and job.chunks:
+            index = job.load_index()
+        if job.chunks:
+            print(f"resuming after {job.chunks} chunks ({job.rows} rows)", file=sys.stderr)
+
+    nlp = cascade
+    if uses_model and cascade is None:
+        nlp = get_pipeline(args.model, args.backend)
+
+    # the workers are forked once, before the connections of cache and vault are opened
+    pool = None
+    if args.workers > 1:
+        pool = WorkerPool(args.workers, args.threads_per_worker, nlp, gazetteer)
+
+    cache = ResultCache(identity, path=args.cache_db)
+
+    vault = None
+    if args.vault:
+        args.job = args.job or os.path.basename(args.output)
+        vault = MappingVault(args.vault)
+
+    # without the original data only the columns used are read
+    columns = list(dict.fromkeys(keep + args.columns)) if args.only_anonymized else None
+
+    resumed = rows = job.rows if job is not None else 0
+    saved = 0
+    started = time.time()
+    # cells of csv and excel files are read as text, a column empty in the first chunk
+    # has the same type as in the others and its values are written as they were
+    reader = iter_chunks(args.input, source_format, columns, args.chunk_size, args.sep, dtype=str)
+    schema = arrow_schema(args.input, source_format, columns)
+    # a job writes the output file once all chunks are done
+    writer = None
+    if job is None:
+        writer = open_writer(args.output, args.format, args.compression, args.sep, schema)
+
+    for number, chunk in enumerate(reader):
+        if job is not None and number < job.chunks:
+            continue
+
+        chunk, chunk_saved = anonymize_chunk(
+            chunk, args.columns, args, nlp, cache, gazetteer, index, vault, pool
+        )
+        output = anonymized_only(chunk, args.columns, keep) if args.only_anonymized else chunk
+        with timer("write"):
+            if job is not None:
+                job.save_chunk(number, output, index)
+            else:
+                writer.write(output)
+
+        rows += len(chunk.index)
+        saved += chunk_saved
+        if aggregator is not None:
+            write_metrics(args.metrics, aggregator)
+        elapsed = time.time() - started
+        print(f"{rows} rows done ({(rows - resumed) / elapsed:.1f} rows/sec)", file=sys.stderr)
+
+    if pool is not None:
+        pool.close()
+    if job is not None:
+        writer = open_writer(args.output, args.format, args.compression, args.sep, schema)
+        with timer("write"):
+            for output in job.iter_chunks():
+                writer.write(output)
+        job.finish()
+    writer.close()
+    print(f"model calls saved by deduplication and skipping: {saved}", file=sys.stderr)
+    print(f"cache: {cache.stats()}", file=sys.stderr)
+    if index is not None:
+        print(f"distinct entities: {index.counts()}", file=sys.stderr)
+    if cascade is not None:
+        print(f"cascade: {json.dumps(cascade.report())}", file=sys.stderr)
+    if args.stage_stats is not None:
+        print(f"stage utilization:\n{args.stage_stats.format()}", file=sys.stderr)
+    cache.close()
+    if vault is not None:
+        print(f"mappings stored in {args.vault} as job {args.job!r}", file=sys.stderr)
+        vault.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
-import base64
-import io
+import hashlib
+import math
 import os
+import time
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
@@ -8,17 +10,8 @@ import streamlit as st
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# io helpers
-def xls_to_df(filename):
-    df = pd.read_excel(filename)
-    return df
-
-
-def csv_to_df(filename):
-    df = pd.read_csv(filename)
-    return df
-
 
+# io helpers
 def create_download_text(href, anon_cols):
 
     if len(anon_cols) > 1:
@@ -53,6 +46,10 @@ entities_dict = {
 
 selection_mode = ["Single Text", "File Upload"]
 
+# rows of an uploaded file that are anonymized
+MAX_ROWS = 250
+
+
 # helper function
 def gen_entities(entities, input):
     """generates entities from inputlist"""
@@ -61,6 +58,41 @@ def gen_entities(entities, input):
     return result
 
 
+def show_run_metrics(aggregator, title="Timings"):
+    """timing breakdown and counters of one run"""
+    with st.beta_expander(title, True):
+        breakdown = pd.DataFrame(aggregator.breakdown())
+        if breakdown.empty:
+            st.write("Nothing was computed, all results came from the cache.")
+        else:
+            breakdown["share"] = (breakdown["share"] * 100).round(1).astype(str) + " %"
+            st.table(breakdown)
+
+        counters = [
+            {"counter": name, "labels": ", ".join(f"{k}={v}" for k, v in labels), "value": value}
+            for (name, labels), value in sorted(aggregator.counters.items())
+        ]
+        if counters:
+            st.table(pd.DataFrame(counters))
+
+
+def show_preview(run, context):
+    """paginated input and output of the anonymized columns"""
+    with st.beta_expander("Preview", True):
+        preview_col_1, preview_col_2, preview_col_3 = st.beta_columns(3)
+
+        column = preview_col_1.selectbox("Column", list(run), key=13)
+        page_size = preview_col_2.selectbox("Rows per page", [10, 25, 50, 100], key=14)
+        documents = run[column]
+        pages = max(1, math.ceil(len(documents) / page_size))
+        page = preview_col_3.number_input(
+            f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=15
+        )
+
+        start = (int(page) - 1) * page_size
+        preview_table(documents, start, start + page_size, context)
+
+
 ###########################
 ## APP
 ###########################
@@ -75,9 +107,62 @@ hide_streamlit_style = """
 
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
-with st.spinner(text="Initializing models..."):
-    from src.anon import *
-    from src.visual import *
+from src.anon import *
+from src.cache import ResultCache, result_identity
+from src.export import COMPRESSIONS, FORMATS, export_frame, export_suffix
+from src.formats import EXTENSIONS, input_format, list_columns, read_frame
+from src.gazetteer import Gazetteer
+from src.incremental import SentenceCache, anon_incremental, sentence_documents
+from src.metrics import collect
+from src.model import model_identity, set_pipeline_cache
+from src.plan import anonymize_column
+from src.pseudonyms import EntityIndex
+from src.vault import MappingVault
+from src.visual import *
+
+# keep the model across reruns and sessions of the app
+set_pipeline_cache(st.cache(allow_output_mutation=True))
+
+
+@st.cache(allow_output_mutation=True)
+def get_result_cache(identity):
+    """results shared by all reruns and sessions, on disk if ANON_CACHE_DB is set"""
+    return ResultCache(model=identity, path=os.getenv("ANON_CACHE_DB"))
+
+
+@st.cache(allow_output_mutation=True)
+def get_sentence_cache(identity):
+    """results of single sentences, an edit of the text only runs the changed ones"""
+    return SentenceCache(identity)
+
+
+@st.cache(allow_output_mutation=True)
+def get_runs():
+    """
+    documents of recent file runs by content of file and options, so they survive
+    the reruns of the preview
+    """
+    return OrderedDict()
+
+
+def remember_run(key, run, max_runs=8):
+    runs = get_runs()
+    runs[key] = run
+    runs.move_to_end(key)
+    while len(runs) > max_runs:
+        runs.popitem(last=False)
+
+
+@st.cache(allow_output_mutation=True)
+def get_vault(path):
+    """mappings of file uploads for re-identification, only if ANON_VAULT_DB is set"""
+    return MappingVault(path)
+
+
+@st.cache(allow_output_mutation=True)
+def load_gazetteer(content):
+    return Gazetteer.from_lines(content.decode("utf-8").splitlines())
+
 
 st.sidebar.title("🧰 Open Anonymizer")
 st.sidebar.text("  Anonymize German (Survey) Texts")
@@ -142,8 +227,38 @@ def sidebar_c():
             key=8,
             help="Should terms of adress (e.g. Frau/Herr) be preserved?",
         )
+        consistent = st.checkbox(
+            "Consistent placeholders",
+            value=False,
+            key=12,
+            help="Should an entity get the same placeholder in all rows and columns of a file?",
+        )
+        show_timings = st.checkbox(
+            "Show timings",
+            value=False,
+            key=11,
+            help="Show where the time of a run was spent, e.g. model or rule-based anonymization",
+        )
     st.write("")
-    return (no_context, keep_adresses)
+    return (no_context, keep_adresses, show_timings, consistent)
+
+
+def sidebar_d():
+    with st.beta_expander("Known names", False):
+        gazetteer_file = st.file_uploader(
+            "List of known persons, locations and organizations",
+            type=["txt", "tsv"],
+            key=9,
+            help="One name per line: PER, LOC or ORG, a tab and the name",
+        )
+        fast_mode = st.checkbox(
+            "Fast mode",
+            value=False,
+            key=10,
+            help="Only anonymize the known names instead of running the model",
+        )
+    st.write("")
+    return (gazetteer_file, fast_mode)
 
 
 with st.sidebar:
@@ -151,11 +266,30 @@ with st.sidebar:
     a = sidebar_a()
     b = sidebar_b()
     c = sidebar_c()
+    d = sidebar_d()
 
 # all inputs from sidebar
 inputlist = a + b  # inputlist=[True,True,True,True,False,False,False]
 no_context = c[0]
 keep_adresses = c[1]
+show_timings = c[2]
+consistent = c[3]
+
+gazetteer = None
+if d[0] is not None:
+    try:
+        gazetteer = load_gazetteer(d[0].getvalue())
+    except (UnicodeDecodeError, ValueError) as e:
+        st.sidebar.error(f"Error in list of known names: {e}")
+fast_mode = d[1]
+
+# without known names fast mode would leave persons, locations and organizations as they are
+if fast_mode and gazetteer is None:
+    st.error("Error: Fast mode requires a list of known names, upload one or turn it off.")
+    st.stop()
+
+result_cache = get_result_cache(result_identity(model_identity(), gazetteer, fast_mode))
+sentence_cache = get_sentence_cache(result_identity(model_identity(), gazetteer, fast_mode))
 
 
 ######################################
@@ -168,7 +302,7 @@ if mode_select == selection_mode[0]:
     text = st.text_area(
         "Try Open Anonymizer by entering your text below",
         "Wegen der hohen Inzidenzrate von über 150 bleiben Kaufhäuser (z.B. Karstadt) weiterhin geschlossen, teilte Frau Henriette Reker dem Tagesspiegel am 01.05.2021 in Köln mit. Fragen beantwortet die Stadt Köln via E-Mail (info@stadt-koeln.de) und telefonisch unter 0211 556677. Weitere Informationen finden Sie unter dem Aktenzeichen 2021/0815",
-        max_chars=1000,
+        max_chars=20000,
         height=100,
     )
 
@@ -176,25 +310,41 @@ if mode_select == selection_mode[0]:
 
     st.markdown("---")
 
-    if sanitize_button:
-
-        # get entities to anonimize, based on selection:
-        entities = gen_entities(entities_dict, inputlist)
-
-        cleaned_text, mapping = anon_pipeline(text, entities, keep_adresses)
-        output_text = remove_context(cleaned_text) if no_context else cleaned_text
-
-        ######################################
-        # OUTPUT
-        ######################################
-        col1, col2 = st.beta_columns(2)
-        with col1:
-            st.header("Input")
-            highlight_text(cleaned_text, mapping)
-
-        with col2:
-            st.header("Output")
-            highlight_text(output_text, [], False)
+    # get entities to anonimize, based on selection:
+    entities = gen_entities(entities_dict, inputlist)
+
+    # after a run, changes of the output options are shown without the button - the
+    # sentences come from the cache and the model does not run again
+    if sanitize_button or sentence_cache.covers(text, entities):
+
+        with collect() as run_metrics:
+            with st.spinner(text="Applying models..."):
+                document = anon_incremental(
+                    text,
+                    entities,
+                    keep_adresses,
+                    sentence_cache,
+                    gazetteer=gazetteer,
+                    fast=fast_mode,
+                )
+            sentences = sentence_documents(document)
+
+            ######################################
+            # OUTPUT
+            ######################################
+            col1, col2 = st.beta_columns(2)
+            with col1:
+                st.header("Input")
+                highlight_sentences(sentences)
+
+            with col2:
+                st.header("Output")
+                highlight_sentences(
+                    sentences, original=False, with_label=False, context=not no_context
+                )
+
+        if show_timings:
+            show_run_metrics(run_metrics)
 
 
 if mode_select == selection_mode[1]:
@@ -205,7 +355,8 @@ if mode_select == selection_mode[1]:
     # )
 
     uploaded_file = st.file_uploader(
-        "Step 1: Upload the file you want to anonymize", type=["csv", "xls", "xlsx"]
+        "Step 1: Upload the file you want to anonymize",
+        type=[extension.lstrip(".") for extension in EXTENSIONS],
     )
 
     st.markdown("---")
@@ -214,47 +365,72 @@ if mode_select == selection_mode[1]:
 
         # Step1
         #######
-        # transform file to pd
+        # columns of the file, the data is read once they are selected
 
         filename, file_extension = os.path.splitext(uploaded_file.name.lower())
 
-        if ".xls" in file_extension or ".xlsx" in file_extension:
-            data = xls_to_df(filename=uploaded_file)
-        elif ".csv" in file_extension:
-            data = csv_to_df(filename=uploaded_file)
-        else:
-            print("Error - not supported filetype")
+        try:
+            file_format = input_format(uploaded_file.name)
+        except ValueError as e:
+            st.error(f"Error: {e}")
+            st.stop()
 
-        if len(data.index) > 250:
-            st.info(
-                f"This Web-App only supports files with up to 250 rows. Your input data will be reduced from {len(data.index)} to 250 rows!"
-            )
-
-        # reduce input data - # limit! to 500 rows
-        df2 = data.head(250)  
+        all_columns = list_columns(uploaded_file, file_format)
 
         # Step2
         #######
         # check if columns are are available in file
 
-        if len(list(df2.columns)) < 1:
+        if len(all_columns) < 1:
             st.error("Error: No columns found in input-file!")
+            columns_to_anonymize = []
         else:
             columns_to_anonymize = st.multiselect(
                 "Step 2: Select column(s) that should be anonymized and submit with the button below",
                 # ["<<please select>>"] + list(data.columns),
-                list(data.columns),
+                all_columns,
             )
 
+        # only the selected columns of the first rows are read
+        df2 = pd.DataFrame()
+        if columns_to_anonymize:
+            data = read_frame(uploaded_file, file_format, columns_to_anonymize, nrows=MAX_ROWS + 1)
+            if len(data.index) > MAX_ROWS:
+                st.info(
+                    f"This Web-App only supports files with up to {MAX_ROWS} rows. Your input data will be reduced to the first {MAX_ROWS} rows!"
+                )
+            df2 = data.head(MAX_ROWS)
+
         batch_anon_button = st.button("Start anonymizing")
         st.markdown("---")
 
+        # the output of a run is shown until file or options change
+        entities = gen_entities(entities_dict, inputlist)
+        run_key = hashlib.sha256(uploaded_file.getvalue()).hexdigest() + repr(
+            (
+                columns_to_anonymize,
+                entities,
+                keep_adresses,
+                consistent,
+                fast_mode,
+                gazetteer.identity if gazetteer is not None else None,
+            )
+        )
+        vault = None
+
         # select relevant column:
-        if batch_anon_button and columns_to_anonymize and len(list(data.columns)) > 0:
+        if batch_anon_button and columns_to_anonymize:
+
+            # placeholders numbered across all rows and columns
+            index = EntityIndex() if consistent else None
+            run = OrderedDict()
+
+            if os.getenv("ANON_VAULT_DB"):
+                vault = get_vault(os.getenv("ANON_VAULT_DB"))
+                job = f"{uploaded_file.name}-{time.strftime('%Y%m%d-%H%M%S')}"
 
             # new columnname
             for each_anon_col in columns_to_anonymize:
-                anonymized_column = f"{each_anon_col}_anonymized"
 
                 # check if column is numbers-only
                 if df2[each_anon_col].dtype == np.number:
@@ -262,38 +438,83 @@ if mode_select == selection_mode[1]:
 
                 else:
                     # actual anonimization
-                    entities = gen_entities(entities_dict, inputlist)
-
-                    with st.spinner(text="Applying models..."):
-                        df2[anonymized_column] = [
-                            anon_pipeline(txtrow, entities, keep_adresses)[0]
-                            for txtrow in list(df2[each_anon_col])
-                        ]
+                    with collect() as run_metrics, st.spinner(text="Applying models..."):
+                        documents, report = anonymize_column(
+                            df2[each_anon_col],
+                            entities,
+                            keep_adresses,
+                            cache=result_cache,
+                            gazetteer=gazetteer,
+                            fast=fast_mode,
+                            index=index,
+                        )
+                        run[each_anon_col] = documents
                         # st.success('Done')
 
-                # write result to file
-            new_filename = f"{filename}_anonymized{file_extension}"
-
-            if ".xls" in file_extension or ".xlsx" in file_extension:
-                # data = xls_to_df(filename=uploaded_file)
-                towrite = io.BytesIO()
-                xlsx = df2.to_excel(towrite, encoding="utf-8", index=False, header=True)
-                towrite.seek(0)  # reset pointer
-                b64 = base64.b64encode(towrite.read()).decode()
-                href = f'Step 3: <a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64}" download="{new_filename}">Download anonymized excel file</a> (right-click and "save as")'
-
-            elif ".csv" in file_extension:
-                new_filename = f"{filename}_anonymized.csv"
-                # data = csv_to_df(filename=uploaded_file)
-                csv = df2.to_csv(index=False)
-                b64 = base64.b64encode(
-                    csv.encode()
-                ).decode()  # some strings <-> bytes conversions necessary here
-                href = f'Step 3: <a href="data:file/csv;base64,{b64}" download="{new_filename}">Download anonymized CSV file</a> (right-click and "save as"). '
+                    if report["model_calls_saved"]:
+                        st.info(
+                            f"{each_anon_col}: {report['model_calls_saved']} of {report['rows']} model calls saved ({report['rows'] - report['unique'] - report['empty']} duplicates, {report['empty']} empty and {report['regex_only']} cells without text)."
+                        )
+
+                    if vault is not None:
+                        vault.put_many(job, each_anon_col, df2.index, documents)
+
+                    if show_timings:
+                        show_run_metrics(run_metrics, f"Timings of {each_anon_col}")
+
+            remember_run(run_key, run)
+
+        run = get_runs().get(run_key)
+        if run:
+            for each_anon_col, documents in run.items():
+                df2[f"{each_anon_col}_anonymized"] = [
+                    document.to_text(context=not no_context) for document in documents
+                ]
+
+            # write result to file
+            export_col_1, export_col_2, export_col_3 = st.beta_columns(3)
+            upload_format = {"xls": "xlsx", "feather": "parquet"}.get(file_format, file_format)
+            export_format = export_col_1.selectbox(
+                "Format", list(FORMATS), index=list(FORMATS).index(upload_format)
+            )
+            compression = export_col_2.selectbox(
+                "Compression", COMPRESSIONS[export_format], format_func=lambda c: c or "none"
+            )
+            export_col_3.write("")
+            only_anonymized = export_col_3.checkbox("Only anonymized columns", value=False)
+
+            keep = all_columns
+            if only_anonymized:
+                id_column = export_col_3.selectbox("ID column", ["<none>"] + all_columns)
+                keep = [] if id_column == "<none>" else [id_column]
+
+            # the other columns are only read for the download
+            export = pd.DataFrame(index=df2.index)
+            if keep:
+                export = read_frame(uploaded_file, file_format, keep, nrows=len(df2.index))
+            for each_anon_col in run:
+                export[f"{each_anon_col}_anonymized"] = df2[f"{each_anon_col}_anonymized"]
+            new_filename = f"{filename}_anonymized{export_suffix(export_format, compression)}"
+            path = export_frame(export, export_format, compression)
 
             # Step3
             #######
-            create_download_text(href, columns_to_anonymize)
+            try:
+                with open(path, "rb") as exported:
+                    st.download_button(
+                        "Step 3: Download anonymized file",
+                        exported,
+                        file_name=new_filename,
+                        mime=FORMATS[export_format],
+                    )
+                create_download_text("", list(run))
+            finally:
+                os.remove(path)
+
+            if vault is not None:
+                st.info(f"The original texts are stored for re-identification as job {job}.")
+
+            show_preview(run, context=not no_context)
 
 
 ###########################
@@ -0,0 +1,155 @@
+"""
+Compare the entity spans, latency and memory of inference backends
+
+    python -m benchmarks.backend_accuracy --corpus corpus.jsonl --backends fp32 int8
+
+The corpus has one json object per line with a "text" and optionally gold
+"entities" as [start, end, label] lists, e.g. from benchmarks.corpus. Without
+gold entities the spans of the first backend are the reference, without a
+corpus generated answers are used. Every backend runs in its own process,
+so its memory is measured in isolation. Prints json. The mmap backend only loads
+a model directory written by prepare_model.py, select it with --backends.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import sys
+import time
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.stats import percentile, rss_mb
+from src.model import BACKENDS, MODEL_NAME, init_pipeline
+from src.ner import predict_entities
+
+LABELS = ["PER", "LOC", "ORG"]
+
+
+def read_corpus(path):
+    with open(path, encoding="utf-8") as corpus:
+        return [json.loads(line) for line in corpus if line.strip()]
+
+
+def run_backend(model_name, backend, texts, latency_samples):
+    """load the backend and predict all texts, runs in a separate process"""
+    started = time.perf_counter()
+    # stdout is the json report
+    with contextlib.redirect_stdout(sys.stderr):
+        nlp = init_pipeline(model_name, backend)
+    load_seconds = time.perf_counter() - started
+    rss_loaded, _ = rss_mb()
+
+    started = time.perf_counter()
+    found = predict_entities(nlp, texts)
+    batch_seconds = time.perf_counter() - started
+
+    latencies = []
+    for text in texts[:latency_samples]:
+        started = time.perf_counter()
+        predict_entities(nlp, [text])
+        latencies.append(time.perf_counter() - started)
+
+    _, rss_peak = rss_mb()
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "texts_per_sec": len(texts) / batch_seconds,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "rss_loaded_mb": rss_loaded,
+        "rss_peak_mb": rss_peak,
+        "spans": [
+            [(e["start"], e["end"], e["entity_group"]) for e in row if e["entity_group"] in LABELS]
+            for row in found
+        ],
+    }
+
+
+def label_spans(rows, label):
+    return {(i, start, end) for i, row in enumerate(rows) for start, end, l in row if l == label}
+
+
+def precision_recall(spans, reference):
+    """precision and recall per label of exact span matches"""
+    scores = {}
+    for label in LABELS:
+        predicted = label_spans(spans, label)
+        expected = label_spans(reference, label)
+        hits = len(predicted & expected)
+        scores[label] = {
+            "precision": hits / len(predicted) if predicted else None,
+            "recall": hits / len(expected) if expected else None,
+            "support": len(expected),
+        }
+    return scores
+
+
+def delta(value, base):
+    return None if value is None or base is None else value - base
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="jsonl file, default: generated answers")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=list(BACKENDS),
+        default=["fp32", "int8"],
+        help="mmap needs a --model prepared with prepare_model.py (default: fp32 int8)",
+    )
+    parser.add_argument("--rows", type=int, default=200, help="generated answers without --corpus")
+    parser.add_argument("--latency-samples", type=int, default=100)
+    args = parser.parse_args(args)
+
+    if args.corpus:
+        corpus = read_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(args.rows)
+    texts = [row["text"] for row in corpus]
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends:
+        with context.Pool(1) as pool:
+            results.append(
+                pool.apply(run_backend, (args.model, backend, texts, args.latency_samples))
+            )
+
+    gold = all("entities" in row for row in corpus)
+    if gold:
+        reference = [[tuple(e) for e in row["entities"]] for row in corpus]
+    else:
+        reference = results[0]["spans"]
+
+    for result in results:
+        result["scores"] = precision_recall(result.pop("spans"), reference)
+
+    base = results[0]
+    for result in results:
+        result["deltas"] = {
+            label: {
+                metric: delta(result["scores"][label][metric], base["scores"][label][metric])
+                for metric in ["precision", "recall"]
+            }
+            for label in LABELS
+        }
+        result["speedup"] = result["texts_per_sec"] / base["texts_per_sec"]
+
+    print(
+        json.dumps(
+            {
+                "model": args.model,
+                "texts": len(texts),
+                "reference": "gold" if gold else base["backend"],
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Compare the cascade of a small and a large model with the large model alone
+
+    python -m benchmarks.cascade --rows 1000 --thresholds 0.8 0.9 0.95
+    python -m benchmarks.cascade --small models/small --large models/xlm-roberta
+
+Without --small and --large two tiny models of different size are trained on
+the corpus generator first, so the benchmark runs offline. Prints per threshold
+texts/sec, speedup, escalation rate, agreement with the large model and
+precision/recall against the gold entities of the corpus as json.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.backend_accuracy import LABELS, precision_recall
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.tiny_model import build_tiny_model
+from src.cascade import Cascade
+from src.model import BACKEND, BACKENDS, init_pipeline
+from src.ner import predict_entities
+
+
+def spans(found):
+    return [
+        [(e["start"], e["end"], e["entity_group"]) for e in row if e["entity_group"] in LABELS]
+        for row in found
+    ]
+
+
+def timed(nlp, texts):
+    started = time.perf_counter()
+    found = predict_entities(nlp, texts)
+    return found, time.perf_counter() - started
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_corpus_arguments(parser)
+    parser.add_argument("--small", help="small model, default: a tiny model built here")
+    parser.add_argument("--large", help="large model, default: a bigger tiny model built here")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=BACKEND)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.9, 0.95])
+    parser.add_argument(
+        "--trust-entities", action="store_true", help="only escalate texts with uncertain tokens"
+    )
+    args = parser.parse_args(args)
+
+    corpus = corpus_from_args(args)
+    texts = [row["text"] for row in corpus]
+    gold = [[tuple(e) for e in row["entities"]] for row in corpus]
+
+    with tempfile.TemporaryDirectory() as directory:
+        # stdout is the json report
+        with contextlib.redirect_stdout(sys.stderr):
+            small_path = args.small or build_tiny_model(
+                os.path.join(directory, "small"), steps=150, hidden_size=16, layers=1
+            )
+            large_path = args.large or build_tiny_model(os.path.join(directory, "large"), steps=300)
+            small = init_pipeline(small_path, args.backend)
+            large = init_pipeline(large_path, args.backend)
+
+    predict_entities(large, texts[:20])
+    predict_entities(small, texts[:20])
+
+    large_found, large_seconds = timed(large, texts)
+    small_found, small_seconds = timed(small, texts)
+
+    results = []
+    for threshold in args.thresholds:
+        cascade = Cascade(
+            small, large, min_confidence=threshold, escalate_entities=not args.trust_entities
+        )
+        found, seconds = timed(cascade, texts)
+        results.append(
+            {
+                "min_confidence": threshold,
+                "texts_per_sec": len(texts) / seconds,
+                "speedup": large_seconds / seconds,
+                **cascade.report(),
+                "scores": precision_recall(spans(found), gold),
+            }
+        )
+
+    print(
+        json.dumps(
+            {
+                "texts": len(texts),
+                "escalate_entities": not args.trust_entities,
+                "large": {
+                    "texts_per_sec": len(texts) / large_seconds,
+                    "scores": precision_recall(spans(large_found), gold),
+                },
+                "small": {
+                    "texts_per_sec": len(texts) / small_seconds,
+                    "scores": precision_recall(spans(small_found), gold),
+                },
+                "cascade": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
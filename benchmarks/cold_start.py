@@ -0,0 +1,117 @@
+"""
+Measure start time and memory of model replicas per backend
+
+    python -m benchmarks.cold_start --replicas 4
+    python -m benchmarks.cold_start --model models/ --replicas 2 --backends fp32 mmap
+
+Starts the replicas as processes at the same time, each loads the model and
+anonymizes one text. Prints per backend the seconds to import the libraries, to
+load the model and to the first result and per replica RSS and PSS (shared pages
+split between the replicas) as json. Without --model a small model is built first and prepared for the mmap
+backend; the page cache is warm, as on a restart of a replica.
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.tiny_model import build_tiny_model
+from src.model import BACKENDS
+from src.weights import is_mapped, prepare_mapped
+
+REPLICA = """
+import contextlib, json, sys, time
+started = time.perf_counter()
+import torch, transformers.pipelines
+from src.anon import anon_pipeline
+from src.model import init_pipeline
+imported = time.perf_counter()
+with contextlib.redirect_stdout(sys.stderr):
+    nlp = init_pipeline({model!r}, {backend!r})
+loaded = time.perf_counter()
+anon_pipeline("Frau Henriette Reker wohnt in Köln.", ["PER", "LOC", "ORG"], False, nlp=nlp)
+first = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - started,
+    "load_seconds": loaded - imported,
+    "first_result_seconds": first - started,
+}}))
+sys.stdout.flush()
+# memory is measured once all replicas are up
+sys.stdin.readline()
+from benchmarks.stats import smaps_mb
+print(json.dumps(smaps_mb()))
+"""
+
+
+def run_replicas(model, backend, replicas):
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", REPLICA.format(model=model, backend=backend)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        )
+        for _ in range(replicas)
+    ]
+    timings = [json.loads(process.stdout.readline()) for process in processes]
+
+    memory = []
+    for process in processes:
+        process.stdin.write("\n")
+        process.stdin.flush()
+    for process in processes:
+        memory.append(json.loads(process.stdout.readline()))
+        process.wait()
+
+    return {
+        "backend": backend,
+        "replicas": replicas,
+        "import_seconds": statistics.median(t["import_seconds"] for t in timings),
+        "load_seconds": statistics.median(t["load_seconds"] for t in timings),
+        "first_result_seconds": statistics.median(t["first_result_seconds"] for t in timings),
+        "rss_mb_per_replica": statistics.mean(m["rss_mb"] for m in memory),
+        "pss_mb_per_replica": statistics.mean(m["pss_mb"] for m in memory),
+        "pss_mb_total": sum(m["pss_mb"] for m in memory),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--model", help="directory of the model, default: a small model built here")
+    parser.add_argument("--mapped", help="directory prepared for mmap, default: prepared here")
+    parser.add_argument("--replicas", type=int, default=4)
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=["fp32", "mmap"])
+    parser.add_argument("--hidden-size", type=int, default=512, help="of the model built here")
+    parser.add_argument("--layers", type=int, default=8, help="of the model built here")
+    args = parser.parse_args(args)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # stdout is the json report
+        with contextlib.redirect_stdout(sys.stderr):
+            model = args.model or build_tiny_model(
+                os.path.join(directory, "model"),
+                steps=5,
+                hidden_size=args.hidden_size,
+                layers=args.layers,
+            )
+            mapped = args.mapped or (model if is_mapped(model) else None)
+            if mapped is None and "mmap" in args.backends:
+                mapped = os.path.join(directory, "mapped")
+                prepare_mapped(model, mapped)
+
+        results = [
+            run_replicas(mapped if backend == "mmap" else model, backend, args.replicas)
+            for backend in args.backends
+        ]
+
+    print(json.dumps({"model": args.model, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Generate synthetic German survey answers with gold entities
+
+    python -m benchmarks.corpus --rows 10000 --seed 1 > corpus.jsonl
+
+Every answer is a few sentences, some of them mention a person, place,
+organization, date, e-mail address, phone number or ID. The number of
+sentences per answer and the density of every entity type are configurable,
+the same seed always gives the same corpus. Prints one json object per line
+with the "text" and its gold "entities" as [start, end, label] lists, the
+format of benchmarks.backend_accuracy.
+"""
+import argparse
+import json
+import random
+
+FIRST_NAMES = [
+    "Anna",
+    "Jürgen",
+    "Henriette",
+    "Lukas",
+    "Sabine",
+    "Mehmet",
+    "Katharina",
+    "Thomas",
+    "Özlem",
+    "Stefan",
+    "Marie",
+    "Dimitri",
+    "Ursula",
+    "Jonas",
+    "Fatma",
+    "Markus",
+]
+LAST_NAMES = [
+    "Müller",
+    "Schmidt",
+    "Reker",
+    "Weber",
+    "Yılmaz",
+    "Wagner",
+    "Becker",
+    "Hoffmann",
+    "Schäfer",
+    "Koch",
+    "Richter",
+    "Klein",
+    "Wolf",
+    "Schröder",
+    "Neumann",
+    "Braun",
+]
+PLACES = [
+    "Köln",
+    "Mannheim",
+    "Berlin",
+    "Hamburg",
+    "München",
+    "Leipzig",
+    "Stuttgart",
+    "Dresden",
+    "Frankfurt am Main",
+    "Bad Homburg",
+    "Düsseldorf",
+    "Bochum",
+    "Freiburg",
+    "Kiel",
+]
+ORGANIZATIONS = [
+    "Karstadt",
+    "Deutsche Bahn",
+    "Sparkasse",
+    "Telekom",
+    "AOK",
+    "Lidl",
+    "Volkshochschule",
+    "Stadtwerke München",
+    "Allianz",
+    "Caritas",
+    "ADAC",
+    "Commerzbank",
+]
+DOMAINS = ["web.de", "gmx.de", "t-online.de", "posteo.de", "stadt-koeln.de"]
+
+# sentences without entities
+FILLERS = [
+    "Der Service war gut.",
+    "Die Wartezeit war leider viel zu lang.",
+    "Alles in Ordnung.",
+    "Ich bin insgesamt sehr zufrieden.",
+    "Die Preise sind in den letzten Jahren deutlich gestiegen.",
+    "Die Webseite ist unübersichtlich und auf dem Handy kaum zu bedienen.",
+    "Bitte mehr Personal an den Wochenenden einsetzen.",
+    "Ich würde mir längere Öffnungszeiten wünschen.",
+    "Das Formular war verständlich.",
+    "Man hat mir nicht weitergeholfen, obwohl ich mehrfach nachgefragt habe.",
+]
+
+# answers that occur many times in real surveys
+SHORT_ANSWERS = ["keine Angabe", "weiß nicht", "nein", "-", "Nichts.", "alles gut"]
+
+# sentences per entity type, {} is the entity
+SENTENCES = {
+    "PER": [
+        "Frau {} hat mir sehr geholfen.",
+        "Ich habe am Telefon mit {} gesprochen.",
+        "{} war unfreundlich.",
+        "Mein Ansprechpartner Herr {} war nicht erreichbar.",
+    ],
+    "LOC": [
+        "Ich wohne in {}.",
+        "Die Filiale in {} war geschlossen.",
+        "Der Umzug nach {} hat gut geklappt.",
+    ],
+    "ORG": [
+        "Ich bin seit Jahren Kunde bei {}.",
+        "Die {} hat auf meine Beschwerde nicht reagiert.",
+        "Ich bin von {} gewechselt.",
+    ],
+    "DATE": ["Am {} war ich vor Ort.", "Der Termin wurde auf den {} verschoben."],
+    "EMAIL": ["Schreiben Sie mir an {}.", "Meine Adresse ist {}, bitte antworten."],
+    "PHONE": ["Ich bin unter {} erreichbar.", "Rufen Sie mich unter {} zurück."],
+    "NUMBER": ["Meine Kundennummer ist {}.", "Es geht um das Aktenzeichen {}."],
+}
+
+# probability that a sentence mentions an entity of the type
+DENSITIES = {
+    "PER": 0.15,
+    "LOC": 0.1,
+    "ORG": 0.1,
+    "DATE": 0.05,
+    "EMAIL": 0.03,
+    "PHONE": 0.03,
+    "NUMBER": 0.03,
+}
+
+
+def ascii_name(name):
+    for umlaut, replacement in [("ä", "ae"), ("ö", "oe"), ("ü", "ue"), ("ß", "ss"), ("ı", "i")]:
+        name = name.replace(umlaut, replacement)
+    return name.lower()
+
+
+def make_entity(rng, label):
+    """surface text of a random entity of the type"""
+    if label == "PER":
+        if rng.random() < 0.5:
+            return rng.choice(LAST_NAMES)
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    if label == "LOC":
+        return rng.choice(PLACES)
+    if label == "ORG":
+        return rng.choice(ORGANIZATIONS)
+    if label == "DATE":
+        return f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2015, 2023)}"
+    if label == "EMAIL":
+        first, last = ascii_name(rng.choice(FIRST_NAMES)), ascii_name(rng.choice(LAST_NAMES))
+        return f"{first}.{last}@{rng.choice(DOMAINS)}"
+    if label == "PHONE":
+        prefix = rng.choice(["0221", "0621", "030", "0176", "+49 170"])
+        return f"{prefix} {rng.randint(100000, 9999999)}"
+    if label == "NUMBER":
+        if rng.random() < 0.5:
+            return f"{rng.randint(2015, 2023)}/{rng.randint(1000, 9999)}"
+        return f"{rng.randint(10000000, 99999999)}"
+    raise ValueError(f"unknown entity type {label!r}")
+
+
+def make_sentence(rng, label):
+    """sentence mentioning one entity, returns the text and the entity offsets"""
+    template = rng.choice(SENTENCES[label])
+    entity = make_entity(rng, label)
+    start = template.index("{}")
+    return template.format(entity), (start, start + len(entity), label)
+
+
+def generate_answer(rng, mean_sentences=2.0, max_sentences=12, densities=DENSITIES):
+    """one answer with its gold entities"""
+    count = 1 + int(rng.expovariate(1 / (mean_sentences - 1))) if mean_sentences > 1 else 1
+
+    sentences = []
+    entities = []
+    length = 0
+    for _ in range(min(count, max_sentences)):
+        labels = [label for label, density in densities.items() if rng.random() < density]
+        if not labels:
+            labels = [None]
+
+        for label in labels:
+            if label is None:
+                sentence, entity = rng.choice(FILLERS), None
+            else:
+                sentence, entity = make_sentence(rng, label)
+
+            if sentences:
+                length += 1
+            if entity is not None:
+                entities.append([entity[0] + length, entity[1] + length, entity[2]])
+
+            sentences.append(sentence)
+            length += len(sentence)
+
+    return {"text": " ".join(sentences), "entities": entities}
+
+
+def generate_corpus(
+    rows,
+    seed=0,
+    mean_sentences=2.0,
+    max_sentences=12,
+    densities=DENSITIES,
+    short_rate=0.1,
+    duplicate_rate=0.05,
+):
+    """
+    rows answers as dicts with "text" and gold "entities" - short_rate of them are
+    frequent short answers like "keine Angabe", duplicate_rate repeat an earlier answer
+    """
+    rng = random.Random(seed)
+    corpus = []
+
+    for _ in range(rows):
+        chance = rng.random()
+        if chance < short_rate:
+            corpus.append({"text": rng.choice(SHORT_ANSWERS), "entities": []})
+        elif chance < short_rate + duplicate_rate and corpus:
+            corpus.append(dict(rng.choice(corpus)))
+        else:
+            corpus.append(generate_answer(rng, mean_sentences, max_sentences, densities))
+
+    return corpus
+
+
+def parse_densities(values):
+    densities = dict(DENSITIES)
+    for value in values or []:
+        label, _, density = value.partition("=")
+        if label not in DENSITIES:
+            raise argparse.ArgumentTypeError(f"unknown entity type {label!r}")
+        densities[label] = float(density)
+    return densities
+
+
+def add_corpus_arguments(parser):
+    """generator options, shared with the benchmarks that generate their corpus"""
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mean-sentences", type=float, default=2.0)
+    parser.add_argument("--max-sentences", type=int, default=12)
+    parser.add_argument(
+        "--density",
+        nargs="+",
+        metavar="TYPE=P",
+        help="probability per sentence of an entity type, e.g. PER=0.5 EMAIL=0.1",
+    )
+    parser.add_argument("--short-rate", type=float, default=0.1)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+
+
+def corpus_from_args(args):
+    return generate_corpus(
+        args.rows,
+        args.seed,
+        args.mean_sentences,
+        args.max_sentences,
+        parse_densities(args.density),
+        args.short_rate,
+        args.duplicate_rate,
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_corpus_arguments(parser)
+    args = parser.parse_args(args)
+
+    for row in corpus_from_args(args):
+        print(json.dumps(row, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure the cost of importing the anonymization core in a fresh interpreter
+
+    python -m benchmarks.import_time --repeat 5
+
+Prints seconds and peak RSS per module as json and fails if an import pulls in
+Streamlit or the model libraries.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ["src.anon", "src.document", "src.model", "src.ner"]
+
+# must not be imported by the core - only when the model or the app is used
+HEAVY_MODULES = ["streamlit", "transformers", "torch"]
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": seconds,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def measure(module, repeat):
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            check=True,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+
+    return {
+        "module": module,
+        "seconds_median": statistics.median(run["seconds"] for run in runs),
+        "seconds_max": max(run["seconds"] for run in runs),
+        "max_rss_mb": max(run["max_rss_mb"] for run in runs),
+        "heavy_modules": sorted({m for run in runs for m in run["heavy_modules"]}),
+    }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    args = parser.parse_args(args)
+
+    results = [measure(module, args.repeat) for module in args.modules]
+    print(json.dumps(results, indent=2))
+
+    heavy = sorted({m for result in results for m in result["heavy_modules"]})
+    if heavy:
+        sys.exit(f"Error: importing the core pulled in {', '.join(heavy)}")
+
+
+if __name__ == "__main__":
+    main()
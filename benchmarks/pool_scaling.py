@@ -0,0 +1,84 @@
+"""
+Measure how anon_pipeline_parallel scales with the number of worker processes
+
+    python -m benchmarks.pool_scaling --rows 2000 --workers 1 2 4 8
+
+Prints rows/sec, speedup and parallel efficiency per worker count as json.
+"""
+import argparse
+import json
+import os
+import time
+
+from src.model import get_pipeline
+from src.pool import anon_pipeline_parallel
+
+ENTITIES = ["PER", "LOC", "ORG", "DATE", "EMAIL", "PHONE", "NUMBER"]
+
+SAMPLE = (
+    "Wegen der hohen Inzidenzrate von über 150 bleiben Kaufhäuser (z.B. Karstadt) weiterhin "
+    "geschlossen, teilte Frau Henriette Reker dem Tagesspiegel am 01.05.2021 in Köln mit. "
+    "Fragen beantwortet die Stadt Köln via E-Mail (info@stadt-koeln.de) und telefonisch "
+    "unter 0211 556677. Weitere Informationen finden Sie unter dem Aktenzeichen 2021/0815"
+)
+
+
+def sample_texts(rows):
+    """texts of varying length built from the sample text of the app"""
+    sentences = SAMPLE.split(". ")
+    return [
+        ". ".join(sentences[: 1 + row % len(sentences)]) + f" (Antwort {row})"
+        for row in range(rows)
+    ]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args(args)
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, 8, 16, 32, cores} & set(range(1, cores + 1)))
+    texts = sample_texts(args.rows)
+
+    # load once, all runs fork from the same parent
+    nlp = get_pipeline()
+
+    results = []
+    for count in workers:
+        started = time.perf_counter()
+        anon_pipeline_parallel(
+            texts,
+            ENTITIES,
+            False,
+            workers=count,
+            threads_per_worker=args.threads_per_worker,
+            chunk_size=args.chunk_size,
+            nlp=nlp,
+        )
+        seconds = time.perf_counter() - started
+        results.append({"workers": count, "seconds": seconds, "rows_per_sec": args.rows / seconds})
+
+    baseline = results[0]["rows_per_sec"] / results[0]["workers"]
+    for result in results:
+        result["speedup"] = result["rows_per_sec"] / baseline
+        result["efficiency"] = result["speedup"] / result["workers"]
+
+    print(
+        json.dumps(
+            {
+                "cores": cores,
+                "rows": args.rows,
+                "threads_per_worker": args.threads_per_worker,
+                "results": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
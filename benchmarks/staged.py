@@ -0,0 +1,95 @@
+"""
+Compare anon_pipeline_batch with the staged executor on a synthetic corpus
+
+    python -m benchmarks.staged --rows 2000 --batch-size 32 64
+    python -m benchmarks.staged --model models/xlm-roberta --threads 1 2
+
+Without --model a tiny model is built from the corpus generator first, so the
+benchmark runs offline. Prints rows/sec of both, the speedup and the utilization
+of every stage (busy, starved and blocked share of the wall time) as json.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.tiny_model import build_tiny_model
+from src.anon import ENTITY_PLACEHOLDERS, REGEX_RULES, anon_pipeline_batch
+from src.executor import StageStats, anon_pipeline_staged
+from src.model import BACKEND, BACKENDS, init_pipeline
+from src.ner import TOKEN_BUDGET
+
+ENTITIES = list(ENTITY_PLACEHOLDERS) + [placeholder for placeholder, _ in REGEX_RULES]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_corpus_arguments(parser)
+    parser.add_argument("--model", help="model name or path, default: a tiny model built here")
+    parser.add_argument("--tiny-steps", type=int, default=300, help="training steps of it")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=BACKEND)
+    parser.add_argument("--token-budget", type=int, default=TOKEN_BUDGET)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[64], help="texts per batch")
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1], help="regex/decode threads")
+    args = parser.parse_args(args)
+
+    texts = [row["text"] for row in corpus_from_args(args)]
+
+    # stdout is the json report
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(sys.stderr):
+        model = args.model or build_tiny_model(directory, steps=args.tiny_steps, seed=args.seed)
+        nlp = init_pipeline(model, args.backend)
+
+    anon_pipeline_batch(texts[:20], ENTITIES, False, token_budget=args.token_budget, nlp=nlp)
+
+    started = time.perf_counter()
+    expected = anon_pipeline_batch(texts, ENTITIES, False, token_budget=args.token_budget, nlp=nlp)
+    batch_seconds = time.perf_counter() - started
+
+    results = []
+    for batch_size in args.batch_size:
+        for threads in args.threads:
+            stats = StageStats()
+            started = time.perf_counter()
+            documents = anon_pipeline_staged(
+                texts,
+                ENTITIES,
+                False,
+                token_budget=args.token_budget,
+                nlp=nlp,
+                batch_size=batch_size,
+                queue_size=args.queue_size,
+                threads=threads,
+                stats=stats,
+            )
+            seconds = time.perf_counter() - started
+            results.append(
+                {
+                    "batch_size": batch_size,
+                    "threads": threads,
+                    "rows_per_sec": len(texts) / seconds,
+                    "speedup": batch_seconds / seconds,
+                    "same_output": [d.to_dict() for d in documents]
+                    == [d.to_dict() for d in expected],
+                    "stages": stats.utilization(),
+                }
+            )
+
+    print(
+        json.dumps(
+            {
+                "rows": len(texts),
+                "batch_rows_per_sec": len(texts) / batch_seconds,
+                "staged": results,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
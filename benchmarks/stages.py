@@ -0,0 +1,175 @@
+"""
+Time every stage of the anonymization separately on a synthetic corpus
+
+    python -m benchmarks.stages --rows 2000 --seed 1
+    python -m benchmarks.stages --corpus corpus.jsonl --model models/xlm-roberta
+
+Stages: regex rules (anonymize_regex), ner (predict_entities), substitution of
+the model entities (find_entity_spans, merge_spans, from_spans), remove_context
+and the html of highlight_text. Without --model a tiny model is built from the
+corpus generator first, so the benchmark runs offline. Prints throughput,
+p50/p99 latency and peak memory per stage as json.
+"""
+import argparse
+import contextlib
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import add_corpus_arguments, corpus_from_args
+from benchmarks.stats import percentile, rss_mb
+from benchmarks.tiny_model import build_tiny_model
+from src.anon import (
+    ENTITY_PLACEHOLDERS,
+    REGEX_RULES,
+    anonymize_regex,
+    find_entity_spans,
+    merge_spans,
+    remove_context,
+)
+from src.document import AnonymizedDocument
+from src.model import BACKEND, BACKENDS, init_pipeline
+from src.ner import TOKEN_BUDGET, predict_entities
+from src.visual import highlight_html
+
+REGEX_ENTITIES = [placeholder for placeholder, _ in REGEX_RULES]
+ENTITIES = list(ENTITY_PLACEHOLDERS) + REGEX_ENTITIES
+
+
+def time_each(function, items):
+    """call function on every item, returns the results and the seconds per call"""
+    results = []
+    latencies = []
+    for item in items:
+        started = time.perf_counter()
+        results.append(function(item))
+        latencies.append(time.perf_counter() - started)
+    return results, latencies
+
+
+def python_peak_mb(function, items):
+    """peak of python allocations while calling function on every item, keeping the results"""
+    tracemalloc.start()
+    results = [function(item) for item in items]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return peak / 1024 / 1024
+
+
+def report(items, chars, seconds, latencies):
+    return {
+        "items": items,
+        "seconds": seconds,
+        "items_per_sec": items / seconds if seconds else None,
+        "chars_per_sec": chars / seconds if seconds else None,
+        "latency_p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "latency_p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+    }
+
+
+def run_per_item(function, items, chars, memory=True):
+    """stage that processes one item per call"""
+    results, latencies = time_each(function, items)
+    stage = report(len(items), chars, sum(latencies), latencies)
+    stage["python_peak_mb"] = python_peak_mb(function, items) if memory else None
+    stage["rss_peak_mb"] = rss_mb()[1]
+    return results, stage
+
+
+def run_ner(nlp, texts, chars, token_budget, latency_samples):
+    """batched throughput over all texts, latency of single texts"""
+    started = time.perf_counter()
+    found = predict_entities(nlp, texts, token_budget=token_budget)
+    seconds = time.perf_counter() - started
+
+    _, latencies = time_each(
+        lambda text: predict_entities(nlp, [text], token_budget=token_budget),
+        texts[:latency_samples],
+    )
+
+    stage = report(len(texts), chars, seconds, latencies)
+    # tensors are not traced by tracemalloc, the process peak includes the model
+    stage["python_peak_mb"] = None
+    stage["rss_peak_mb"] = rss_mb()[1]
+    return found, stage
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_corpus_arguments(parser)
+    parser.add_argument("--corpus", help="jsonl file with a 'text' per line instead of generating")
+    parser.add_argument("--model", help="model name or path, default: a tiny model built here")
+    parser.add_argument("--tiny-steps", type=int, default=300, help="training steps of it")
+    parser.add_argument("--backend", choices=list(BACKENDS), default=BACKEND)
+    parser.add_argument("--token-budget", type=int, default=TOKEN_BUDGET)
+    parser.add_argument("--latency-samples", type=int, default=200, help="single ner calls")
+    parser.add_argument("--warmup", type=int, default=20, help="texts run before timing")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    args = parser.parse_args(args)
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as corpus:
+            texts = [json.loads(line)["text"] for line in corpus if line.strip()]
+    else:
+        texts = [row["text"] for row in corpus_from_args(args)]
+    chars = sum(len(text) for text in texts)
+    memory = not args.no_memory
+
+    # stdout is the json report
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(sys.stderr):
+        model = args.model or build_tiny_model(directory, steps=args.tiny_steps, seed=args.seed)
+        started = time.perf_counter()
+        nlp = init_pipeline(model, args.backend)
+        load_seconds = time.perf_counter() - started
+
+    warmup = texts[: args.warmup]
+    for text in warmup:
+        anonymize_regex(text, REGEX_ENTITIES)
+    predict_entities(nlp, warmup, token_budget=args.token_budget)
+
+    stages = {}
+
+    regex_documents, stages["regex"] = run_per_item(
+        lambda text: anonymize_regex(text, REGEX_ENTITIES), texts, chars, memory
+    )
+
+    found, stages["ner"] = run_ner(nlp, texts, chars, args.token_budget, args.latency_samples)
+
+    def substitute(item):
+        text, regex_spans, found_entities = item
+        spans = merge_spans(regex_spans, find_entity_spans(text, found_entities, ENTITIES))
+        return AnonymizedDocument.from_spans(text, spans)
+
+    regex_spans = [
+        [(span.start, span.end, span.label) for span in document.spans]
+        for document in regex_documents
+    ]
+    documents, stages["substitution"] = run_per_item(
+        substitute, list(zip(texts, regex_spans, found)), chars, memory
+    )
+
+    _, stages["remove_context"] = run_per_item(remove_context, documents, chars, memory)
+    _, stages["highlight"] = run_per_item(highlight_html, documents, chars, memory)
+
+    print(
+        json.dumps(
+            {
+                "model": args.model or "tiny",
+                "backend": args.backend,
+                "load_seconds": load_seconds,
+                "rows": len(texts),
+                "chars": chars,
+                "entities": sum(len(document.spans) for document in documents),
+                "seed": None if args.corpus else args.seed,
+                "stages": stages,
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Helpers shared by the benchmarks
+"""
+
+import resource
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) with linear interpolation"""
+    values = sorted(values)
+    if not values:
+        return None
+
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def rss_mb():
+    """current and peak resident memory of this process in MB (Linux), peak elsewhere"""
+    try:
+        with open("/proc/self/status") as status:
+            fields = dict(line.split(":", 1) for line in status)
+        return int(fields["VmRSS"].split()[0]) / 1024, int(fields["VmHWM"].split()[0]) / 1024
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return None, peak
+
+
+def smaps_mb(pid="self"):
+    """
+    resident (rss), proportional (pss, shared pages split between the processes
+    using them) and shared memory of a process in MB, from /proc (Linux only)
+    """
+    with open(f"/proc/{pid}/smaps_rollup") as rollup:
+        # the first line is the address range
+        next(rollup)
+        fields = dict(line.split(":", 1) for line in rollup)
+    fields = {key: int(value.split()[0]) / 1024 for key, value in fields.items()}
+    return {
+        "rss_mb": fields["Rss"],
+        "pss_mb": fields["Pss"],
+        "shared_mb": fields["Shared_Clean"] + fields["Shared_Dirty"],
+    }
@@ -0,0 +1,164 @@
+"""
+Build a tiny token-classification model from the synthetic corpus
+
+    python -m benchmarks.tiny_model models/tiny --rows 2000 --steps 300
+
+The model has the labels of the German conll03 model, a WordPiece vocabulary
+learned from the corpus and a few small transformer layers, trained for some
+steps on the gold entities of benchmarks.corpus. It is built offline in seconds
+and loads like any other model, e.g. --model models/tiny in the benchmarks or
+init_pipeline("models/tiny"). Its accuracy is meaningless, its purpose is to
+exercise the NER code path.
+"""
+import argparse
+import os
+import random
+from collections import Counter
+
+from benchmarks.corpus import generate_corpus
+
+# labels of xlm-roberta-large-finetuned-conll03-german
+LABELS = ["O", "B-ORG", "B-MISC", "B-PER", "I-PER", "B-LOC", "I-ORG", "I-MISC", "I-LOC"]
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+
+
+def train_tokenizer(texts, path, vocab_size=4000):
+    """
+    WordPiece tokenizer with the most frequent words of texts and their characters,
+    saved and loaded as a fast tokenizer. Unlike the trainer of the tokenizers library
+    the vocabulary does not depend on the order of ties, the same texts give the
+    same model
+    """
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    normalizer = normalizers.NFC()
+    pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    counts = Counter(
+        word
+        for text in texts
+        for word, _ in pre_tokenizer.pre_tokenize_str(normalizer.normalize_str(text))
+    )
+    chars = sorted({char for word in counts for char in word})
+    words = sorted((word for word in counts if len(word) > 1), key=lambda w: (-counts[w], w))
+    vocab = SPECIAL_TOKENS + chars + [f"##{char}" for char in chars]
+    vocab += words[: max(0, vocab_size - len(vocab))]
+
+    tokenizer = Tokenizer(
+        models.WordPiece({token: i for i, token in enumerate(vocab)}, unk_token="[UNK]")
+    )
+    tokenizer.normalizer = normalizer
+    tokenizer.pre_tokenizer = pre_tokenizer
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="[CLS] $A [SEP]",
+        special_tokens=[(token, tokenizer.token_to_id(token)) for token in ["[CLS]", "[SEP]"]],
+    )
+
+    tokenizer_file = os.path.join(path, "tokenizer.json")
+    tokenizer.save(tokenizer_file)
+    return PreTrainedTokenizerFast(
+        tokenizer_file=tokenizer_file,
+        model_max_length=512,
+        unk_token="[UNK]",
+        pad_token="[PAD]",
+        cls_token="[CLS]",
+        sep_token="[SEP]",
+        mask_token="[MASK]",
+    )
+
+
+def token_labels(offsets, entities):
+    """BIO label id per token from gold [start, end, label] entities, -100 for special tokens"""
+    label2id = {label: i for i, label in enumerate(LABELS)}
+    labels = []
+    previous = None
+
+    for start, end in offsets:
+        if start == end:
+            labels.append(-100)
+            continue
+
+        entity = next((e for e in entities if e[0] <= start and end <= e[1]), None)
+        if entity is None or f"B-{entity[2]}" not in label2id:
+            labels.append(label2id["O"])
+        elif entity is previous:
+            labels.append(label2id[f"I-{entity[2]}"])
+        else:
+            labels.append(label2id[f"B-{entity[2]}"])
+        previous = entity
+
+    return labels
+
+
+def build_tiny_model(path, rows=2000, steps=300, batch_size=32, seed=0, hidden_size=64, layers=2):
+    """
+    train tokenizer and model on a generated corpus and save both to path
+    """
+    import torch
+    from transformers import BertConfig, BertForTokenClassification
+
+    os.makedirs(path, exist_ok=True)
+    torch.manual_seed(seed)
+
+    corpus = [row for row in generate_corpus(rows, seed) if row["text"]]
+    tokenizer = train_tokenizer([row["text"] for row in corpus], path)
+
+    config = BertConfig(
+        vocab_size=tokenizer.vocab_size,
+        hidden_size=hidden_size,
+        num_hidden_layers=layers,
+        num_attention_heads=2,
+        intermediate_size=hidden_size * 2,
+        max_position_embeddings=512,
+        num_labels=len(LABELS),
+        id2label=dict(enumerate(LABELS)),
+        label2id={label: i for i, label in enumerate(LABELS)},
+    )
+    model = BertForTokenClassification(config)
+
+    encodings = tokenizer(
+        [row["text"] for row in corpus], truncation=True, return_offsets_mapping=True
+    )
+    examples = [
+        (ids, token_labels(offsets, row["entities"]))
+        for ids, offsets, row in zip(encodings["input_ids"], encodings["offset_mapping"], corpus)
+    ]
+
+    rng = random.Random(seed)
+    optimizer = torch.optim.Adam(model.parameters(), lr=3e-3)
+    model.train()
+    for _ in range(steps):
+        batch = rng.sample(examples, min(batch_size, len(examples)))
+        length = max(len(ids) for ids, _ in batch)
+        input_ids = torch.tensor(
+            [ids + [tokenizer.pad_token_id] * (length - len(ids)) for ids, _ in batch]
+        )
+        labels = torch.tensor([labels + [-100] * (length - len(labels)) for _, labels in batch])
+
+        loss = model(
+            input_ids=input_ids, attention_mask=(input_ids != tokenizer.pad_token_id), labels=labels
+        )[0]
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    model.eval()
+    model.save_pretrained(path)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("path", help="directory for the model")
+    parser.add_argument("--rows", type=int, default=2000, help="generated training answers")
+    parser.add_argument("--steps", type=int, default=300, help="training steps")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(args)
+
+    print(build_tiny_model(args.path, args.rows, args.steps, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
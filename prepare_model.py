@@ -0,0 +1,30 @@
+"""
+Convert the model into a directory whose weights can be memory-mapped, e.g.
+
+    python prepare_model.py models/ models-mapped/
+    ANON_BACKEND=mmap streamlit run app.py
+
+Every process started with the mmap backend maps the same weights file read-only:
+replicas on one host share it in the page cache and a restarted process does not
+deserialize the checkpoint again.
+"""
+import argparse
+
+from src.model import MODEL_NAME
+from src.weights import prepare_mapped
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Prepare memory-mapped model weights")
+    parser.add_argument(
+        "model", nargs="?", default=MODEL_NAME, help="hub name or directory of the model"
+    )
+    parser.add_argument("output", help="directory for config, tokenizer and weights")
+    args = parser.parse_args(args)
+
+    prepare_mapped(args.model, args.output)
+    print(f"prepared {args.model} in {args.output}, load it with ANON_BACKEND=mmap")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Reverse the anonymization of a file written by anonymize.py --vault, e.g.
+
+    python reidentify.py survey_anonymized.csv survey_restored.csv --vault vault.sqlite \\
+        --columns answer comment
+
+Adds a column <column>_reidentified for every <column>_anonymized. Rows are matched
+by their position in the file, so the anonymized file must not be filtered or
+sorted. Placeholders replaced with XXX (--remove-context) cannot be restored.
+The input can be any output format of anonymize.py, the output format follows the
+extension of the output file.
+"""
+import argparse
+import os
+import sys
+
+from src.export import COMPRESSIONS, format_of, open_writer
+from src.formats import arrow_schema, input_format, iter_chunks
+from src.vault import MappingVault
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Re-identify an anonymized file")
+    parser.add_argument("input", help="csv, xlsx or parquet file written by anonymize.py")
+    parser.add_argument("output", help="csv, xlsx or parquet file for the re-identified data")
+    parser.add_argument("--vault", required=True, help="sqlite file of anonymize.py --vault")
+    parser.add_argument(
+        "--columns", nargs="+", required=True, help="anonymized column(s), without _anonymized"
+    )
+    parser.add_argument(
+        "--job", help="name of the run in the vault (default: name of the input file)"
+    )
+    parser.add_argument("--chunk-size", type=int, default=10000, help="rows per chunk")
+    parser.add_argument("--sep", default=",", help="field delimiter of the csv file")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        sys.exit("Error: input and output must be different files")
+
+    vault = MappingVault(args.vault)
+    job = args.job or os.path.basename(args.input)
+    if not vault.has_job(job):
+        sys.exit(f"Error: job {job!r} not found in {args.vault}, use --job")
+
+    try:
+        source_format = input_format(args.input)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    output_format = format_of(args.output)
+    gzipped = output_format == "csv" and args.output.lower().endswith(".gz")
+    compression = "gzip" if gzipped else COMPRESSIONS[output_format][0]
+
+    rows = 0
+    reader = iter_chunks(args.input, source_format, None, args.chunk_size, args.sep, dtype=str)
+    schema = arrow_schema(args.input, source_format)
+    writer = open_writer(args.output, output_format, compression, args.sep, schema)
+    for chunk in reader:
+        for column in args.columns:
+            anonymized = f"{column}_anonymized"
+            if anonymized not in chunk.columns:
+                sys.exit(f"Error: column not found in input-file: {anonymized}")
+
+            chunk[f"{column}_reidentified"] = vault.reidentify_many(
+                job, column, chunk.index, chunk[anonymized]
+            )
+
+        writer.write(chunk)
+        rows += len(chunk.index)
+
+    writer.close()
+    print(f"{rows} rows re-identified", file=sys.stderr)
+    vault.close()
+
+
+if __name__ == "__main__":
+    main()
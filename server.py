@@ -0,0 +1,99 @@
+"""
+HTTP service for other systems, e.g.
+
+    python server.py --port 8000
+
+    curl -d '{"text": "Frau Henriette Reker wohnt in Köln"}' localhost:8000/anonymize
+
+POST /anonymize takes a "text", /anonymize/batch a list of "texts", both with the
+options "entities" (default: all), "keep_adresses", "context", "fast" and
+"timings". Concurrent requests are combined into model batches. GET /metrics
+returns the timings and counters in Prometheus text format, GET /health the
+number of waiting texts.
+"""
+import argparse
+
+import tornado.ioloop
+
+from src.cache import ResultCache, result_identity
+from src.cascade import add_cascade_arguments, cascade_from_args
+from src.gazetteer import Gazetteer
+from src.model import BACKEND, BACKENDS, MODEL_NAME, get_pipeline, model_identity
+from src.service import make_app
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="HTTP service anonymizing German texts")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--address", default="", help="address to listen on (default: all)")
+    parser.add_argument(
+        "--model",
+        default=MODEL_NAME,
+        help=f"name or directory of the model, e.g. prepared for mmap (default: {MODEL_NAME})",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=list(BACKENDS),
+        default=BACKEND,
+        help=f"inference backend of the model (default: {BACKEND})",
+    )
+    add_cascade_arguments(parser)
+    parser.add_argument(
+        "--max-batch", type=int, default=64, help="most texts of concurrent requests per batch"
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=10,
+        help="longest time a request waits for others to fill its batch",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=10000,
+        help="waiting texts before requests are rejected with 503",
+    )
+    parser.add_argument(
+        "--gazetteer",
+        help="file of known names, one 'PER/LOC/ORG<tab>name' per line, found besides the model",
+    )
+    parser.add_argument(
+        "--cache-db",
+        help="sqlite file caching results across restarts",
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+
+    gazetteer = Gazetteer.load(args.gazetteer) if args.gazetteer else None
+    # load the model before the first request
+    if args.cascade:
+        nlp = cascade_from_args(args)
+        model = nlp.identity
+    else:
+        nlp = get_pipeline(args.model, args.backend)
+        model = model_identity(args.model, args.backend)
+    cache = ResultCache(result_identity(model, gazetteer), path=args.cache_db)
+    # results of fast mode requests must not be served to requests that run the model
+    fast_cache = None
+    if gazetteer is not None:
+        fast_cache = ResultCache(result_identity(model, gazetteer, fast=True), path=args.cache_db)
+
+    app = make_app(
+        nlp,
+        cache,
+        gazetteer,
+        fast_cache,
+        max_batch=args.max_batch,
+        max_wait=args.max_wait_ms / 1000,
+        max_pending=args.max_pending,
+    )
+    app.listen(args.port, args.address)
+    print(f"listening on {args.address or '*'}:{args.port}")
+    tornado.ioloop.IOLoop.current().start()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,297 +1,332 @@
-import os
 import re
-from copy import deepcopy
 
-import streamlit as st
+from src.document import AnonymizedDocument
+from src.metrics import count, count_entities, record_error, timer
+from src.model import get_pipeline
+from src.ner import TOKEN_BUDGET, predict_entities
+from src.pseudonyms import normalize_entity
 
-from transformers import pipeline
+# placeholder per entity group of the model
+ENTITY_PLACEHOLDERS = {"PER": "PERSON", "LOC": "LOCATION", "ORG": "ORG"}
 
+# text in front of an entity that is replaced with it, e.g. "Frau " or "50667 "
+ENTITY_PREFIXES = {
+    "PERSON": re.compile(
+        r"(?:^|(?<=\s))(?:Herrn|Herr|Frau|Doktor|Familie|Hr\.|Fr\.|Dr\.|[A-Z]\.)[\s]*$"
+    ),
+    "LOCATION": re.compile(r"(?:^|(?<=\s))[0-9]{4,5}[\s\,\.][\.]*$"),
+}
 
-def concat_elements(tag, spacer, text, counter):
-    searchpattern = tag + "_([0-9]{1,2})(" + spacer + ")" + tag + "_([0-9]{1,2})"
-    check_wrong = re.search(searchpattern, text)
-    if check_wrong:
-        old_first = f"{tag}_{check_wrong[1]}"
-        old_second = f"{tag}_{check_wrong[3]}"
+WORD_TAIL = re.compile(r"\w*")
 
-        text = text.replace(check_wrong[0], old_first)
 
-        check_wrong = re.search(old_second, text)
-        if not check_wrong:
-            counter -= 1
+def expand_entity(text, start, end, placeholder, replace_address=True):
+    """
+    widen an entity to whole words, including terms of address and postal codes
+    """
 
-    return text, counter
+    while start and WORD_TAIL.match(text, start - 1).end() > start - 1:
+        start -= 1
+    end = WORD_TAIL.match(text, end).end()
 
+    prefix = ENTITY_PREFIXES.get(placeholder)
+    if prefix and (placeholder != "PERSON" or replace_address):
+        match = prefix.search(text, max(0, start - 30), start)
+        if match:
+            start = match.start()
 
-def clean_entities(text: str, pipeline, entities: list, replace_address: bool = True, mapping={}):
+    return start, end
 
-    found = [
-        e for e in pipeline(text) if e.get("entity_group") in entities and len(e.get("word")) > 1
-    ]
-    mapping = {}
 
-    if not found:
-        return text, mapping
+def find_entity_spans(text: str, found: list, entities: list, replace_address: bool = True):
+    """
+    build sorted, disjoint (start, end, placeholder, key) spans from the character offsets
+    of the model entities. further occurrences of the same words are replaced as well.
+    key is the normalized word the model found, without the terms of address, postal
+    codes and word tails expand_entity adds - "Dr. Müller" and "Müllers" are one person
+    """
 
-    count_per = 0
-    count_loc = 0
-    count_org = 0
+    found = [e for e in found if e.get("entity_group") in entities and len(e.get("word")) > 1]
 
+    spans = []
+    words = {}
     for each in found:
+        placeholder = ENTITY_PLACEHOLDERS[each.get("entity_group")]
+        start, end = each.get("start"), each.get("end")
 
-        word = each.get("word")
-        if not word in mapping.values():
-
-            if each.get("entity_group") == "PER":
-                count_per += 1
-                name = f"PERSON_{count_per}"
+        words.setdefault(text[start:end], placeholder)
+        spans.append(
+            expand_entity(text, start, end, placeholder, replace_address)
+            + (placeholder, normalize_entity(placeholder, text[start:end]))
+        )
 
-                if replace_address:
-                    matches = re.findall(
-                        rf"(?:^|\s)(((?:Herrn|Herr|Frau|Doktor|Familie|Hr\.|Fr\.|Dr\.|[A-Z]\.)[\s]*)?{word}[\w]*)",
-                        text,
-                    )
+    if not spans:
+        return spans
 
-                    for person_match in matches:
-                        text = text.replace(person_match[0], name)
-                        mapping.update({name: person_match[0]})
+    # occurrences the model did not tag, e.g. a second mention of a name
+    pattern = re.compile(
+        r"(?<!\w)(?:" + "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)) + ")"
+    )
+    for match in pattern.finditer(text):
+        placeholder = words[match[0]]
+        spans.append(
+            expand_entity(text, match.start(), match.end(), placeholder, replace_address)
+            + (placeholder, normalize_entity(placeholder, match[0]))
+        )
 
-                else:
-                    matches = re.findall(rf"({word}[\w]*)", text)
+    return merge_entity_spans(text, spans)
 
-                    for person_match in matches:
-                        text = text.replace(person_match, name)
-                        mapping.update({name: person_match})
 
-                # Concat multi word names: PERSON_1 PERSON_2 -> PERSON_1
-                text, count_per = concat_elements("PERSON", "\s+|[a-z]+", text, count_per)
+def merge_entity_spans(text, spans):
+    """
+    sort spans, drop overlaps and join neighbouring spans of the same type -
+    multi word names like "Henriette Reker" become one PERSON, their keys are joined
+    """
 
-            elif each.get("entity_group") == "LOC":
+    merged = []
+    for start, end, placeholder, key in sorted(spans):
+        if merged:
+            last_start, last_end, last_placeholder, last_key = merged[-1]
+            gap = text[last_end:start]
 
-                count_loc += 1
-                name = f"LOCATION_{count_loc}"
-                matches = re.findall(
-                    rf"(?:^|\s)(((?:[0-9][0-9][0-9][0-9][0-9]|[0-9][0-9][0-9][0-9])[\s\,\.][\.]*)?{word}[\w]*)",
-                    text,
-                )
+            if placeholder == last_placeholder and (
+                start <= last_end or (placeholder == "PERSON" and gap.isspace())
+            ):
+                if key not in last_key:
+                    last_key = key if last_key in key else f"{last_key} {key}"
+                merged[-1] = (last_start, max(end, last_end), placeholder, last_key)
+                continue
 
-                for location_match in matches:
-                    text = text.replace(location_match[0], name)
-                    mapping.update({name: location_match[0]})
+            if start < last_end:
+                continue
 
-                # correcting some locations
-                text, count_loc = concat_elements("LOCATION", "[a-z]+", text, count_loc)
+        merged.append((start, end, placeholder, key))
 
-            elif each.get("entity_group") == "ORG":
-                count_org += 1
-                name = f"ORG_{count_org}"
+    return merged
 
-                matches = re.findall(rf"({word}[\w]*)", text)
-                for org_match in matches:
-                    text = text.replace(org_match, name)
-                    mapping.update({name: org_match})
 
-                text, count_org = concat_elements("ORG", "[a-z]+", text, count_org)
+# rule-based entities in order of priority - the entity itself is the named group
+REGEX_RULES = [
+    (
+        "DATE",
+        re.compile(r"(?P<DATE>[0-3]?[0-9]{1,4}[._%+-/][0-3]?[0-9]{1,4}([._%+-/])[0-3]?[0-9]{1,4})"),
+    ),
+    (
+        "PHONE",
+        re.compile(
+            r"(?:^|[^\d])(?P<PHONE>(?:\+|0)[0-9]{2,6}(\-|\s|\/|\_|\:)?[0-9]{2,9}(\-|\s|\/|\_|\:)?[0-9]{2,14})"
+        ),
+    ),
+    ("NUMBER", re.compile(r"(?P<NUMBER>[0-9]{2}[0-9-\.\s\/\-\/\_\:]{3,}[0-9]{2})")),
+    ("EMAIL", re.compile(r"(?P<EMAIL>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9._%+-]+(\.[a-zA-Z]{2,})?)")),
+]
 
-    return text, mapping
 
+def find_regex_spans(text, entities):
+    """
+    find rule-based entities in order of REGEX_RULES - every rule scans the text once,
+    skipping what rules with higher priority already matched.
+    returns sorted list of (start, end, placeholder)
+    """
+    spans = []
 
-def clean_regex_helper(text, pattern, placeholder, show_length=False, mapping={}):
+    for placeholder, pattern in REGEX_RULES:
+        if placeholder not in entities:
+            continue
 
-    mapping = {}
+        found = []
+        gap_start = 0
+        with timer("regex", rule=placeholder):
+            for start, end, _ in spans + [(len(text), len(text), None)]:
+                for match in pattern.finditer(text, gap_start, start):
+                    match_start, match_end = match.span(placeholder)
 
-    matches = re.findall(pattern, text)
-    matches = [m if isinstance(m, str) else m[0] for m in matches]
+                    if placeholder == "DATE" and not 5 < match_end - match_start < 11:
+                        continue
 
-    if placeholder == "DATE":
-        matches = [m for m in matches if 5 < len(m) < 11]
+                    found.append((match_start, match_end, placeholder))
+                gap_start = end
 
-    if not matches:
-        return text, mapping
+        spans = sorted(spans + found)
 
-    count_no = 0
+    return spans
 
-    for match in matches:
 
-        if not match in mapping.values():
-            count_no += 1
-            placeholder_num = placeholder + "_"
+def merge_spans(spans, other):
+    """
+    add the sorted spans of other to spans, dropping those that overlap a span of spans
+    """
 
-            placeholder_num += str(count_no)
-            if show_length:
-                placeholder_num += "_" + str(len(match))
+    merged = list(spans)
+    position = 0
+    for span in other:
+        start, end = span[:2]
+        while position < len(spans) and spans[position][1] <= start:
+            position += 1
+        if position < len(spans) and spans[position][0] < end:
+            continue
+        merged.append(span)
 
-            text = text.replace(match, placeholder_num)
-            mapping[placeholder_num] = match
+    return sorted(merged)
 
-    return text, mapping
 
+# placeholders in serialized text, e.g. PERSON_12 or NUMBER_3_9
+PLACEHOLDER_PATTERN = re.compile(
+    r"(?:PERSON|LOCATION|ORG|EMAIL|PHONE|DATE)_[0-9]+|NUMBER_[0-9]+_[0-9]+"
+)
 
-def regex_clean_email(text, mapping={}):
-    return clean_regex_helper(
-        text, r"([a-zA-Z0-9._%+-]+@[a-zA-Z0-9._%+-]+(\.[a-zA-Z]{2,})?)", "EMAIL", mapping
-    )
 
+def remove_context(document):
+    """
+    remove context preserving entities and make everyting into XXX -
+    accepts an AnonymizedDocument or already serialized text
+    """
 
-def regex_clean_phone(text, mapping={}):
-    return clean_regex_helper(
-        text,
-        r"(?:^|[^\d])((?:\+|0)[0-9]{2,6}(\-|\s|\/|\_|\:)?[0-9]{2,9}(\-|\s|\/|\_|\:)?[0-9]{2,14})",
-        "PHONE",
-        mapping,
-    )
+    with timer("remove_context"):
+        if isinstance(document, AnonymizedDocument):
+            return document.to_text(context=False)
 
+        return PLACEHOLDER_PATTERN.sub("XXX", document)
 
-def regex_clean_date(text, mapping={}):
-    return clean_regex_helper(
-        text,
-        r"([0-3]?[0-9]{1,4}[._%+-/][0-3]?[0-9]{1,4}([._%+-/])[0-3]?[0-9]{1,4})",
-        "DATE",
-        mapping,
-    )
 
+def anonymize_regex(input_text, entities):
+    """
+    anonymize rule-based entities only
+    """
 
-def regex_clean_number(text, mapping={}, count: bool = True):
-    return clean_regex_helper(
-        text, r"([0-9]{2}[0-9-\.\s\/\-\/\_\:]{3,}[0-9]{2})", "NUMBER", count, mapping
-    )
+    return AnonymizedDocument.from_spans(input_text, find_regex_spans(input_text, entities))
 
 
-@st.cache(allow_output_mutation=True)
-def init_pipeline(model_name):
+def detect_entities(texts, nlp=None, gazetteer=None, fast=False, token_budget=TOKEN_BUDGET):
     """
-    Load model and return pipeline
+    entities of the model for every text plus the known terms of the gazetteer -
+    in fast mode only the terms of the gazetteer, without running the model
     """
-    print(f"loading model: {model_name}")
-    nlp = pipeline("ner", model=model_name, grouped_entities=True)
-    return nlp
 
+    if fast:
+        found = [[] for _ in texts]
+    else:
+        found = predict_entities(nlp or get_pipeline(), texts, token_budget=token_budget)
+
+    if gazetteer is not None:
+        with timer("gazetteer"):
+            for text, entities in zip(texts, found):
+                entities.extend(gazetteer.find(text))
+
+    return found
 
-def remove_context(text):
-    """
-    remove entities
-    """
 
-    re1 = "PERSON_[0-9]{1,2}"
-    re2 = "LOCATION_[0-9]{1,2}"
-    re3 = "ORG_[0-9]{1,2}"
-    re4 = "EMAIL_[0-9]{1,2}"
-    re5 = "PHONE_[0-9]{1,2}"
-    re6 = "DATE_[0-9]{1,2}"
-    re7 = "NUMBER_[0-9]{1,2}"
-    re8 = "XXX_[0-9]{1,2}"
-
-    re_list = [re1, re2, re3, re4, re5, re6, re7]
-    generic_re = re.compile("|".join(re_list))
-
-    matches = re.findall(generic_re, text)
-    for m in matches:
-        text = text.replace(m, "XXX")
-
-    # number check again
-    matches = re.findall(re8, text)
-    for m in matches:
-        text = text.replace(m, "XXX")
-
-    return text
-
-
-def anonymize_regex(input_text, input_mapping, entities):
-    """requires mapping - minimum requirement: mapping ={}"""
-    cleaned_text = input_text
-    mapping = input_mapping
-
-    if "DATE" in entities:
-        cleaned_text, date_mapping = regex_clean_date(cleaned_text)
-        mapping.update(date_mapping)
-    if "PHONE" in entities:
-        cleaned_text, phone_mapping = regex_clean_phone(cleaned_text)
-        mapping.update(phone_mapping)
-    if "NUMBER" in entities:
-        cleaned_text, num_mapping = regex_clean_number(cleaned_text, True)
-        mapping.update(num_mapping)
-    if "EMAIL" in entities:
-        cleaned_text, mail_mapping = regex_clean_email(cleaned_text)
-        mapping.update(mail_mapping)
-
-    return cleaned_text, mapping
-
-model_used = "/app/models/xlm-roberta-large-finetuned-conll03-german/" if os.getenv("DEPLOYMENT") else "xlm-roberta-large-finetuned-conll03-german"
 def anonymize_with_model(
-    input_text,
-    input_mapping,
-    entities,
-    replace_address,
-    nlp=init_pipeline(
-        model_used
-    ),
+    input_text, entities, replace_address, nlp=None, gazetteer=None, fast=False
 ):
-    """requires mapping - minimum requirement: mapping ={}"""
-    cleaned_text = input_text
-    mapping = input_mapping
+    """
+    anonymize model-based entities only
+    """
 
+    spans = []
     if any([e in ["PER", "LOC", "ORG"] for e in entities]):
+        found = detect_entities([input_text], nlp, gazetteer, fast)[0]
+        with timer("postprocess"):
+            spans = find_entity_spans(input_text, found, entities, replace_address)
 
-        cleaned_text, ent_mappings = clean_entities(
-            text=input_text, pipeline=nlp, entities=entities, replace_address=replace_address
-        )
-        mapping.update(ent_mappings)
+    return AnonymizedDocument.from_spans(input_text, spans)
 
-    return cleaned_text, mapping
 
+def anon_pipeline(text, entities, keep_adresses, nlp=None, cache=None, gazetteer=None, fast=False):
+    """
+    anonymize text - with a gazetteer its terms are found in addition to the model,
+    in fast mode instead of the model
+    """
 
-def anon_pipeline(text, entities, keep_adresses):
+    if cache is not None:
+        document = cache.get(text, entities, keep_adresses)
+        if document is not None:
+            return document
 
-    mapping = {}
+    count("texts")
+    count("chars", len(text))
 
     try:
-        cleaned_text = deepcopy(text)
-
         # run regex rules #####
-        cleaned_text, mapping = anonymize_regex(
-            input_text=cleaned_text, input_mapping=mapping, entities=entities
-        )
+        spans = find_regex_spans(text, entities)
 
         # run model-based rules #####
         if any([e in ["PER", "LOC", "ORG"] for e in entities]):
-            cleaned_text, mapping = anonymize_with_model(
-                input_text=cleaned_text,
-                input_mapping=mapping,
-                entities=entities,
-                replace_address=not keep_adresses,
-            )
+            found = detect_entities([text], nlp, gazetteer, fast)[0]
+            with timer("postprocess"):
+                spans = merge_spans(
+                    spans, find_entity_spans(text, found, entities, not keep_adresses)
+                )
+
+        document = AnonymizedDocument.from_spans(text, spans)
+        count_entities(document)
 
     except Exception as e:
-        print(e)
-        cleaned_text = "error occured"
+        record_error("pipeline", e)
+        document = AnonymizedDocument("error occured")
+
+    if cache is not None:
+        cache.put(text, entities, keep_adresses, document)
 
-    return cleaned_text, mapping
+    return document
 
 
-def remove_context(text):
+def anon_pipeline_batch(
+    texts,
+    entities,
+    keep_adresses,
+    token_budget=TOKEN_BUDGET,
+    nlp=None,
+    gazetteer=None,
+    fast=False,
+):
     """
-    remove context preserving entities and make everyting into XXXXX
+    anonymize a list (or pandas Series) of texts - regex rules run per text, the model
+    runs on length-bucketed batches of at most token_budget tokens.
+    returns an AnonymizedDocument for every text in input order
     """
 
-    re1 = "PERSON_[0-9]{1,2}"
-    re2 = "LOCATION_[0-9]{1,2}"
-    re3 = "ORG_[0-9]{1,2}"
-    re4 = "EMAIL_[0-9]{1,2}"
-    re5 = "PHONE_[0-9]{1,2}"
-    re6 = "DATE_[0-9]{1,2}"
-    re7 = "NUMBER_[0-9]{1,2}"
-    re8 = "XXX_[0-9]{1,2}"
+    texts = list(texts)
+
+    results = [AnonymizedDocument("error occured") for _ in texts]
+    count("texts", len(texts))
+    count("chars", sum(len(text) for text in texts))
 
-    re_list = [re1, re2, re3, re4, re5, re6, re7]
-    generic_re = re.compile("|".join(re_list))
+    # run regex rules #####
+    regex_spans = {}
+    for index, text in enumerate(texts):
+        try:
+            regex_spans[index] = find_regex_spans(text, entities)
+        except Exception as e:
+            record_error("regex", e)
 
-    matches = re.findall(generic_re, text)
-    for m in matches:
-        text = text.replace(m, "XXX")
+    if not any([e in ["PER", "LOC", "ORG"] for e in entities]):
+        for index, spans in regex_spans.items():
+            results[index] = AnonymizedDocument.from_spans(texts[index], spans)
+            count_entities(results[index])
+        return results
 
-    # number check again
-    matches = re.findall(re8, text)
-    for m in matches:
-        text = text.replace(m, "XXX")
+    # run model-based rules #####
+    indices = list(regex_spans)
+    try:
+        found = detect_entities(
+            [texts[index] for index in indices], nlp, gazetteer, fast, token_budget
+        )
+    except Exception as e:
+        record_error("model", e)
+        return results
+
+    for index, found_entities in zip(indices, found):
+        try:
+            text = texts[index]
+            with timer("postprocess"):
+                spans = merge_spans(
+                    regex_spans[index],
+                    find_entity_spans(text, found_entities, entities, not keep_adresses),
+                )
+                results[index] = AnonymizedDocument.from_spans(text, spans)
+            count_entities(results[index])
+        except Exception as e:
+            record_error("postprocess", e)
 
-    return text
+    return results
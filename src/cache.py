@@ -0,0 +1,177 @@
+import hashlib
+import json
+import sqlite3
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from src.document import AnonymizedDocument
+from src.metrics import count
+
+# sqlite limits the number of parameters of a query
+SQLITE_BATCH = 500
+
+
+def result_identity(model, gazetteer=None, fast=False):
+    """
+    identifies what produced the entities - the model, the gazetteer or both
+    """
+    identity = "fast" if fast else model
+    if gazetteer is not None:
+        identity += f"+gazetteer:{gazetteer.identity}"
+    return identity
+
+
+def cached_runner(runner, cache):
+    """
+    runner (anon_pipeline_batch, anon_pipeline_parallel or anon_pipeline_staged) that
+    takes the results it can from cache and runs only the missing texts, whose
+    results are stored. Without a cache the runner itself
+    """
+    if cache is None:
+        return runner
+
+    def run(texts, entities, keep_adresses, **options):
+        texts = list(texts)
+        results = cache.get_many(texts, entities, keep_adresses)
+        missing = [index for index, document in enumerate(results) if document is None]
+        if not missing:
+            return results
+
+        documents = runner([texts[index] for index in missing], entities, keep_adresses, **options)
+        cache.put_many(
+            [(texts[index], document) for index, document in zip(missing, documents)],
+            entities,
+            keep_adresses,
+        )
+
+        for index, document in zip(missing, documents):
+            results[index] = document
+        return results
+
+    return run
+
+
+class ResultCache:
+    """
+    anon_pipeline results by content hash of text, entity selection, keep_adresses and
+    model. Recent results are kept in a bounded in-memory LRU, all results optionally
+    in a sqlite file that survives restarts. Options applied to the output, like
+    removing context, are not part of the key
+    """
+
+    def __init__(self, model, max_size=100000, path=None):
+        self.model = model
+        self.max_size = max_size
+        self.path = path
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        self._db = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, spans TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, text, entities, keep_adresses):
+        payload = json.dumps(
+            [text, sorted(entities), bool(keep_adresses), self.model], ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _remember(self, key, spans):
+        self._memory[key] = spans
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def get_many(self, texts, entities, keep_adresses):
+        """
+        cached documents for texts, None where there is no result yet
+        """
+        keys = [self.key(text, entities, keep_adresses) for text in texts]
+        found = {}
+        lookups = Counter()
+
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    lookups["memory"] += 1
+
+            missing = list({key for key in keys if key not in found})
+            if self._db is not None and missing:
+                for start in range(0, len(missing), SQLITE_BATCH):
+                    batch = missing[start : start + SQLITE_BATCH]
+                    parameters = ",".join("?" * len(batch))
+                    rows = self._db.execute(
+                        f"SELECT key, spans FROM results WHERE key IN ({parameters})", batch
+                    )
+                    for key, spans in rows:
+                        found[key] = json.loads(spans)
+                        self._remember(key, found[key])
+
+            counts = Counter(keys)
+            for key in missing:
+                lookups["disk" if key in found else "miss"] += counts[key]
+
+            self.hits["memory"] += lookups["memory"]
+            self.hits["disk"] += lookups["disk"]
+            self.misses += lookups["miss"]
+
+        for result, value in lookups.items():
+            count("cache", value, result=result)
+
+        return [
+            AnonymizedDocument.from_dict({"source": text, "spans": found[key]})
+            if key in found
+            else None
+            for text, key in zip(texts, keys)
+        ]
+
+    def get(self, text, entities, keep_adresses):
+        return self.get_many([text], entities, keep_adresses)[0]
+
+    def put_many(self, documents, entities, keep_adresses):
+        """
+        store documents - failed runs are not cached, their source is the error message
+        """
+        rows = []
+        for text, document in documents:
+            if document.source != text:
+                continue
+            rows.append((self.key(text, entities, keep_adresses), document.to_dict()["spans"]))
+
+        with self._lock:
+            for key, spans in rows:
+                self._remember(key, spans)
+
+            if self._db is not None and rows:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO results VALUES (?, ?)",
+                        [(key, json.dumps(spans)) for key, spans in rows],
+                    )
+
+    def put(self, text, entities, keep_adresses, document):
+        self.put_many([(text, document)], entities, keep_adresses)
+
+    def stats(self):
+        lookups = sum(self.hits.values()) + self.misses
+        return {
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "hit_rate": sum(self.hits.values()) / lookups if lookups else None,
+            "memory_entries": len(self._memory),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,217 @@
+from collections import Counter
+from threading import Lock
+
+from src.metrics import count
+from src.model import BACKEND, MODEL_NAME, get_pipeline, model_identity
+from src.ner import (
+    TOKEN_BUDGET,
+    WINDOW_OVERLAP,
+    decode_windows,
+    predict_entities,
+    predict_windows,
+    tokenize_windows,
+)
+
+# probability of the predicted label below which a token counts as uncertain
+MIN_CONFIDENCE = 0.9
+
+
+def entity_keys(found):
+    return {(entity["start"], entity["end"], entity["entity_group"]) for entity in found}
+
+
+def text_confidences(texts, offsets, text_ids, predictions):
+    """lowest probability of a predicted label per text, 1.0 for texts without tokens"""
+    confidences = [1.0] * len(texts)
+    for window, (probs, _) in enumerate(predictions):
+        content = [prob for prob, (start, end) in zip(probs, offsets[window]) if start != end]
+        if content:
+            confidences[text_ids[window]] = min(confidences[text_ids[window]], min(content))
+    return confidences
+
+
+class Cascade:
+    """
+    Small model first, the large model only for the texts the small model is not
+    sure about - a token predicted with less than min_confidence or, with
+    escalate_entities, any entity found. Texts the small model is sure to hold no
+    entity never reach the large model. Every audit_every-th of the other texts
+    runs on the large model as well, to measure how often the small model alone
+    would be wrong. Pass it as nlp: predict_entities runs the cascade
+    """
+
+    def __init__(
+        self,
+        small,
+        large,
+        min_confidence=MIN_CONFIDENCE,
+        escalate_entities=True,
+        audit_every=0,
+        identity=None,
+    ):
+        self.small = small
+        self.large = large
+        self.min_confidence = min_confidence
+        self.escalate_entities = escalate_entities
+        self.audit_every = audit_every
+        self.identity = identity
+        self.stats = Counter()
+        self._lock = Lock()
+
+    def predict_entities(self, texts, token_budget=TOKEN_BUDGET, overlap=WINDOW_OVERLAP):
+        """entities of every text, as predict_entities of one model"""
+        texts = list(texts)
+        if not texts:
+            return []
+
+        input_ids, offsets, text_ids = tokenize_windows(self.small.tokenizer, texts, overlap)
+        predictions = predict_windows(
+            self.small.model, self.small.tokenizer, input_ids, token_budget
+        )
+        found = decode_windows(
+            texts, offsets, text_ids, predictions, self.small.model.config.id2label
+        )
+        confidences = text_confidences(texts, offsets, text_ids, predictions)
+
+        reasons = {}
+        audited = []
+        with self._lock:
+            for index, confidence in enumerate(confidences):
+                if confidence < self.min_confidence:
+                    reasons[index] = "low_confidence"
+                elif self.escalate_entities and found[index]:
+                    reasons[index] = "entities"
+                else:
+                    self.stats["small_only"] += 1
+                    if self.audit_every and self.stats["small_only"] % self.audit_every == 0:
+                        audited.append(index)
+
+        run = list(reasons) + audited
+        large_found = predict_entities(self.large, [texts[index] for index in run], token_budget)
+
+        stats = Counter(texts=len(texts))
+        for index, entities in zip(run, large_found):
+            kind = "escalated" if index in reasons else "audited"
+            small_keys, large_keys = entity_keys(found[index]), entity_keys(entities)
+
+            stats[kind] += 1
+            stats[f"{kind}_agree"] += small_keys == large_keys
+            stats[f"{kind}_small_spans"] += len(small_keys)
+            stats[f"{kind}_large_spans"] += len(large_keys)
+            stats[f"{kind}_matched_spans"] += len(small_keys & large_keys)
+            if index in reasons:
+                stats[f"escalated_{reasons[index]}"] += 1
+                found[index] = entities
+
+        with self._lock:
+            self.stats.update(stats)
+
+        count("cascade_texts", len(texts) - len(reasons), model="small")
+        count("cascade_texts", len(reasons), model="large")
+        for reason, value in Counter(reasons.values()).items():
+            count("cascade_escalated", value, reason=reason)
+        for kind in ["escalated", "audited"]:
+            count("cascade_agreement", stats[f"{kind}_agree"], kind=kind, result="agree")
+            count(
+                "cascade_agreement",
+                stats[kind] - stats[f"{kind}_agree"],
+                kind=kind,
+                result="disagree",
+            )
+
+        return found
+
+    def report(self):
+        """
+        escalation rate and, for the texts run on both models, how often the small
+        model found exactly the entities of the large one and its span precision
+        and recall against the large model
+        """
+        with self._lock:
+            stats = Counter(self.stats)
+
+        def ratio(part, whole):
+            return part / whole if whole else None
+
+        report = {
+            "texts": stats["texts"],
+            "escalation_rate": ratio(stats["escalated"], stats["texts"]),
+            "escalated": {
+                reason: stats[f"escalated_{reason}"] for reason in ["low_confidence", "entities"]
+            },
+        }
+        for kind in ["escalated", "audited"]:
+            report[kind + "_agreement"] = {
+                "texts": stats[kind],
+                "same_entities": ratio(stats[f"{kind}_agree"], stats[kind]),
+                "span_precision": ratio(
+                    stats[f"{kind}_matched_spans"], stats[f"{kind}_small_spans"]
+                ),
+                "span_recall": ratio(stats[f"{kind}_matched_spans"], stats[f"{kind}_large_spans"]),
+            }
+        return report
+
+
+def load_cascade(
+    small_name,
+    large_name=MODEL_NAME,
+    backend=BACKEND,
+    min_confidence=MIN_CONFIDENCE,
+    escalate_entities=True,
+    audit_every=0,
+):
+    """
+    Cascade of two pipelines loaded with get_pipeline, its identity names both
+    models and the thresholds, e.g. for the result cache
+    """
+    identity = (
+        f"cascade({model_identity(small_name, backend)}>{model_identity(large_name, backend)}"
+        f",{min_confidence},{'entities' if escalate_entities else 'confidence'})"
+    )
+    return Cascade(
+        get_pipeline(small_name, backend),
+        get_pipeline(large_name, backend),
+        min_confidence,
+        escalate_entities,
+        audit_every,
+        identity,
+    )
+
+
+def add_cascade_arguments(parser):
+    """options of the cascade for the command line and the server"""
+    parser.add_argument(
+        "--cascade",
+        metavar="SMALL_MODEL",
+        help="run this small model first and the large model only for uncertain texts",
+    )
+    parser.add_argument(
+        "--cascade-confidence",
+        type=float,
+        default=MIN_CONFIDENCE,
+        help="texts with a token predicted below this probability go to the large model",
+    )
+    parser.add_argument(
+        "--cascade-trust-entities",
+        action="store_true",
+        help="keep the entities of the small model when it is confident, "
+        "instead of checking every text with entities on the large model",
+    )
+    parser.add_argument(
+        "--cascade-audit",
+        type=int,
+        default=0,
+        metavar="N",
+        help="also run every N-th text of the small model on the large one, for agreement stats",
+    )
+
+
+def cascade_from_args(args):
+    return load_cascade(
+        args.cascade,
+        args.model,
+        args.backend,
+        min_confidence=args.cascade_confidence,
+        escalate_entities=not args.cascade_trust_entities,
+        audit_every=args.cascade_audit,
+    )
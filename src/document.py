@@ -0,0 +1,130 @@
+from operator import attrgetter
+
+# placeholders that carry the length of the replaced text, e.g. NUMBER_1_9
+SHOW_LENGTH = {"NUMBER"}
+
+# replacement for every entity if context is removed
+NO_CONTEXT = "XXX"
+
+
+class Span:
+    """
+    entity found in the source text, serialized as placeholder e.g. PERSON_1 - key
+    identifies the entity if it is not the text, e.g. "müller" for "Müllers"
+    """
+
+    __slots__ = ("label", "text", "index", "start", "end", "key")
+
+    def __init__(self, label, text, index, start, end, key=None):
+        self.label = label
+        self.text = text
+        self.index = index
+        self.start = start
+        self.end = end
+        self.key = key
+
+    @property
+    def placeholder(self):
+        name = f"{self.label}_{self.index}"
+        if self.label in SHOW_LENGTH:
+            name += f"_{len(self.text)}"
+        return name
+
+    def __repr__(self):
+        return f"Span({self.placeholder}, {self.text!r}, {self.start}:{self.end})"
+
+
+class AnonymizedDocument:
+    """
+    source text with the sorted, disjoint spans of all found entities
+    """
+
+    __slots__ = ("source", "spans")
+
+    def __init__(self, source, spans=()):
+        self.source = source
+        self.spans = list(spans)
+
+    @classmethod
+    def from_spans(cls, source, spans):
+        """
+        build a document from sorted (start, end, label) or (start, end, label, key)
+        tuples - spans of the same type share the output index if their key, by default
+        their text, is equal
+        """
+        indices = {}
+        counts = {}
+        document = cls(source)
+
+        for start, end, label, *key in spans:
+            text = source[start:end]
+            key = key[0] if key else None
+
+            index = indices.get((label, key or text))
+            if index is None:
+                index = counts[label] = counts.get(label, 0) + 1
+                indices[(label, key or text)] = index
+
+            document.spans.append(Span(label, text, index, start, end, key))
+
+        return document
+
+    def segments(self):
+        """
+        yield the text between entities as str and the entities as Span
+        """
+        last = 0
+        for span in self.spans:
+            if span.start > last:
+                yield self.source[last : span.start]
+            yield span
+            last = span.end
+
+        if last < len(self.source):
+            yield self.source[last:]
+
+    def to_text(self, context=True):
+        """
+        serialize to text with placeholders, or with XXX if context is removed
+        """
+        placeholder = attrgetter("placeholder") if context else lambda span: NO_CONTEXT
+        return "".join(
+            segment if isinstance(segment, str) else placeholder(segment)
+            for segment in self.segments()
+        )
+
+    @property
+    def text(self):
+        return self.to_text()
+
+    def to_dict(self):
+        """
+        compact, json-serializable form - the span texts are taken from the source
+        """
+        return {
+            "source": self.source,
+            "spans": [
+                [span.label, span.index, span.start, span.end]
+                + ([span.key] if span.key is not None else [])
+                for span in self.spans
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        source = data["source"]
+        return cls(
+            source,
+            (
+                Span(label, source[start:end], index, start, end, *key)
+                for label, index, start, end, *key in data["spans"]
+            ),
+        )
+
+    @property
+    def mapping(self):
+        """placeholder -> original text"""
+        return {span.placeholder: span.text for span in self.spans}
+
+    def __repr__(self):
+        return f"AnonymizedDocument({self.text!r})"
@@ -0,0 +1,373 @@
+import queue
+import threading
+import time
+
+from src import metrics
+from src.anon import (
+    ENTITY_PLACEHOLDERS,
+    anon_pipeline_batch,
+    find_entity_spans,
+    find_regex_spans,
+    merge_spans,
+)
+from src.document import AnonymizedDocument
+from src.metrics import count, count_entities, record_error, timer
+from src.model import get_pipeline
+from src.ner import (
+    TOKEN_BUDGET,
+    WINDOW_OVERLAP,
+    decode_windows,
+    predict_windows,
+    tokenize_windows,
+)
+
+# seconds a blocked worker waits before it checks whether the run was stopped
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class Stage:
+    """
+    function applied to every item, on `workers` threads - stages that hold the GIL
+    gain little from more than one
+    """
+
+    def __init__(self, name, function, workers=1):
+        self.name = name
+        self.function = function
+        self.workers = workers
+
+
+class StageFailed:
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+class StageStats:
+    """
+    busy, starved (waiting for input) and blocked (waiting for room in the next
+    queue) seconds per stage, summed over runs. The stage with the highest
+    utilization is the bottleneck, the others wait for it
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.wall = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, name, workers, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self._lock:
+            entry = self.stages.setdefault(
+                name, {"workers": workers, "items": 0, "busy": 0.0, "starved": 0.0, "blocked": 0.0}
+            )
+            entry["items"] += items
+            entry["busy"] += busy
+            entry["starved"] += starved
+            entry["blocked"] += blocked
+
+    def add_wall(self, seconds):
+        with self._lock:
+            self.wall += seconds
+
+    def utilization(self):
+        """one row per stage in pipeline order"""
+        with self._lock:
+            stages = list(self.stages.items())
+            wall = self.wall or 1.0
+
+        return [
+            {
+                "stage": name,
+                "workers": entry["workers"],
+                "items": entry["items"],
+                "busy_seconds": entry["busy"],
+                "utilization": entry["busy"] / (wall * entry["workers"]),
+                "starved": entry["starved"] / (wall * entry["workers"]),
+                "blocked": entry["blocked"] / (wall * entry["workers"]),
+            }
+            for name, entry in stages
+        ]
+
+    def format(self):
+        lines = [
+            f"{'stage':<10} {'workers':>7} {'items':>7} {'busy':>6} {'starved':>8} {'blocked':>8}"
+        ]
+        for row in self.utilization():
+            lines.append(
+                f"{row['stage']:<10} {row['workers']:>7} {row['items']:>7} "
+                f"{row['utilization']:>6.0%} {row['starved']:>8.0%} {row['blocked']:>8.0%}"
+            )
+        return "\n".join(lines)
+
+
+def _put(target, item, stop):
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(source, stop):
+    while not stop.is_set():
+        try:
+            return source.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+class StagedExecutor:
+    """
+    Run items through stages connected by bounded queues, every stage on its own
+    threads - e.g. regex and decoding in Python while the model computes the next
+    batch. A full queue blocks the stage in front of it, so at most queue_size
+    items wait between two stages whatever the input size. Results are yielded in
+    input order, an exception in a stage stops the run and is raised to the caller
+    """
+
+    def __init__(self, stages, queue_size=4, stats=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = stats
+
+    def run(self, items):
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        stop = threading.Event()
+        # the workers report to the sinks of the calling thread, e.g. of collect()
+        sinks = metrics.local_sinks()
+        totals = [[0.0, 0.0, 0.0, 0] for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+
+        def feed():
+            for item in enumerate(items):
+                if not _put(queues[0], item, stop):
+                    return
+            for _ in range(self.stages[0].workers):
+                _put(queues[0], _DONE, stop)
+
+        def work(number, stage):
+            metrics.set_local_sinks(sinks)
+            source, target = queues[number], queues[number + 1]
+            busy = starved = blocked = 0.0
+            items = 0
+
+            while True:
+                waiting = time.perf_counter()
+                item = _get(source, stop)
+                started = time.perf_counter()
+                starved += started - waiting
+                if item is _DONE:
+                    break
+
+                position, payload = item
+                try:
+                    # failures are passed on to the caller
+                    result = payload
+                    if not isinstance(payload, StageFailed):
+                        result = stage.function(payload)
+                except Exception as e:
+                    result = StageFailed(e)
+                finished = time.perf_counter()
+                busy += finished - started
+                items += 1
+
+                _put(target, (position, result), stop)
+                blocked += time.perf_counter() - finished
+
+            with lock:
+                totals[number][0] += busy
+                totals[number][1] += starved
+                totals[number][2] += blocked
+                totals[number][3] += items
+                remaining[number] -= 1
+                last = remaining[number] == 0
+
+            # the last worker of a stage ends the next one
+            if last:
+                workers = self.stages[number + 1].workers if number + 1 < len(self.stages) else 1
+                for _ in range(workers):
+                    _put(target, _DONE, stop)
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        for number, stage in enumerate(self.stages):
+            threads += [
+                threading.Thread(target=work, args=(number, stage), daemon=True)
+                for _ in range(stage.workers)
+            ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            # results arrive out of order if a stage has several workers
+            pending = {}
+            position = 0
+            while True:
+                item = _get(queues[-1], stop)
+                if item is _DONE:
+                    break
+                pending[item[0]] = item[1]
+                while position in pending:
+                    result = pending.pop(position)
+                    if isinstance(result, StageFailed):
+                        raise result.error
+                    yield result
+                    position += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self._report(totals, time.perf_counter() - started)
+
+    def _report(self, totals, wall):
+        for stage, (busy, starved, blocked, items) in zip(self.stages, totals):
+            count("stage_busy_seconds", busy, stage=stage.name)
+            count("stage_starved_seconds", starved, stage=stage.name)
+            count("stage_blocked_seconds", blocked, stage=stage.name)
+            if self.stats is not None:
+                self.stats.add(stage.name, stage.workers, busy, starved, blocked, items)
+        if self.stats is not None:
+            self.stats.add_wall(wall)
+
+
+class TextBatch:
+    """
+    texts on their way through the stages of anon_pipeline_staged
+    """
+
+    __slots__ = ("texts", "regex_spans", "windows", "predictions", "documents")
+
+    def __init__(self, texts):
+        self.texts = texts
+        self.regex_spans = {}
+        self.windows = None
+        self.predictions = None
+        self.documents = [AnonymizedDocument("error occured") for _ in texts]
+
+
+def anon_pipeline_staged(
+    texts,
+    entities,
+    keep_adresses,
+    token_budget=TOKEN_BUDGET,
+    nlp=None,
+    gazetteer=None,
+    fast=False,
+    batch_size=64,
+    queue_size=4,
+    threads=1,
+    stats=None,
+):
+    """
+    anon_pipeline_batch with the stages regex -> tokenize -> forward -> decode
+    running concurrently on batches of batch_size texts, so the model does not wait
+    for the Python stages. Texts are grouped by length before batching. regex and
+    decode run on `threads` threads each, the forward pass on one thread (torch uses
+    its own threads). Per-stage utilization is added to stats (a StageStats) and
+    counted as stage_*_seconds. Returns an AnonymizedDocument for every text in
+    input order
+    """
+    texts = list(texts)
+
+    # nothing to overlap without the model, a Cascade runs its models itself
+    uses_model = any([e in ENTITY_PLACEHOLDERS for e in entities]) and not fast
+    if not uses_model or not texts or hasattr(nlp, "predict_entities"):
+        return anon_pipeline_batch(
+            texts, entities, keep_adresses, token_budget, nlp, gazetteer=gazetteer, fast=fast
+        )
+
+    nlp = nlp or get_pipeline()
+    count("texts", len(texts))
+    count("chars", sum(len(text) for text in texts))
+
+    def regex(batch):
+        for index, text in enumerate(batch.texts):
+            try:
+                batch.regex_spans[index] = find_regex_spans(text, entities)
+            except Exception as e:
+                record_error("regex", e)
+        return batch
+
+    def tokenize(batch):
+        try:
+            batch.windows = tokenize_windows(
+                nlp.tokenizer, [batch.texts[index] for index in batch.regex_spans], WINDOW_OVERLAP
+            )
+        except Exception as e:
+            record_error("model", e)
+        return batch
+
+    def forward(batch):
+        if batch.windows is not None:
+            try:
+                batch.predictions = predict_windows(
+                    nlp.model, nlp.tokenizer, batch.windows[0], token_budget
+                )
+            except Exception as e:
+                record_error("model", e)
+        return batch
+
+    def decode(batch):
+        if batch.predictions is None:
+            return batch
+
+        indices = list(batch.regex_spans)
+        _, offsets, text_ids = batch.windows
+        found = decode_windows(
+            [batch.texts[index] for index in indices],
+            offsets,
+            text_ids,
+            batch.predictions,
+            nlp.model.config.id2label,
+        )
+
+        for index, found_entities in zip(indices, found):
+            text = batch.texts[index]
+            try:
+                if gazetteer is not None:
+                    with timer("gazetteer"):
+                        found_entities.extend(gazetteer.find(text))
+                with timer("postprocess"):
+                    spans = merge_spans(
+                        batch.regex_spans[index],
+                        find_entity_spans(text, found_entities, entities, not keep_adresses),
+                    )
+                    batch.documents[index] = AnonymizedDocument.from_spans(text, spans)
+                count_entities(batch.documents[index])
+            except Exception as e:
+                record_error("postprocess", e)
+        return batch
+
+    executor = StagedExecutor(
+        [
+            Stage("regex", regex, threads),
+            Stage("tokenize", tokenize),
+            Stage("forward", forward),
+            Stage("decode", decode, threads),
+        ],
+        queue_size=queue_size,
+        stats=stats,
+    )
+
+    # similar lengths in a batch keep padding low, as in anon_pipeline_batch
+    order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+    batches = (
+        TextBatch([texts[index] for index in order[start : start + batch_size]])
+        for start in range(0, len(order), batch_size)
+    )
+
+    results = [None] * len(texts)
+    position = 0
+    for batch in executor.run(batches):
+        for document in batch.documents:
+            results[order[position]] = document
+            position += 1
+    return results
@@ -0,0 +1,165 @@
+import gzip
+import math
+import os
+import tempfile
+
+# mime type per output format
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# supported compressions per format, the first is the default - xlsx is always zipped
+COMPRESSIONS = {
+    "csv": [None, "gzip"],
+    "xlsx": [None],
+    "parquet": ["snappy", "gzip", "zstd", None],
+}
+
+# rows converted at once, bounds the extra memory of writing a file
+EXPORT_CHUNK = 10000
+
+
+class CsvWriter:
+    """
+    csv file written chunk by chunk, optionally gzip-compressed
+    """
+
+    def __init__(self, path, compression=None, sep=",", schema=None):
+        if compression == "gzip":
+            self._file = gzip.open(path, "wt", encoding="utf-8", newline="")
+        else:
+            self._file = open(path, "w", encoding="utf-8", newline="")
+        self.sep = sep
+        self._header = True
+
+    def write(self, frame):
+        frame.to_csv(self._file, sep=self.sep, index=False, header=self._header)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class XlsxWriter:
+    """
+    excel file written row by row with a write-only workbook of openpyxl
+    """
+
+    def __init__(self, path, compression=None, sep=None, schema=None):
+        from openpyxl import Workbook
+
+        self.path = path
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet()
+        self._header = True
+
+    def write(self, frame):
+        if self._header:
+            self._sheet.append([str(column) for column in frame.columns])
+            self._header = False
+
+        for row in frame.itertuples(index=False):
+            self._sheet.append(
+                [None if isinstance(value, float) and math.isnan(value) else value for value in row]
+            )
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+class ParquetWriter:
+    """
+    parquet file with one row group per chunk - the schema is taken from the first
+    chunk, columns that are empty there are stored as text. Pass the schema of the
+    input (see arrow_schema) to keep the types of its columns, their type may not
+    follow from the first chunk
+    """
+
+    def __init__(self, path, compression="snappy", sep=None, schema=None):
+        self.path = path
+        self.compression = compression or "none"
+        self.source_schema = schema
+        self._writer = None
+        self._schema = None
+
+    def write(self, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(frame, preserve_index=False)
+            source = self.source_schema
+            for i, field in enumerate(schema):
+                if source is not None and field.name in source.names:
+                    schema = schema.set(i, source.field(field.name))
+                elif pa.types.is_null(field.type):
+                    schema = schema.set(i, pa.field(field.name, pa.string()))
+            self._schema = schema
+            self._writer = pq.ParquetWriter(self.path, schema, compression=self.compression)
+
+        table = pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+WRITERS = {"csv": CsvWriter, "xlsx": XlsxWriter, "parquet": ParquetWriter}
+
+
+def open_writer(path, fmt, compression=None, sep=",", schema=None):
+    """
+    writer with write(frame) and close() for the format - schema is the arrow schema
+    of the input, used by parquet
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown format {fmt!r}, choose one of {', '.join(WRITERS)}")
+    if compression not in COMPRESSIONS[fmt]:
+        raise ValueError(f"{fmt} does not support compression {compression!r}")
+    return WRITERS[fmt](path, compression, sep, schema)
+
+
+def export_suffix(fmt, compression=None):
+    """file extension, e.g. .csv.gz"""
+    return f".{fmt}" + (".gz" if fmt == "csv" and compression == "gzip" else "")
+
+
+def format_of(path, default="csv"):
+    """output format by file extension, e.g. survey.parquet or survey.csv.gz"""
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    extension = os.path.splitext(name)[1].lstrip(".")
+    if extension == "xls":
+        return "xlsx"
+    return extension if extension in WRITERS else default
+
+
+def anonymized_only(frame, columns, keep=()):
+    """only the <column>_anonymized columns of frame, after the columns to keep (e.g. an id)"""
+    return frame[list(keep) + [f"{column}_anonymized" for column in columns]]
+
+
+def export_frame(frame, fmt, compression=None, directory=None):
+    """
+    write frame in chunks of EXPORT_CHUNK rows to a temporary file and return its
+    path - the caller deletes the file
+    """
+    handle, path = tempfile.mkstemp(suffix=export_suffix(fmt, compression), dir=directory)
+    os.close(handle)
+
+    writer = open_writer(path, fmt, compression)
+    try:
+        # an empty frame still gets its header
+        for start in range(0, max(len(frame.index), 1), EXPORT_CHUNK):
+            writer.write(frame.iloc[start : start + EXPORT_CHUNK])
+    except Exception:
+        writer.close()
+        os.remove(path)
+        raise
+    writer.close()
+
+    return path
@@ -0,0 +1,197 @@
+import io
+import os
+
+import pandas as pd
+
+# input format per file extension
+EXTENSIONS = {
+    ".csv": "csv",
+    ".xls": "xls",
+    ".xlsx": "xlsx",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".feather": "feather",
+    ".arrow": "feather",
+}
+
+
+def input_format(name):
+    """
+    format of an input file by its extension, e.g. survey.parquet -> parquet - csv
+    files may be gzipped (survey.csv.gz, read from a path only)
+    """
+    name = name.lower()
+    if name.endswith(".csv.gz"):
+        return "csv"
+    extension = os.path.splitext(name)[1]
+    if extension not in EXTENSIONS:
+        raise ValueError(f"unsupported file type {extension!r}")
+    return EXTENSIONS[extension]
+
+
+def _file_source(source):
+    """
+    paths as they are, a new file object for every read of an uploaded file -
+    pandas closes the file objects it reads
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    if hasattr(source, "getvalue"):
+        return io.BytesIO(source.getvalue())
+    source.seek(0)
+    return io.BytesIO(source.read())
+
+
+def _arrow_source(source):
+    """
+    paths are memory-mapped by the readers, uploaded files (file objects) are read
+    from their buffer without a copy
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return source
+
+    import pyarrow as pa
+
+    if hasattr(source, "getvalue"):
+        return pa.BufferReader(source.getvalue())
+    source.seek(0)
+    return pa.BufferReader(source.read())
+
+
+def _parquet_file(source):
+    import pyarrow.parquet as pq
+
+    return pq.ParquetFile(_arrow_source(source), memory_map=True)
+
+
+def _feather_table(source, columns=None):
+    """
+    record batches of the columns, memory-mapped - only the pages of the columns
+    used are read from disk
+    """
+    from pyarrow import feather
+
+    return feather.read_table(_arrow_source(source), columns=columns, memory_map=True)
+
+
+def list_columns(source, fmt, sep=","):
+    """
+    column names of a file, read from the schema or the header only
+    """
+    if fmt == "parquet":
+        return list(_parquet_file(source).schema_arrow.names)
+    if fmt == "feather":
+        import pyarrow as pa
+
+        if isinstance(source, (str, os.PathLike)):
+            with pa.memory_map(str(source)) as mapped:
+                return list(pa.ipc.open_file(mapped).schema.names)
+        return list(pa.ipc.open_file(_arrow_source(source)).schema.names)
+    if fmt == "xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(_file_source(source), read_only=True)
+        try:
+            header = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return [column for column in header if column is not None]
+    if fmt == "xls":
+        return list(pd.read_excel(_file_source(source), nrows=0).columns)
+    return list(pd.read_csv(_file_source(source), sep=sep, nrows=0).columns)
+
+
+def arrow_schema(source, fmt, columns=None):
+    """
+    schema of the columns (default: all) of a parquet or feather file, None for the
+    other formats - a chunk alone does not tell the type of a column that is empty in it
+    """
+    if fmt == "parquet":
+        schema = _parquet_file(source).schema_arrow
+    elif fmt == "feather":
+        schema = _feather_table(source, columns).schema
+    else:
+        return None
+
+    import pyarrow as pa
+
+    return pa.schema([schema.field(name) for name in (columns or schema.names)])
+
+
+def _xlsx_chunks(source, columns, chunk_size, dtype=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(_file_source(source), read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        names = [name for name in header if name is not None]
+        wanted = [header.index(name) for name in (columns or names)]
+        names = [header[i] for i in wanted]
+
+        chunk = []
+        for row in rows:
+            values = [row[i] if i < len(row) else None for i in wanted]
+            if dtype is str:
+                values = [None if value is None else str(value) for value in values]
+            chunk.append(values)
+            if len(chunk) == chunk_size:
+                yield pd.DataFrame(chunk, columns=names)
+                chunk = []
+        if chunk or not names:
+            yield pd.DataFrame(chunk, columns=names)
+    finally:
+        workbook.close()
+
+
+def iter_chunks(source, fmt, columns=None, chunk_size=1000, sep=",", dtype=None):
+    """
+    DataFrames of chunk_size rows with only the columns (default: all), numbered by
+    their row in the file. Parquet and feather files are memory-mapped and converted
+    batch by batch, so the columns not used and the rows not yet reached are never
+    loaded. source is a path or a file object, e.g. an upload of streamlit.
+    dtype=str reads the cells of csv and excel files as text, so every chunk has the
+    same types; parquet and feather keep the types of their schema
+    """
+    if fmt == "parquet":
+        batches = _parquet_file(source).iter_batches(batch_size=chunk_size, columns=columns)
+        frames = (batch.to_pandas() for batch in batches)
+    elif fmt == "feather":
+        batches = _feather_table(source, columns).to_batches(max_chunksize=chunk_size)
+        frames = (batch.to_pandas() for batch in batches)
+    elif fmt == "xlsx":
+        frames = _xlsx_chunks(source, columns, chunk_size, dtype)
+    elif fmt == "xls":
+        frame = pd.read_excel(_file_source(source), usecols=columns, dtype=dtype)
+        frames = (frame.iloc[i : i + chunk_size] for i in range(0, len(frame.index), chunk_size))
+    else:
+        frames = pd.read_csv(
+            _file_source(source), sep=sep, usecols=columns, chunksize=chunk_size, dtype=dtype
+        )
+
+    offset = 0
+    for frame in frames:
+        frame.index = pd.RangeIndex(offset, offset + len(frame.index))
+        offset += len(frame.index)
+        if columns is not None:
+            # usecols keeps the order of the file
+            frame = frame[columns]
+        yield frame
+
+
+def read_frame(source, fmt, columns=None, nrows=None, sep=","):
+    """
+    the columns (default: all) of the first nrows rows (default: all) as one DataFrame
+    """
+    frames = []
+    rows = 0
+    for frame in iter_chunks(source, fmt, columns, min(nrows or 10000, 10000), sep):
+        frames.append(frame)
+        rows += len(frame.index)
+        if nrows is not None and rows >= nrows:
+            break
+
+    if not frames:
+        return pd.DataFrame(columns=columns or list_columns(source, fmt, sep))
+    frame = pd.concat(frames) if len(frames) > 1 else frames[0]
+    return frame if nrows is None else frame.iloc[:nrows]
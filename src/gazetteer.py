@@ -0,0 +1,145 @@
+import hashlib
+import re
+
+from src.anon import ENTITY_PLACEHOLDERS
+
+WORD_TAIL = re.compile(r"\w*")
+
+# German inflection endings allowed after a term, e.g. "Rekers" or "Müllers"
+INFLECTIONS = {"", "s", "es", "n", "en", "ns", "ens"}
+
+
+def fold(text):
+    """
+    lower case without changing the length, offsets stay valid
+    """
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c.lower() if len(c.lower()) == 1 else c for c in text)
+
+
+class Gazetteer:
+    """
+    Aho-Corasick automaton over known terms per entity type (PER, LOC, ORG). Finding
+    all terms takes time linear in the length of the text, independent of the number
+    of terms. Matches are case-insensitive, start at a word boundary and may be
+    followed by a German inflection ending
+    """
+
+    def __init__(self, terms=()):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._digest = hashlib.sha256()
+        self.size = 0
+
+        for label, term in terms:
+            self._add(label, term)
+        self._build()
+
+    @classmethod
+    def from_lines(cls, lines):
+        """
+        one "LABEL<tab>term" per line, empty lines and lines starting with # are skipped
+        """
+        terms = []
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            label, _, term = line.partition("\t")
+            if label not in ENTITY_PLACEHOLDERS or not term.strip():
+                raise ValueError(f"line {number}: expected PER, LOC or ORG, a tab and a term")
+            terms.append((label, term.strip()))
+
+        return cls(terms)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as lines:
+            return cls.from_lines(lines)
+
+    @property
+    def identity(self):
+        """hash of all terms, e.g. for cache keys"""
+        return self._digest.hexdigest()
+
+    def _add(self, label, term):
+        term = fold(term)
+        if len(term) < 2:
+            return
+
+        state = 0
+        for char in term:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+
+        if (len(term), label) not in self._out[state]:
+            self._out[state].append((len(term), label))
+            self._digest.update(f"{label}\t{term}\n".encode("utf-8"))
+            self.size += 1
+
+    def _build(self):
+        """
+        compute failure links breadth-first
+        """
+        queue = list(self._goto[0].values())
+        for state in queue:
+            self._fail[state] = 0
+
+        for state in queue:
+            for char, child in self._goto[state].items():
+                queue.append(child)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, text):
+        """
+        leftmost-longest terms in text, same keys as the entities of the model
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        matches = []
+
+        state = 0
+        for position, char in enumerate(fold(text)):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for length, label in out[state]:
+                start, end = position + 1 - length, position + 1
+
+                if start and WORD_TAIL.match(text, start - 1).end() > start - 1:
+                    continue
+                if fold(text[end : WORD_TAIL.match(text, end).end()]) not in INFLECTIONS:
+                    continue
+
+                matches.append((start, -end, label))
+
+        found = []
+        last_end = 0
+        for start, end, label in sorted(matches):
+            if start < last_end:
+                continue
+            last_end = -end
+            found.append(
+                {
+                    "entity_group": label,
+                    "score": 1.0,
+                    "word": text[start:last_end],
+                    "start": start,
+                    "end": last_end,
+                }
+            )
+
+        return found
@@ -0,0 +1,223 @@
+import hashlib
+import re
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from src.anon import (
+    ENTITY_PLACEHOLDERS,
+    detect_entities,
+    find_entity_spans,
+    find_regex_spans,
+    merge_spans,
+)
+from src.document import AnonymizedDocument, Span
+from src.metrics import count, count_entities, record_error, timer
+
+# whitespace after the end of a sentence or a blank line, in front of a letter - no
+# rule-based entity can span it, so the rules give the same result per sentence
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+(?=[^\W\d_])|\n[^\S\n]*\n\s*(?=[^\W\d_])")
+
+# sentences kept per model, enough for the texts of many edit sessions
+SENTENCE_CACHE_SIZE = 20000
+
+
+def split_sentences(text):
+    """
+    sentences of text with their trailing whitespace - joined they give text again
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_BOUNDARY.finditer(text):
+        sentences.append(text[start : match.end()])
+        start = match.end()
+    sentences.append(text[start:])
+    return sentences
+
+
+def sentence_offsets(sentences):
+    offsets = []
+    offset = 0
+    for sentence in sentences:
+        offsets.append(offset)
+        offset += len(sentence)
+    return offsets
+
+
+def uses_model(entities):
+    return any(entity in ENTITY_PLACEHOLDERS for entity in entities)
+
+
+class SentenceCache:
+    """
+    model entities and rule-based spans of single sentences by content hash, in a
+    bounded LRU. identity names what produced the entities, see result_identity -
+    terms of adress and numbering are applied to the whole text, so they are not
+    part of the key
+    """
+
+    def __init__(self, identity, max_size=SENTENCE_CACHE_SIZE):
+        self.identity = identity
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(kind, sentence, *options):
+        payload = "\0".join([kind, sentence, *options])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys, compute):
+        """
+        cached values of keys, compute(missing positions) -> values for the others
+        """
+        with self._lock:
+            values = [self._entries.get(key) for key in keys]
+            for key, value in zip(keys, values):
+                if value is not None:
+                    self._entries.move_to_end(key)
+
+        missing = [index for index, value in enumerate(values) if value is None]
+        lookups = Counter(hit=len(keys) - len(missing), miss=len(missing))
+        if missing:
+            for index, value in zip(missing, compute(missing)):
+                values[index] = value
+
+        with self._lock:
+            for index in missing:
+                self._entries[keys[index]] = values[index]
+                self._entries.move_to_end(keys[index])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self.hits += lookups["hit"]
+            self.misses += lookups["miss"]
+
+        for result, value in lookups.items():
+            count("sentence_cache", value, result=result)
+
+        return values
+
+    def _regex_keys(self, sentences, entities):
+        rules = ",".join(sorted(entity for entity in entities if entity not in ENTITY_PLACEHOLDERS))
+        return [self.key("regex", sentence, rules) for sentence in sentences]
+
+    def _entity_keys(self, sentences):
+        return [self.key("entities", sentence) for sentence in sentences]
+
+    def regex_spans(self, sentences, entities):
+        """find_regex_spans of every sentence"""
+        return self._lookup(
+            self._regex_keys(sentences, entities),
+            lambda missing: [find_regex_spans(sentences[index], entities) for index in missing],
+        )
+
+    def entities(self, sentences, nlp=None, gazetteer=None, fast=False):
+        """detect_entities of every sentence, the model runs on the missing ones at once"""
+        return self._lookup(
+            self._entity_keys(sentences),
+            lambda missing: detect_entities(
+                [sentences[index] for index in missing], nlp, gazetteer, fast
+            ),
+        )
+
+    def covers(self, text, entities):
+        """whether every sentence of text was anonymized with entities before"""
+        sentences = split_sentences(text)
+        keys = self._regex_keys(sentences, entities)
+        if uses_model(entities):
+            keys += self._entity_keys(sentences)
+        with self._lock:
+            return all(key in self._entries for key in keys)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "entries": len(self._entries),
+        }
+
+
+def anon_incremental(text, entities, keep_adresses, cache, nlp=None, gazetteer=None, fast=False):
+    """
+    anon_pipeline from the results of the sentences of text - only sentences that are
+    not in cache run through the rules and the model. The model sees every sentence
+    on its own; merging, further occurrences of names and the numbering of the
+    placeholders are done on the whole text
+    """
+
+    count("texts")
+    count("chars", len(text))
+
+    try:
+        sentences = split_sentences(text)
+        offsets = sentence_offsets(sentences)
+
+        spans = [
+            (start + offset, end + offset, placeholder)
+            for offset, sentence_spans in zip(offsets, cache.regex_spans(sentences, entities))
+            for start, end, placeholder in sentence_spans
+        ]
+
+        if uses_model(entities):
+            found = [
+                dict(entity, start=entity["start"] + offset, end=entity["end"] + offset)
+                for offset, sentence_found in zip(
+                    offsets, cache.entities(sentences, nlp, gazetteer, fast)
+                )
+                for entity in sentence_found
+            ]
+            with timer("postprocess"):
+                spans = merge_spans(
+                    spans, find_entity_spans(text, found, entities, not keep_adresses)
+                )
+
+        document = AnonymizedDocument.from_spans(text, spans)
+        count_entities(document)
+
+    except Exception as e:
+        record_error("pipeline", e)
+        document = AnonymizedDocument("error occured")
+
+    return document
+
+
+def sentence_documents(document):
+    """
+    the document cut into its sentences, the spans keep their placeholders - so the
+    html of an unchanged sentence can be reused. Sentences stay together where a
+    span crosses their boundary
+    """
+    sentences = split_sentences(document.source)
+    ends = [
+        offset + len(sentence) for offset, sentence in zip(sentence_offsets(sentences), sentences)
+    ]
+    crossing = {end for span in document.spans for end in ends if span.start < end < span.end}
+
+    parts = []
+    start = 0
+    spans = iter(document.spans)
+    span = next(spans, None)
+    for end in ends:
+        if end in crossing:
+            continue
+        part = AnonymizedDocument(document.source[start:end])
+        while span is not None and span.start < end:
+            part.spans.append(
+                Span(
+                    span.label,
+                    span.text,
+                    span.index,
+                    span.start - start,
+                    span.end - start,
+                    span.key,
+                )
+            )
+            span = next(spans, None)
+        parts.append(part)
+        start = end
+
+    return parts
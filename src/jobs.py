@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from src.pseudonyms import EntityIndex
+
+MANIFEST = "manifest.json"
+
+# version of the manifest and chunk files
+JOB_VERSION = 2
+
+
+class JobMismatch(ValueError):
+    pass
+
+
+def file_hash(path, block_size=1 << 20):
+    """sha256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for block in iter(lambda: source.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def replace_atomic(path, write):
+    """
+    write(temporary path) and move the file to path at once - a crash leaves either
+    the old or the new file, never a partial one
+    """
+    temporary = f"{path}.tmp"
+    write(temporary)
+    with open(temporary, "rb") as written:
+        os.fsync(written.fileno())
+    os.replace(temporary, path)
+
+
+def write_json(data):
+    def write(path):
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(data, output, ensure_ascii=False)
+
+    return write
+
+
+class ResumableJob:
+    """
+    Chunks of a run stored in a directory, so that a restarted run continues after
+    the last finished chunk. Every chunk is written to its own file before the
+    manifest records it; the manifest holds the input hash, the options and the
+    model and the chunks and rows done. The entities a chunk adds to the EntityIndex
+    are stored next to it, so the manifest stays small and the index is rebuilt on
+    resume. A job only resumes with the same input, options, model and chunk size
+    """
+
+    def __init__(self, directory, identity, manifest=None):
+        self.directory = directory
+        self.identity = identity
+        self.manifest = manifest or {
+            "version": JOB_VERSION,
+            **identity,
+            "chunks": 0,
+            "rows": 0,
+            "entities": None,
+            "finished": False,
+        }
+
+    @classmethod
+    def open(cls, directory, input_hash, options, model, chunk_size):
+        """
+        the job in directory, a new one if there is none yet. raises JobMismatch if
+        the directory holds a job of another input or other options
+        """
+        identity = {
+            "input_hash": input_hash,
+            "options": options,
+            "model": model,
+            "chunk_size": chunk_size,
+        }
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, MANIFEST)
+        if not os.path.exists(path):
+            return cls(directory, identity)
+
+        with open(path, encoding="utf-8") as source:
+            manifest = json.load(source)
+
+        # compare through json, e.g. tuples are stored as lists
+        expected = json.loads(json.dumps({"version": JOB_VERSION, **identity}))
+        changed = [key for key, value in expected.items() if manifest.get(key) != value]
+        if changed:
+            raise JobMismatch(
+                f"the job in {directory} differs in {', '.join(changed)}, "
+                "use a new directory or delete it"
+            )
+        return cls(directory, identity, manifest)
+
+    @property
+    def chunks(self):
+        """number of finished chunks"""
+        return self.manifest["chunks"]
+
+    @property
+    def rows(self):
+        """rows of the finished chunks, the offset to continue at"""
+        return self.manifest["rows"]
+
+    def load_index(self):
+        """EntityIndex after the finished chunks, None if they were saved without"""
+        if self.manifest["entities"] is None:
+            return None
+
+        entries = []
+        for number in range(self.chunks):
+            with open(self.entities_path(number), encoding="utf-8") as source:
+                entries += json.load(source)
+        return EntityIndex.from_entries(entries)
+
+    def chunk_path(self, number):
+        return os.path.join(self.directory, f"chunk-{number:06d}.pkl")
+
+    def entities_path(self, number):
+        return os.path.join(self.directory, f"chunk-{number:06d}.entities.json")
+
+    def save_chunk(self, number, frame, index=None):
+        """
+        store the output of chunk number and the entities it added to index, then
+        record it in the manifest
+        """
+        if number != self.chunks:
+            raise ValueError(f"chunk {number} done before chunk {self.chunks}")
+
+        replace_atomic(self.chunk_path(number), frame.to_pickle)
+        if index is not None:
+            known = self.manifest["entities"] or 0
+            entries = index.entries(known)
+            replace_atomic(self.entities_path(number), write_json(entries))
+            self.manifest["entities"] = known + len(entries)
+
+        self.manifest["chunks"] = number + 1
+        self.manifest["rows"] += len(frame.index)
+        self._save_manifest()
+
+    def iter_chunks(self):
+        """output of the finished chunks in order"""
+        for number in range(self.chunks):
+            yield pd.read_pickle(self.chunk_path(number))
+
+    def finish(self):
+        self.manifest["finished"] = True
+        self._save_manifest()
+
+    def _save_manifest(self):
+        replace_atomic(os.path.join(self.directory, MANIFEST), write_json(self.manifest))
@@ -0,0 +1,312 @@
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+logger = logging.getLogger("anon.metrics")
+
+_sinks = []
+_local = threading.local()
+
+
+def add_sink(sink):
+    """
+    send all timings and counters to sink - an object with the methods
+    timing(name, seconds, labels) and count(name, value, labels)
+    """
+    _sinks.append(sink)
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def active_sinks():
+    """sinks of the process plus those of the current thread, see collect"""
+    return _sinks + getattr(_local, "sinks", [])
+
+
+def local_sinks():
+    """sinks of the current thread only, e.g. to hand them on to worker threads"""
+    return list(getattr(_local, "sinks", []))
+
+
+def set_local_sinks(sinks):
+    """sinks of the current thread, see local_sinks"""
+    _local.sinks = list(sinks)
+
+
+def enabled():
+    return bool(_sinks or getattr(_local, "sinks", None))
+
+
+class Timer:
+    """
+    context manager reporting the seconds spent in its block
+    """
+
+    __slots__ = ("name", "labels", "sinks", "started")
+
+    def __init__(self, name, labels, sinks):
+        self.name = name
+        self.labels = labels
+        self.sinks = sinks
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.started
+        for sink in self.sinks:
+            sink.timing(self.name, seconds, self.labels)
+        return False
+
+
+class NullTimer:
+    """
+    timer without sinks, costs next to nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+def timer(stage, **labels):
+    """
+    time a stage, e.g.
+
+        with timer("regex", rule="DATE"):
+            ...
+    """
+    sinks = active_sinks()
+    return Timer(stage, labels, sinks) if sinks else NULL_TIMER
+
+
+def count(name, value=1, **labels):
+    for sink in active_sinks():
+        sink.count(name, value, labels)
+
+
+def count_entities(document):
+    """count the entities of an AnonymizedDocument per type"""
+    if enabled():
+        for label, value in Counter(span.label for span in document.spans).items():
+            count("entities", value, type=label)
+
+
+def record_error(stage, error):
+    """
+    count a failed stage by type of the error and log it to "anon.metrics", the
+    traceback at debug level
+    """
+    logger.warning("%s failed: %r", stage, error)
+    logger.debug("traceback of the failed %s", stage, exc_info=error)
+    count("errors", stage=stage, error=type(error).__name__)
+
+
+def merge(snapshot):
+    """
+    add the Aggregator snapshot of another process to the aggregating sinks
+    """
+    for sink in active_sinks():
+        if hasattr(sink, "merge"):
+            sink.merge(snapshot)
+
+
+@contextmanager
+def collect():
+    """
+    aggregate the metrics of the current thread only, e.g. of one run in the app
+    """
+    aggregator = Aggregator()
+    previous = getattr(_local, "sinks", [])
+    _local.sinks = previous + [aggregator]
+    try:
+        yield aggregator
+    finally:
+        _local.sinks = previous
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class Aggregator:
+    """
+    in-memory sink - calls, total and maximum seconds and a histogram per stage and
+    labels, sums per counter and labels
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def timing(self, name, seconds, labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            entry = self.timings.get(key)
+            if entry is None:
+                entry = self.timings[key] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[3][i] += 1
+                    break
+
+    def count(self, name, value, labels):
+        with self._lock:
+            self.counters[(name, label_key(labels))] += value
+
+    def snapshot(self):
+        """json-serializable state, e.g. to send it from a worker process"""
+        with self._lock:
+            return {
+                "timings": [
+                    [name, list(labels), calls, total, peak, list(buckets)]
+                    for (name, labels), (calls, total, peak, buckets) in self.timings.items()
+                ],
+                "counters": [
+                    [name, list(labels), value] for (name, labels), value in self.counters.items()
+                ],
+            }
+
+    def merge(self, snapshot):
+        """add the snapshot of another aggregator"""
+        with self._lock:
+            for name, labels, calls, total, peak, buckets in snapshot["timings"]:
+                key = (name, tuple(tuple(label) for label in labels))
+                entry = self.timings.get(key)
+                if entry is None:
+                    entry = self.timings[key] = [0, 0.0, 0.0, [0] * len(BUCKETS)]
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], peak)
+                entry[3] = [a + b for a, b in zip(entry[3], buckets)]
+
+            for name, labels, value in snapshot["counters"]:
+                self.counters[(name, tuple(tuple(label) for label in labels))] += value
+
+    def reset(self):
+        with self._lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def breakdown(self):
+        """
+        one row per stage and labels, slowest first, with its share of the total time
+        """
+        with self._lock:
+            timings = list(self.timings.items())
+
+        total = sum(entry[1] for _, entry in timings) or 1.0
+        rows = [
+            {
+                "stage": name,
+                "labels": ", ".join(f"{key}={value}" for key, value in labels),
+                "calls": calls,
+                "seconds": seconds,
+                "mean_ms": seconds / calls * 1000,
+                "max_ms": peak * 1000,
+                "share": seconds / total,
+            }
+            for (name, labels), (calls, seconds, peak, _) in timings
+        ]
+        return sorted(rows, key=lambda row: row["seconds"], reverse=True)
+
+    def totals(self, name):
+        """sum of a counter per labels"""
+        with self._lock:
+            return {
+                labels: value
+                for (counter, labels), value in self.counters.items()
+                if counter == name
+            }
+
+
+class LogSink:
+    """
+    one json object per timing and counter, logged to logger ("anon.metrics")
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger("anon.metrics")
+        self.level = level
+
+    def timing(self, name, seconds, labels):
+        self.logger.log(
+            self.level,
+            json.dumps({"metric": name, "seconds": seconds, **labels}, ensure_ascii=False),
+        )
+
+    def count(self, name, value, labels):
+        self.logger.log(
+            self.level, json.dumps({"metric": name, "value": value, **labels}, ensure_ascii=False)
+        )
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+def prometheus_text(aggregator, prefix="anon"):
+    """
+    Prometheus text exposition format of an Aggregator - a histogram
+    <prefix>_stage_seconds with the stage as label, <prefix>_<name>_total per counter
+    """
+    with aggregator._lock:
+        timings = sorted(aggregator.timings.items())
+        counters = sorted(aggregator.counters.items())
+
+    lines = []
+    if timings:
+        metric = f"{prefix}_stage_seconds"
+        lines += [f"# HELP {metric} Seconds spent per stage", f"# TYPE {metric} histogram"]
+
+        for (name, labels), (calls, seconds, _, buckets) in timings:
+            labels = (("stage", name),) + labels
+            cumulative = 0
+            for bound, value in zip(BUCKETS, buckets):
+                cumulative += value
+                lines.append(
+                    f"{metric}_bucket{format_labels(labels, [('le', bound)])} {cumulative}"
+                )
+            lines.append(f"{metric}_bucket{format_labels(labels, [('le', '+Inf')])} {calls}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {seconds}")
+            lines.append(f"{metric}_count{format_labels(labels)} {calls}")
+
+    names = []
+    for (name, _), _ in counters:
+        if name not in names:
+            names.append(name)
+
+    for name in names:
+        metric = f"{prefix}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (counter, labels), value in counters:
+            if counter == name:
+                value = int(value) if value == int(value) else value
+                lines.append(f"{metric}{format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,104 @@
+import os
+from threading import Lock
+
+# name or directory of the model, e.g. one prepared with prepare_model.py for mmap
+MODEL_NAME = os.getenv("ANON_MODEL") or (
+    "/app/models/xlm-roberta-large-finetuned-conll03-german/"
+    if os.getenv("DEPLOYMENT")
+    else "xlm-roberta-large-finetuned-conll03-german"
+)
+
+# inference backend, see BACKENDS
+BACKEND = os.getenv("ANON_BACKEND", "fp32")
+
+
+def load_fp32(model_name):
+    """
+    Model in float32 as published
+    """
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+    model = AutoModelForTokenClassification.from_pretrained(model_name)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return model, tokenizer
+
+
+def load_int8(model_name):
+    """
+    Linear layers dynamically quantized to int8 - faster and smaller on CPU,
+    check the accuracy with benchmarks/backend_accuracy.py
+    """
+    import torch
+
+    model, tokenizer = load_fp32(model_name)
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model, tokenizer
+
+
+def load_mmap(model_name):
+    """
+    float32 weights mapped read-only from a directory prepared with prepare_model.py -
+    shared by all processes on the host, ready without deserializing the checkpoint
+    """
+    from src.weights import load_mapped
+
+    return load_mapped(model_name)
+
+
+BACKENDS = {"fp32": load_fp32, "int8": load_int8, "mmap": load_mmap}
+
+
+def init_pipeline(model_name, backend=BACKEND):
+    """
+    Load model with the given backend and return pipeline
+    """
+    from transformers import pipeline
+
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown backend {backend!r}, choose one of {', '.join(BACKENDS)}")
+
+    print(f"loading model: {model_name} ({backend})")
+    model, tokenizer = BACKENDS[backend](model_name)
+    nlp = pipeline("ner", model=model, tokenizer=tokenizer, grouped_entities=True)
+    return nlp
+
+
+def singleton_cache(loader):
+    """
+    In-process cache, every model is loaded once per process
+    """
+    pipelines = {}
+    lock = Lock()
+
+    def cached(model_name, backend=BACKEND):
+        with lock:
+            if (model_name, backend) not in pipelines:
+                pipelines[(model_name, backend)] = loader(model_name, backend)
+            return pipelines[(model_name, backend)]
+
+    return cached
+
+
+_load_pipeline = singleton_cache(init_pipeline)
+
+
+def set_pipeline_cache(cache):
+    """
+    Replace the cache around init_pipeline, e.g. st.cache(allow_output_mutation=True)
+    """
+    global _load_pipeline
+    _load_pipeline = cache(init_pipeline)
+
+
+def get_pipeline(model_name=MODEL_NAME, backend=BACKEND):
+    """
+    Pipeline of model_name - the model is loaded on first use
+    """
+    return _load_pipeline(model_name, backend)
+
+
+def model_identity(model_name=MODEL_NAME, backend=BACKEND):
+    """
+    Identifies the model results, e.g. for cache keys
+    """
+    return f"{model_name}@{backend}"
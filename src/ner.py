@@ -0,0 +1,196 @@
+from src.metrics import timer
+
+# maximum number of (padded) tokens per forward pass
+TOKEN_BUDGET = 8192
+
+# tokens shared by two neighbouring windows of a text longer than the model's max length
+WINDOW_OVERLAP = 128
+
+
+def encode_texts(tokenizer, texts, overlap=WINDOW_OVERLAP):
+    """
+    Tokenize texts without padding into windows of at most the model's max length,
+    long texts are split into windows overlapping by `overlap` tokens.
+    returns token ids and character offsets per window and the index of its text
+    """
+    encodings = tokenizer(
+        texts,
+        truncation=True,
+        max_length=min(tokenizer.model_max_length, 512),
+        stride=overlap,
+        return_overflowing_tokens=True,
+        return_offsets_mapping=True,
+    )
+    return (
+        encodings["input_ids"],
+        encodings["offset_mapping"],
+        encodings["overflow_to_sample_mapping"],
+    )
+
+
+def bucket_batches(lengths, token_budget=TOKEN_BUDGET):
+    """
+    Group indices of texts with similar token length, so that every batch stays
+    below token_budget once padded to its longest text
+    """
+    batch = []
+    for index in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # sorted by length -> the current text is the longest of the batch
+        if batch and lengths[index] * (len(batch) + 1) > token_budget:
+            yield batch
+            batch = []
+        batch.append(index)
+
+    if batch:
+        yield batch
+
+
+def forward(model, tokenizer, input_ids):
+    """
+    Run the model on a batch of token ids, returns label probabilities per token
+    """
+    import torch
+
+    features = tokenizer.pad({"input_ids": input_ids}, return_tensors="pt")
+    with torch.no_grad():
+        logits = model(**features)[0]
+    return logits.softmax(-1)
+
+
+def collect_tokens(tokens, offsets, probs, label_ids):
+    """
+    Add the predictions of one window to tokens (start offset -> prediction). Tokens in
+    the overlap of two windows keep the prediction of the window where they are
+    farther from the border
+    """
+    content = [i for i, (start, end) in enumerate(offsets) if start != end]
+    if not content:
+        return
+
+    first, last = content[0], content[-1]
+    for i in content:
+        distance = min(i - first, last - i)
+        start, end = offsets[i]
+
+        if start not in tokens or tokens[start][0] < distance:
+            tokens[start] = (distance, end, probs[i], label_ids[i])
+
+
+def group_entities(text, probs, label_ids, offsets, id2label):
+    """
+    Merge neighbouring tokens of the same entity type - same keys as the grouped
+    output of the transformers ner pipeline: entity_group, score, word, start, end
+    """
+    found = []
+    current = None
+
+    def close(entity):
+        start, end = entity["start"], entity["end"]
+        while start < end and text[start].isspace():
+            start += 1
+        scores = entity.pop("scores")
+        entity.update(start=start, word=text[start:end], score=sum(scores) / len(scores))
+        found.append(entity)
+
+    for (start, end), prob, label_id in zip(offsets, probs, label_ids):
+        # special tokens
+        if start == end:
+            continue
+
+        label = id2label[label_id]
+        tag, _, group = label.partition("-") if "-" in label else ("I", "", label)
+
+        if label == "O":
+            if current is not None:
+                close(current)
+            current = None
+
+        elif current is not None and current["entity_group"] == group and tag != "B":
+            current["end"] = end
+            current["scores"].append(prob)
+
+        else:
+            if current is not None:
+                close(current)
+            current = {"entity_group": group, "start": start, "end": end, "scores": [prob]}
+
+    if current is not None:
+        close(current)
+
+    return found
+
+
+def tokenize_windows(tokenizer, texts, overlap=WINDOW_OVERLAP):
+    """
+    encode_texts, timed as stage tokenize
+    """
+    with timer("tokenize"):
+        return encode_texts(tokenizer, texts, overlap)
+
+
+def predict_windows(model, tokenizer, input_ids, token_budget=TOKEN_BUDGET):
+    """
+    Run the model on the windows in length-bucketed batches, returns the probability
+    and label id of every token for every window in input order
+    """
+    lengths = [len(ids) for ids in input_ids]
+    predictions = [None] * len(input_ids)
+
+    for batch in bucket_batches(lengths, token_budget):
+        with timer("forward"):
+            probs, label_ids = forward(model, tokenizer, [input_ids[i] for i in batch]).max(-1)
+
+        with timer("decode"):
+            for row, window in enumerate(batch):
+                length = lengths[window]
+                predictions[window] = (
+                    probs[row, :length].tolist(),
+                    label_ids[row, :length].tolist(),
+                )
+
+    return predictions
+
+
+def decode_windows(texts, offsets, text_ids, predictions, id2label):
+    """
+    Merge the predictions of the windows of every text into its list of entities
+    """
+    tokens = [{} for _ in texts]
+    found = []
+
+    with timer("decode"):
+        for window, (probs, label_ids) in enumerate(predictions):
+            collect_tokens(tokens[text_ids[window]], offsets[window], probs, label_ids)
+
+        for text, text_tokens in zip(texts, tokens):
+            starts = sorted(text_tokens)
+            found.append(
+                group_entities(
+                    text,
+                    [text_tokens[start][2] for start in starts],
+                    [text_tokens[start][3] for start in starts],
+                    [(start, text_tokens[start][1]) for start in starts],
+                    id2label,
+                )
+            )
+
+    return found
+
+
+def predict_entities(nlp, texts, token_budget=TOKEN_BUDGET, overlap=WINDOW_OVERLAP):
+    """
+    Run the ner model of the pipeline on texts in length-bucketed batches,
+    returns a list of entities for every text in input order. Texts longer than the
+    model's max length are split into overlapping windows and merged afterwards.
+    Objects with their own predict_entities, e.g. a Cascade, run that instead
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+
+    if hasattr(nlp, "predict_entities"):
+        return nlp.predict_entities(texts, token_budget=token_budget, overlap=overlap)
+
+    input_ids, offsets, text_ids = tokenize_windows(nlp.tokenizer, texts, overlap)
+    predictions = predict_windows(nlp.model, nlp.tokenizer, input_ids, token_budget)
+    return decode_windows(texts, offsets, text_ids, predictions, nlp.model.config.id2label)
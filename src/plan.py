@@ -0,0 +1,151 @@
+import math
+import re
+import unicodedata
+
+from src.anon import ENTITY_PLACEHOLDERS, anon_pipeline_batch
+from src.cache import cached_runner
+from src.document import AnonymizedDocument, Span
+
+# cells with fewer characters only run the regex rules
+MIN_MODEL_CHARS = 3
+
+LETTER = re.compile(r"[^\W\d_]")
+
+
+def cell_text(value):
+    """
+    text of a cell as it is - None for empty cells and NaN
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value)
+
+
+def normalize_cell(value):
+    """
+    NFC-normalized, stripped text of a cell - None for empty cells and NaN
+    """
+    text = cell_text(value)
+    if text is None:
+        return None
+
+    text = unicodedata.normalize("NFC", text).strip()
+    return text or None
+
+
+def normalized_offsets(text):
+    """
+    offset in text of every position of normalize_cell(text) and of its end - None if
+    the normalization joins characters across composed characters (e.g. Hangul)
+    """
+    start = len(text) - len(text.lstrip())
+    core = text.strip()
+    # a character of combining class 0 starts the next composed character
+    bounds = [i for i, char in enumerate(core) if i == 0 or not unicodedata.combining(char)]
+
+    offsets = []
+    parts = []
+    for begin, end in zip(bounds, bounds[1:] + [len(core)]):
+        part = unicodedata.normalize("NFC", core[begin:end])
+        parts.append(part)
+        offsets += [start + begin] * len(part)
+    offsets.append(start + len(core))
+
+    return offsets if "".join(parts) == normalize_cell(text) else None
+
+
+def rebase(document, text):
+    """
+    document of the normalized text of a cell moved onto the cell text, so the output
+    keeps its whitespace and characters - None if the offsets do not map.
+    Failed runs are returned as they are
+    """
+    if text == document.source or normalize_cell(text) != document.source:
+        return document
+
+    offsets = normalized_offsets(text)
+    if offsets is None:
+        return None
+
+    spans = []
+    for span in document.spans:
+        start, end = offsets[span.start], offsets[span.end]
+        spans.append(Span(span.label, text[start:end], span.index, start, end, span.key))
+    return AnonymizedDocument(text, spans)
+
+
+def needs_model(text):
+    """
+    only texts with letters can contain persons, locations or organizations
+    """
+    return len(text) >= MIN_MODEL_CHARS and LETTER.search(text) is not None
+
+
+def plan_cells(values):
+    """
+    normalize and deduplicate cells. returns the key of every row (None if empty)
+    and the unique texts for the model and for the regex rules only
+    """
+    keys = [normalize_cell(value) for value in values]
+
+    unique = dict.fromkeys(key for key in keys if key is not None)
+    model_texts = [text for text in unique if needs_model(text)]
+    regex_texts = [text for text in unique if not needs_model(text)]
+
+    return keys, model_texts, regex_texts
+
+
+def anonymize_column(
+    values, entities, keep_adresses, runner=anon_pipeline_batch, cache=None, index=None, **options
+):
+    """
+    anonymize the cells of a column, running every unique text once - cells that
+    only differ in whitespace around them or in unicode normalization share a run,
+    the documents keep the text of their cell. Empty cells stay empty, cells
+    without letters or shorter than MIN_MODEL_CHARS skip the model.
+    runner is anon_pipeline_batch, anon_pipeline_parallel or anon_pipeline_staged,
+    options are passed on; with a ResultCache only texts without a result are run.
+    With an EntityIndex the placeholders are numbered across rows (and columns).
+    returns the documents in row order and a report of the saved model calls
+    """
+    values = list(values)
+    keys, model_texts, regex_texts = plan_cells(values)
+    runner = cached_runner(runner, cache)
+
+    def run(texts, model=True):
+        if not texts:
+            return {}
+        selected = entities if model else [e for e in entities if e not in ENTITY_PLACEHOLDERS]
+        return dict(zip(texts, runner(texts, selected, keep_adresses, **options)))
+
+    # every unique text runs in its normalized form, the documents are moved onto
+    # the cells - unless the normalization cannot be mapped back, then the cell runs
+    documents = {**run(model_texts), **run(regex_texts, model=False)}
+    cells = [cell_text(value) for value in values]
+    by_cell = {}
+    for cell, key in zip(cells, keys):
+        if cell not in by_cell:
+            by_cell[cell] = (
+                AnonymizedDocument(cell or "") if key is None else rebase(documents[key], cell)
+            )
+    unmapped = [cell for cell, document in by_cell.items() if document is None]
+    unmapped_model = [cell for cell in unmapped if needs_model(normalize_cell(cell))]
+    by_cell.update(run(unmapped_model))
+    by_cell.update(run([cell for cell in unmapped if cell not in unmapped_model], model=False))
+
+    results = [by_cell[cell] for cell in cells]
+    if index is not None:
+        results = index.renumber_many(results)
+
+    uses_model = any([e in ENTITY_PLACEHOLDERS for e in entities]) and not options.get("fast")
+    model_calls = len(model_texts) + len(unmapped_model) if uses_model else 0
+    report = {
+        "rows": len(keys),
+        "empty": keys.count(None),
+        "unique": len(documents) + len(unmapped),
+        "regex_only": len(regex_texts),
+        "model_calls": model_calls,
+        "model_calls_saved": len(keys) - model_calls if uses_model else 0,
+    }
+
+    return results, report
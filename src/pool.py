@@ -0,0 +1,142 @@
+import gc
+import multiprocessing
+import os
+
+from src import metrics
+from src.anon import anon_pipeline_batch
+from src.model import get_pipeline
+from src.ner import TOKEN_BUDGET
+
+# tokenizers must not start its own threads before the workers are forked
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# pipeline and gazetteer of the parent process, inherited by the forked workers
+_worker_nlp = None
+_worker_gazetteer = None
+_worker_metrics = False
+
+
+def _init_worker(threads_per_worker):
+    import torch
+
+    torch.set_num_threads(threads_per_worker)
+
+
+def _anonymize_chunk(args):
+    texts, entities, keep_adresses, token_budget, fast = args
+
+    def run():
+        return anon_pipeline_batch(
+            texts,
+            entities,
+            keep_adresses,
+            token_budget=token_budget,
+            nlp=_worker_nlp,
+            gazetteer=_worker_gazetteer,
+            fast=fast,
+        )
+
+    if not _worker_metrics:
+        return run(), None
+
+    # timings and counters of the worker go back to the sinks of the parent
+    with metrics.collect() as aggregator:
+        documents = run()
+    return documents, aggregator.snapshot()
+
+
+class WorkerPool:
+    """
+    forked worker processes running anon_pipeline_batch, created once and used for all
+    calls of a run. The pipeline and gazetteer are those of the parent when the pool
+    is created, shared copy-on-write, every worker runs torch with threads_per_worker
+    threads. Requires the fork start method (Linux, macOS)
+    """
+
+    def __init__(self, workers=None, threads_per_worker=1, nlp=None, gazetteer=None):
+        global _worker_nlp, _worker_gazetteer, _worker_metrics
+
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 1) // threads_per_worker)
+
+        _worker_nlp = nlp
+        _worker_gazetteer = gazetteer
+        _worker_metrics = metrics.enabled()
+
+        # keep the garbage collector from writing to pages shared with the workers
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+        try:
+            self.pool = context.Pool(
+                workers, initializer=_init_worker, initargs=(threads_per_worker,)
+            )
+        except BaseException:
+            gc.unfreeze()
+            raise
+
+    def run(
+        self, texts, entities, keep_adresses, chunk_size=64, token_budget=TOKEN_BUDGET, fast=False
+    ):
+        """documents of texts in input order, texts are sent in chunks of chunk_size"""
+        texts = list(texts)
+        chunks = (
+            (texts[start : start + chunk_size], entities, keep_adresses, token_budget, fast)
+            for start in range(0, len(texts), chunk_size)
+        )
+
+        results = []
+        for documents, snapshot in self.pool.imap(_anonymize_chunk, chunks):
+            results.extend(documents)
+            if snapshot is not None:
+                metrics.merge(snapshot)
+        return results
+
+    def close(self):
+        """wait for the workers to exit"""
+        self.pool.close()
+        self.pool.join()
+        gc.unfreeze()
+
+    def terminate(self):
+        """stop the workers at once, e.g. after an error"""
+        self.pool.terminate()
+        self.pool.join()
+        gc.unfreeze()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+def anon_pipeline_parallel(
+    texts,
+    entities,
+    keep_adresses,
+    workers=None,
+    threads_per_worker=1,
+    chunk_size=64,
+    token_budget=TOKEN_BUDGET,
+    nlp=None,
+    gazetteer=None,
+    fast=False,
+    pool=None,
+):
+    """
+    anon_pipeline_batch on a pool of forked worker processes. The model is loaded once
+    in the parent and shared copy-on-write. Texts are sent in chunks of chunk_size,
+    results come back in input order. pool is a WorkerPool kept across calls, without
+    one a pool of worker processes is started for this call (see WorkerPool)
+    """
+    if pool is not None:
+        return pool.run(texts, entities, keep_adresses, chunk_size, token_budget, fast)
+
+    if any([e in ["PER", "LOC", "ORG"] for e in entities]) and not fast:
+        nlp = nlp or get_pipeline()
+
+    with WorkerPool(workers, threads_per_worker, nlp, gazetteer) as pool:
+        return pool.run(texts, entities, keep_adresses, chunk_size, token_budget, fast)
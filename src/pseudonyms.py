@@ -0,0 +1,116 @@
+import re
+import unicodedata
+from threading import Lock
+
+from src.document import AnonymizedDocument, Span
+
+WHITESPACE = re.compile(r"\s+")
+
+# parts of an entity that do not change its identity, e.g. "Frau " or "50667 "
+IDENTITY_PREFIXES = {
+    "PERSON": re.compile(r"^(?:(?:herrn|herr|frau|doktor|familie|hr\.|fr\.|dr\.)\s*)+"),
+    "LOCATION": re.compile(r"^[0-9]{4,5}[\s,.]*"),
+}
+
+
+def normalize_entity(label, text):
+    """
+    surface form that identifies an entity of the type - case, whitespace, terms of
+    address and postal codes are ignored, phone numbers are compared by digits
+    """
+    text = WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip().casefold()
+
+    if label == "PHONE":
+        return re.sub(r"\D", "", text) or text
+
+    prefix = IDENTITY_PREFIXES.get(label)
+    if prefix:
+        text = prefix.sub("", text) or text
+    return text
+
+
+class EntityIndex:
+    """
+    Placeholder numbers shared by all rows and columns of a job - every entity gets a
+    stable number per type and normalized surface form, in the order of first
+    appearance. Documents are renumbered as they stream through, entries are kept as
+    one "LABEL<tab>form" string per entity. Thread-safe; with worker processes
+    renumber the returned documents in the parent, in row order
+    """
+
+    def __init__(self):
+        self._numbers = {}
+        self._counts = {}
+        # entries in the order they were numbered
+        self._entries = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def counts(self):
+        """entities per type"""
+        with self._lock:
+            return dict(self._counts)
+
+    def entries(self, start=0):
+        """
+        entries numbered after the first start ones, in order - e.g. the entities new
+        in a chunk of a resumed job. The numbers follow from the order
+        """
+        with self._lock:
+            return self._entries[start:]
+
+    @classmethod
+    def from_entries(cls, entries):
+        index = cls()
+        for entry in entries:
+            label = entry.split("\t", 1)[0]
+            index._numbers[entry] = index._counts[label] = index._counts.get(label, 0) + 1
+            index._entries.append(entry)
+        return index
+
+    def _number(self, label, text, key=None):
+        key = f"{label}\t{key or normalize_entity(label, text)}"
+        number = self._numbers.get(key)
+        if number is None:
+            number = self._numbers[key] = self._counts[label] = self._counts.get(label, 0) + 1
+            self._entries.append(key)
+        return number
+
+    def number(self, label, text):
+        with self._lock:
+            return self._number(label, text)
+
+    def renumber(self, document):
+        """
+        copy of document with the numbers of the index - documents are shared by
+        duplicate rows and the result cache, so they are never changed. Spans that
+        share a placeholder in the document are one entity and keep sharing it, the
+        first of them gives the number by its key (or its text)
+        """
+        if not document.spans:
+            return document
+
+        with self._lock:
+            numbers = {}
+            for span in document.spans:
+                if (span.label, span.index) not in numbers:
+                    numbers[(span.label, span.index)] = self._number(
+                        span.label, span.text, span.key
+                    )
+            spans = [
+                Span(
+                    span.label,
+                    span.text,
+                    numbers[(span.label, span.index)],
+                    span.start,
+                    span.end,
+                    span.key,
+                )
+                for span in document.spans
+            ]
+        return AnonymizedDocument(document.source, spans)
+
+    def renumber_many(self, documents):
+        return [self.renumber(document) for document in documents]
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tornado.web
+
+from src.anon import ENTITY_PLACEHOLDERS, REGEX_RULES, anon_pipeline_batch
+from src.cache import cached_runner
+from src.metrics import Aggregator, collect, prometheus_text
+from src.pseudonyms import EntityIndex
+
+ENTITIES = list(ENTITY_PLACEHOLDERS) + [placeholder for placeholder, _ in REGEX_RULES]
+
+# same limit as the text area of the app
+MAX_CHARS = 20000
+
+# texts per request to the batch endpoint
+MAX_TEXTS = 1000
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class MicroBatcher:
+    """
+    Combine the texts of concurrent requests into batches for the model. A batch is
+    started once it has max_batch texts or max_wait seconds after its first request,
+    while it runs on the model thread new requests queue up for the next one. Texts
+    with different options (entities, keep_adresses, fast) run in separate batches.
+    At most max_pending texts wait, further requests fail with ServiceBusy
+    """
+
+    def __init__(self, run, max_batch=64, max_wait=0.01, max_pending=10000, metrics=None):
+        self.run = run
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.metrics = metrics or Aggregator()
+        self.pending = 0
+
+        # one model thread, the forward pass uses all torch threads
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue = None
+        self._task = None
+
+    async def submit(self, texts, options):
+        """
+        documents for texts, options are the keyword arguments of run.
+        returns the documents and the timings of the batches they ran in
+        """
+        if self.pending + len(texts) > self.max_pending:
+            self.metrics.count("rejected", len(texts), {})
+            raise ServiceBusy(f"more than {self.max_pending} texts waiting")
+
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.ensure_future(self._process())
+
+        loop = asyncio.get_event_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._queue.put_nowait((text, options, future, time.perf_counter()))
+            futures.append(future)
+        self.pending += len(texts)
+
+        results = await asyncio.gather(*futures)
+        documents = [document for document, _ in results]
+        return documents, [timings for _, timings in results]
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    def _run_group(self, texts, options):
+        with collect() as batch_metrics:
+            documents = self.run(texts, **dict(options))
+        return documents, batch_metrics
+
+    def _fail(self, items, error):
+        self.metrics.count("errors", 1, {"stage": "service", "error": type(error).__name__})
+        for _, _, future, _ in items:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _run_items(self, items, options, started):
+        loop = asyncio.get_event_loop()
+        texts = [text for text, _, _, _ in items]
+        documents, batch_metrics = await loop.run_in_executor(
+            self._executor, self._run_group, texts, options
+        )
+
+        self.metrics.merge(batch_metrics.snapshot())
+        stages = {}
+        for row in batch_metrics.breakdown():
+            stages[row["stage"]] = stages.get(row["stage"], 0) + row["seconds"] * 1000
+
+        for (_, _, future, queued), document in zip(items, documents):
+            self.metrics.timing("queue", started - queued, {})
+            timings = {
+                "queue_ms": (started - queued) * 1000,
+                "batch_texts": len(texts),
+                "stages_ms": stages,
+            }
+            if not future.done():
+                future.set_result((document, timings))
+
+    async def _process(self):
+        # the only consumer of the queue - an error fails the requests of its group,
+        # never the task, or every later request would wait forever
+        while True:
+            batch = await self._next_batch()
+            started = time.perf_counter()
+
+            try:
+                groups = {}
+                for item in batch:
+                    groups.setdefault(item[1], []).append(item)
+
+                for options, items in groups.items():
+                    try:
+                        await self._run_items(items, options, started)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self._fail(items, e)
+
+                self.metrics.count("batches", 1, {})
+                self.metrics.count("batched_texts", len(batch), {})
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fail(batch, e)
+            finally:
+                self.pending -= len(batch)
+
+def parse_options(body, gazetteer=None):
+    """
+    entities, keep_adresses, fast and context of a request, the defaults of the app
+    """
+    entities = body.get("entities", ENTITIES)
+    if not isinstance(entities, list) or not set(entities) <= set(ENTITIES):
+        raise tornado.web.HTTPError(400, reason=f"entities must be a list of {', '.join(ENTITIES)}")
+
+    fast = bool(body.get("fast", False))
+    if fast and gazetteer is None:
+        raise tornado.web.HTTPError(400, reason="fast mode requires a gazetteer")
+
+    options = (
+        ("entities", tuple(entities)),
+        ("keep_adresses", bool(body.get("keep_adresses", False))),
+        ("fast", fast),
+    )
+    return options, bool(body.get("context", True)), bool(body.get("timings", False))
+
+
+def check_text(text):
+    if not isinstance(text, str):
+        raise tornado.web.HTTPError(400, reason="text must be a string")
+    if len(text) > MAX_CHARS:
+        raise tornado.web.HTTPError(413, reason=f"text longer than {MAX_CHARS} characters")
+    return text
+
+
+def to_response(document, context, timings=None):
+    response = {"text": document.to_text(context=context), "mapping": document.mapping}
+    if timings is not None:
+        response["timings"] = timings
+    return response
+
+
+class JsonHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def read_json(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="request body is not valid json")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="request body must be a json object")
+        return body
+
+    def write_error(self, status_code, **kwargs):
+        self.finish({"error": self._reason})
+
+    async def anonymize(self, texts, options):
+        self.service.metrics.count("requests", 1, {"endpoint": self.request.path})
+        try:
+            return await self.service.submit(texts, options)
+        except ServiceBusy as e:
+            raise tornado.web.HTTPError(503, reason=str(e))
+
+
+class AnonymizeHandler(JsonHandler):
+    """
+    POST {"text": "...", "entities": [...], "keep_adresses": false, "context": true,
+    "timings": false} -> {"text": "...", "mapping": {"PERSON_1": "..."}}
+    """
+
+    async def post(self):
+        body = self.read_json()
+        text = check_text(body.get("text"))
+        options, context, with_timings = parse_options(body, self.service.gazetteer)
+
+        documents, timings = await self.anonymize([text], options)
+        self.write(to_response(documents[0], context, timings[0] if with_timings else None))
+
+
+class BatchHandler(JsonHandler):
+    """
+    POST {"texts": [...], options as for a single text} -> {"results": [...]},
+    with "consistent": true placeholders are numbered across all texts of the request
+    """
+
+    async def post(self):
+        body = self.read_json()
+        texts = body.get("texts")
+        if not isinstance(texts, list) or len(texts) > MAX_TEXTS:
+            raise tornado.web.HTTPError(400, reason=f"texts must be a list of at most {MAX_TEXTS}")
+        texts = [check_text(text) for text in texts]
+        options, context, with_timings = parse_options(body, self.service.gazetteer)
+
+        documents, timings = await self.anonymize(texts, options)
+        if body.get("consistent"):
+            documents = EntityIndex().renumber_many(documents)
+
+        self.write(
+            {
+                "results": [
+                    to_response(document, context, timing if with_timings else None)
+                    for document, timing in zip(documents, timings)
+                ]
+            }
+        )
+
+
+class MetricsHandler(JsonHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(prometheus_text(self.service.metrics))
+
+
+class HealthHandler(JsonHandler):
+    def get(self):
+        self.write({"status": "ok", "pending": self.service.pending})
+
+
+class Service(MicroBatcher):
+    """
+    micro-batched anon_pipeline_batch with the model, result caches and gazetteer of
+    the service. Fast mode finds other entities than the model, so its results go to
+    fast_cache, built with result_identity(..., fast=True) - without one they are not
+    cached
+    """
+
+    def __init__(self, nlp=None, cache=None, gazetteer=None, fast_cache=None, **batching):
+        self.gazetteer = gazetteer
+
+        runners = {
+            False: cached_runner(anon_pipeline_batch, cache),
+            True: cached_runner(anon_pipeline_batch, fast_cache),
+        }
+
+        def run(texts, entities, keep_adresses, fast):
+            return runners[fast](
+                texts, list(entities), keep_adresses, nlp=nlp, gazetteer=gazetteer, fast=fast
+            )
+
+        super().__init__(run, **batching)
+
+
+def make_app(
+    nlp=None,
+    cache=None,
+    gazetteer=None,
+    fast_cache=None,
+    max_batch=64,
+    max_wait=0.01,
+    max_pending=10000,
+):
+    """
+    tornado application of the service, e.g. for an in-process client in tests:
+
+        app = make_app(nlp)
+        server = tornado.httpserver.HTTPServer(app)
+    """
+    service = Service(
+        nlp,
+        cache,
+        gazetteer,
+        fast_cache,
+        max_batch=max_batch,
+        max_wait=max_wait,
+        max_pending=max_pending,
+    )
+    arguments = {"service": service}
+    return tornado.web.Application(
+        [
+            (r"/anonymize", AnonymizeHandler, arguments),
+            (r"/anonymize/batch", BatchHandler, arguments),
+            (r"/metrics", MetricsHandler, arguments),
+            (r"/health", HealthHandler, arguments),
+        ]
+    )
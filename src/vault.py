@@ -0,0 +1,134 @@
+import sqlite3
+from threading import Lock
+
+from src.anon import PLACEHOLDER_PATTERN
+
+
+def restore(occurrences):
+    """
+    replacement function for the placeholders of one text - the n-th placeholder gets
+    the text of the n-th occurrence, or of any occurrence of the placeholder if the
+    text was changed since
+    """
+    originals = {}
+    for placeholder, original in occurrences:
+        originals.setdefault(placeholder, original)
+    position = iter(range(len(occurrences)))
+
+    def replace(match):
+        number = next(position, None)
+        if number is not None and occurrences[number][0] == match[0]:
+            return occurrences[number][1]
+        return originals.get(match[0], match[0])
+
+    return replace
+
+
+class MappingVault:
+    """
+    placeholders of every anonymized cell with their original text, stored in a sqlite
+    file keyed by (job, column, row, occurrence) - mentions of one entity share the
+    placeholder but may be spelled differently, e.g. "Müller" and "Müllers", so every
+    occurrence keeps its own text. Writes and lookups take whole batches of rows,
+    lookups join a temporary table of the wanted rows against the primary key, so
+    they never scan the table. Whoever can read the file can reverse the anonymization
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS occurrences (
+                job TEXT NOT NULL,
+                column_name TEXT NOT NULL,
+                row_index INTEGER NOT NULL,
+                occurrence INTEGER NOT NULL,
+                placeholder TEXT NOT NULL,
+                original TEXT NOT NULL,
+                PRIMARY KEY (job, column_name, row_index, occurrence)
+            ) WITHOUT ROWID;
+            CREATE TEMP TABLE IF NOT EXISTS wanted (row_index INTEGER PRIMARY KEY);
+            """)
+        self._db.commit()
+
+    def put_many(self, job, column, rows, documents):
+        """
+        store the spans of the documents of rows (row numbers of the file), numbered in
+        the order of their placeholders in the text
+        """
+        values = [
+            (job, column, int(row), occurrence, span.placeholder, span.text)
+            for row, document in zip(rows, documents)
+            for occurrence, span in enumerate(document.spans)
+        ]
+        with self._lock, self._db:
+            # a row stored again, e.g. by a rerun, must not keep occurrences of the last one
+            self._db.executemany(
+                "DELETE FROM occurrences WHERE job = ? AND column_name = ? AND row_index = ?",
+                {(job, column, int(row)) for row in rows},
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO occurrences VALUES (?, ?, ?, ?, ?, ?)", values
+            )
+
+    def lookup_many(self, job, column, rows):
+        """
+        (placeholder, original text) of every occurrence in every row, in the order of
+        the text, empty for unknown rows
+        """
+        rows = [int(row) for row in rows]
+        occurrences = {row: [] for row in rows}
+
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM wanted")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO wanted VALUES (?)", ((row,) for row in rows)
+            )
+            # CROSS JOIN keeps the wanted rows as the outer loop
+            found = self._db.execute(
+                """
+                SELECT occurrences.row_index, placeholder, original
+                FROM wanted CROSS JOIN occurrences
+                ON occurrences.job = ? AND occurrences.column_name = ?
+                AND occurrences.row_index = wanted.row_index
+                ORDER BY occurrences.row_index, occurrence
+                """,
+                (job, column),
+            )
+            for row, placeholder, original in found:
+                occurrences[row].append((placeholder, original))
+            self._db.execute("DELETE FROM wanted")
+
+        return [occurrences[row] for row in rows]
+
+    def reidentify_many(self, job, column, rows, texts):
+        """
+        replace the placeholders of anonymized texts with the original text of their
+        occurrence - texts with context removed (XXX) cannot be re-identified
+        """
+        restored = []
+        for occurrences, text in zip(self.lookup_many(job, column, rows), texts):
+            if not isinstance(text, str):
+                restored.append(text)
+                continue
+            restored.append(PLACEHOLDER_PATTERN.sub(restore(occurrences), text))
+        return restored
+
+    def has_job(self, job):
+        with self._lock:
+            found = self._db.execute("SELECT 1 FROM occurrences WHERE job = ? LIMIT 1", (job,))
+            return found.fetchone() is not None
+
+    def jobs(self):
+        with self._lock:
+            return [job for job, in self._db.execute("SELECT DISTINCT job FROM occurrences")]
+
+    def delete_job(self, job):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM occurrences WHERE job = ?", (job,))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
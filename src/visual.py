@@ -1,10 +1,21 @@
-import re
+import html
+from functools import lru_cache
 
 import streamlit as st
 
 from htbuilder import HtmlElement, div, span, styles
 from htbuilder.units import em, px, rem
 
+from src.document import NO_CONTEXT, AnonymizedDocument
+from src.metrics import timer
+
+# rendered documents kept by content, e.g. the rows of the preview pages seen so far
+HTML_CACHE_SIZE = 10000
+
+# iframe height per line of text and the most before the frame scrolls
+LINE_HEIGHT = 34
+MAX_HEIGHT = 800
+
 # colors from https://www.schemecolor.com/rainbow-pastels-color-scheme.php + yellow: FF0B9 FAFFBB
 tuples = {
     "PERSON": ("Person", "#C7CEEA"),
@@ -48,8 +59,15 @@ def annotation(body, label="", background="#ddd", color="#333", **style):
     )
 
 
-def annotated_text(list_text, *args, **kwargs):
-    out = div(style=styles(font_family="sans-serif", line_height="1.5", font_size=px(16)))
+# style of the div around the text of a document
+TEXT_STYLE = styles(font_family="sans-serif", line_height="1.5", font_size=px(16))
+
+
+def annotated_html(list_text):
+    """
+    html of text pieces - str, htbuilder elements or (body, label, background) tuples
+    """
+    out = div(style=TEXT_STYLE)
     for arg in list_text:
         if isinstance(arg, str):
             out(arg)
@@ -60,33 +78,145 @@ def annotated_text(list_text, *args, **kwargs):
         else:
             raise Exception("Oh noes!")
 
-    st.components.v1.html(str(out), width=None, height=800, **kwargs)
+    return str(out)
+
+
+def annotated_text(list_text, *args, **kwargs):
+    st.components.v1.html(annotated_html(list_text), width=None, height=800, **kwargs)
+
+
+def segments_html(document, original=True, with_label=True, context=True):
+    """
+    html of the text and the entities of an AnonymizedDocument, without the div around
+    """
+    pieces = []
+
+    for segment in document.segments():
+
+        if isinstance(segment, str):
+            pieces.append(html.escape(segment))
+
+        elif not context:
+            pieces.append(NO_CONTEXT)
+
+        else:
+            label, background = tuples.get(segment.label)
+            body = segment.text if original else segment.placeholder
+
+            pieces.append(
+                str(annotation(html.escape(body), label if with_label else "", background))
+            )
+
+    return "".join(pieces)
+
+
+def highlight_html(document, original=True, with_label=True, context=True):
+    """
+    html of an AnonymizedDocument - entities show the original text or the placeholder,
+    without context the output is plain text
+    """
 
+    with timer("render"):
+        return str(div(style=TEXT_STYLE)(segments_html(document, original, with_label, context)))
 
-def highlight_text(text, mapping, with_label=True):
 
-    text_array = re.split(
-        "((?:PERSON|ORG|LOCATION|EMAIL|DATE|PHONE|NUMBER_[0-9]{1,2})_[0-9]+)", text
+def document_key(document):
+    """hashable content of an AnonymizedDocument"""
+    return document.source, tuple(
+        (span.label, span.index, span.start, span.end) for span in document.spans
     )
 
-    for index, elm in enumerate(text_array):
 
-        match = re.match(r"^([A-Z_]+)(_[0-9]+)?_[0-9]+$", elm)
+@lru_cache(maxsize=HTML_CACHE_SIZE)
+def _cached_html(key, original, with_label, context):
+    source, spans = key
+    document = AnonymizedDocument.from_dict({"source": source, "spans": spans})
+    return highlight_html(document, original, with_label, context)
+
+
+def cached_html(document, original=True, with_label=True, context=True):
+    """
+    highlight_html of documents with the same content is built once
+    """
+    return _cached_html(document_key(document), original, with_label, context)
+
+
+@lru_cache(maxsize=HTML_CACHE_SIZE)
+def _cached_segments(key, original, with_label, context):
+    source, spans = key
+    document = AnonymizedDocument.from_dict({"source": source, "spans": spans})
+    return segments_html(document, original, with_label, context)
+
+
+def frame_height(text, chars_per_line=90):
+    lines = sum(len(line) // chars_per_line + 1 for line in text.splitlines() or [""])
+    return min(MAX_HEIGHT, 40 + lines * LINE_HEIGHT)
 
-        if match:
 
-            if mapping:
-                orig_text = mapping.get(elm)
-            else:
-                orig_text = elm
+def highlight_text(document, original=True, with_label=True, context=True):
+    """
+    render an AnonymizedDocument, see highlight_html
+    """
+    st.components.v1.html(
+        cached_html(document, original, with_label, context),
+        width=None,
+        height=frame_height(document.source),
+        scrolling=True,
+    )
 
-            tuple = tuples.get(match.group(1))
 
-            if with_label:
-                tuple = (orig_text, tuple[0], tuple[1])
-            else:
-                tuple = (orig_text, "", tuple[1])
+def highlight_sentences(documents, original=True, with_label=True, context=True):
+    """
+    render a document cut into sentences (see sentence_documents) - the html of every
+    sentence is built once, an edit only renders the changed sentences again
+    """
+    with timer("render"):
+        body = "".join(
+            _cached_segments(document_key(document), original, with_label, context)
+            for document in documents
+        )
+    st.components.v1.html(
+        str(div(style=TEXT_STYLE)(body)),
+        width=None,
+        height=frame_height("".join(document.source for document in documents)),
+        scrolling=True,
+    )
 
-            text_array[index] = tuple
 
-    annotated_text(text_array)
+def preview_html(documents, start, stop, context=True):
+    """
+    table of the original and the anonymized text of the rows start to stop -
+    html is only built for these rows
+    """
+    cell = "padding:0.5rem;vertical-align:top;border-bottom:1px solid #eee"
+    rows = []
+    for row in range(start, min(stop, len(documents))):
+        document = documents[row]
+        rows.append(
+            f'<tr><td style="{cell};color:#999">{row + 1}</td>'
+            f'<td style="{cell}">{cached_html(document)}</td>'
+            f'<td style="{cell}">'
+            f"{cached_html(document, original=False, with_label=False, context=context)}"
+            "</td></tr>"
+        )
+
+    header = f'<th style="{cell};text-align:left">'
+    return (
+        '<table style="width:100%;border-collapse:collapse;font-family:sans-serif">'
+        f"<tr>{header}Row</th>{header}Input</th>{header}Output</th></tr>"
+        + "".join(rows)
+        + "</table>"
+    )
+
+
+def preview_table(documents, start, stop, context=True):
+    """
+    render rows start to stop of the anonymized documents of a column
+    """
+    height = sum(frame_height(document.source, 45) for document in documents[start:stop])
+    st.components.v1.html(
+        preview_html(documents, start, stop, context),
+        width=None,
+        height=min(height + 60, 2 * MAX_HEIGHT),
+        scrolling=True,
+    )
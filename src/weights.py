@@ -0,0 +1,133 @@
+import json
+import os
+import warnings
+
+# flat weights of a prepared model and their index, next to its config and tokenizer
+WEIGHTS_FILE = "weights.bin"
+INDEX_FILE = "weights.json"
+
+# offsets of the tensors in the weights file
+ALIGNMENT = 64
+
+
+def _tensors(model):
+    """
+    parameters and buffers by name, including buffers that are not saved in the
+    state dict (e.g. position ids), which a model built on the meta device lacks
+    """
+    tensors = dict(model.named_parameters())
+    tensors.update(model.named_buffers())
+    return tensors
+
+
+def write_mapped(model, directory):
+    """
+    write every tensor of model to one flat file plus a json index of name ->
+    dtype, shape and byte offset. Tied weights are stored once
+    """
+    index = {}
+    stored = {}
+    offset = 0
+
+    with open(os.path.join(directory, WEIGHTS_FILE), "wb") as output:
+        for name, tensor in _tensors(model).items():
+            key = (tensor.data_ptr(), tuple(tensor.shape), str(tensor.dtype))
+            if key not in stored:
+                array = tensor.detach().cpu().contiguous().numpy()
+                padding = -offset % ALIGNMENT
+                output.write(b"\0" * padding)
+                offset += padding
+                output.write(array.tobytes())
+                stored[key] = {
+                    "dtype": array.dtype.str,
+                    "shape": list(array.shape),
+                    "offset": offset,
+                }
+                offset += array.nbytes
+            index[name] = stored[key]
+
+    with open(os.path.join(directory, INDEX_FILE), "w") as output:
+        json.dump({"tensors": index, "bytes": offset}, output)
+
+
+def prepare_mapped(model_name, directory):
+    """
+    convert model_name (hub name or directory of save_pretrained) into directory:
+    config, tokenizer and the weights as one memory-mappable file
+    """
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+    os.makedirs(directory, exist_ok=True)
+    model = AutoModelForTokenClassification.from_pretrained(model_name)
+    model.config.save_pretrained(directory)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(directory)
+    write_mapped(model.eval(), directory)
+
+
+def is_mapped(directory):
+    return os.path.exists(os.path.join(directory, INDEX_FILE))
+
+
+def _empty_model(config):
+    """model without weights - on the meta device where torch has it (2.0+)"""
+    import torch
+    from transformers import AutoModelForTokenClassification
+
+    try:
+        with torch.device("meta"):
+            return AutoModelForTokenClassification.from_config(config)
+    except (AttributeError, TypeError):
+        # older torch: randomly initialized weights, replaced and freed below
+        return AutoModelForTokenClassification.from_config(config)
+
+
+def _set_tensor(model, name, tensor):
+    import torch
+
+    *path, leaf = name.split(".")
+    module = model
+    for part in path:
+        module = getattr(module, part)
+    if leaf in module._parameters:
+        module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+    else:
+        module._buffers[leaf] = tensor
+
+
+def load_mapped(model_name):
+    """
+    Model prepared with prepare_model.py, the weights mapped read-only from the
+    weights file - processes on one host share them in the page cache, and pages
+    are read from disk on first use instead of deserializing the checkpoint
+    """
+    import numpy as np
+    import torch
+    from transformers import AutoConfig, AutoTokenizer
+
+    if not is_mapped(model_name):
+        raise FileNotFoundError(
+            f"{model_name} has no {INDEX_FILE}, prepare it with: "
+            f"python prepare_model.py {model_name} <directory>"
+        )
+
+    with open(os.path.join(model_name, INDEX_FILE)) as source:
+        index = json.load(source)["tensors"]
+    weights = np.memmap(os.path.join(model_name, WEIGHTS_FILE), dtype=np.uint8, mode="r")
+
+    model = _empty_model(AutoConfig.from_pretrained(model_name))
+    with warnings.catch_warnings():
+        # the tensors are read-only, writing to them would fail
+        warnings.simplefilter("ignore", UserWarning)
+        for name, entry in index.items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            array = weights[entry["offset"] : entry["offset"] + count * dtype.itemsize]
+            _set_tensor(model, name, torch.from_numpy(array.view(dtype).reshape(entry["shape"])))
+
+    model.tie_weights()
+    missing = [name for name, tensor in _tensors(model).items() if tensor.device.type == "meta"]
+    if missing:
+        raise ValueError(f"{model_name}/{WEIGHTS_FILE} lacks {', '.join(missing)}")
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return model.eval(), tokenizer
@@ -0,0 +1,45 @@
+from src.anon import anon_pipeline_batch
+from src.cache import ResultCache, cached_runner
+
+ENTITIES = ["EMAIL", "PHONE"]
+
+
+def recording_runner(calls):
+    def run(texts, entities, keep_adresses, **options):
+        calls.append(list(texts))
+        return anon_pipeline_batch(texts, entities, keep_adresses, **options)
+
+    return run
+
+
+def test_only_missing_texts_are_run():
+    calls = []
+    run = cached_runner(recording_runner(calls), ResultCache(model="test"))
+
+    first = run(["a@b.de", "0211 556677"], ENTITIES, False)
+    second = run(["0211 556677", "neu: c@d.de", "a@b.de"], ENTITIES, False)
+
+    assert calls == [["a@b.de", "0211 556677"], ["neu: c@d.de"]]
+    assert [d.text for d in first] == ["EMAIL_1", "PHONE_1"]
+    assert [d.text for d in second] == ["PHONE_1", "neu: EMAIL_1", "EMAIL_1"]
+
+
+def test_nothing_runs_when_all_texts_are_cached():
+    calls = []
+    run = cached_runner(recording_runner(calls), ResultCache(model="test"))
+
+    run(["a@b.de"], ENTITIES, False)
+    run(["a@b.de"], ENTITIES, False)
+
+    assert calls == [["a@b.de"]]
+
+
+def test_options_are_passed_on():
+    calls = []
+    run = cached_runner(recording_runner(calls), ResultCache(model="test"))
+
+    assert run(["am 01.05.2021"], ["DATE"], False, fast=True)[0].text == "am DATE_1"
+
+
+def test_without_cache_the_runner_is_returned():
+    assert cached_runner(anon_pipeline_batch, None) is anon_pipeline_batch
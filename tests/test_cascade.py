@@ -0,0 +1,142 @@
+import contextlib
+import sys
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.tiny_model import build_tiny_model
+from src.anon import ENTITY_PLACEHOLDERS, anon_pipeline_batch
+from src.cascade import Cascade, entity_keys
+from src.model import init_pipeline
+from src.ner import predict_entities
+
+TEXTS = [row["text"] for row in generate_corpus(40, seed=1)]
+
+
+class Recorded:
+    """a pipeline that keeps the texts it was run on"""
+
+    def __init__(self, nlp):
+        self.nlp = nlp
+        self.texts = []
+
+    def predict_entities(self, texts, token_budget=None, overlap=None):
+        self.texts.extend(texts)
+        return predict_entities(self.nlp, texts, token_budget)
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    """a small and a larger tiny model, trained on the corpus generator in seconds"""
+    directory = tmp_path_factory.mktemp("models")
+    with contextlib.redirect_stdout(sys.stderr):
+        small = build_tiny_model(
+            str(directory / "small"), rows=500, steps=150, hidden_size=16, layers=1
+        )
+        large = build_tiny_model(str(directory / "large"), rows=500, steps=300)
+        return init_pipeline(small, "fp32"), init_pipeline(large, "fp32")
+
+
+@pytest.fixture(scope="module")
+def found(models):
+    small, large = models
+    return predict_entities(small, TEXTS), predict_entities(large, TEXTS)
+
+
+def keys(found):
+    """spans of every text - scores differ in the last digits with the padding of a batch"""
+    return [entity_keys(entities) for entities in found]
+
+
+def cascade(models, **options):
+    small, large = models
+    return Cascade(small, Recorded(large), **options)
+
+
+def test_low_confidence_escalates_to_the_large_model(models, found):
+    confident = cascade(models, min_confidence=1.01, escalate_entities=False)
+
+    assert keys(confident.predict_entities(TEXTS)) == keys(found[1])
+    assert confident.large.texts == TEXTS
+    assert confident.stats["escalated_low_confidence"] == len(TEXTS)
+
+    trusting = cascade(models, min_confidence=0.0, escalate_entities=False)
+
+    assert keys(trusting.predict_entities(TEXTS)) == keys(found[0])
+    assert trusting.large.texts == []
+    assert trusting.stats["escalated"] == 0
+
+
+def test_texts_with_entities_escalate(models, found):
+    small_found, large_found = found
+    with_entities = [index for index, entities in enumerate(small_found) if entities]
+    assert 0 < len(with_entities) < len(TEXTS)
+
+    checked = cascade(models, min_confidence=0.0)
+    result = checked.predict_entities(TEXTS)
+
+    assert checked.large.texts == [TEXTS[index] for index in with_entities]
+    assert checked.stats["escalated_entities"] == len(with_entities)
+    assert checked.stats["small_only"] == len(TEXTS) - len(with_entities)
+    for index, entities in enumerate(result):
+        expected = (large_found if index in with_entities else small_found)[index]
+        assert entity_keys(entities) == entity_keys(expected)
+
+
+def test_every_nth_confident_text_is_audited(models, found):
+    audited = cascade(models, min_confidence=0.0, escalate_entities=False, audit_every=3)
+
+    # the count of confident texts continues across calls
+    result = audited.predict_entities(TEXTS[:20]) + audited.predict_entities(TEXTS[20:])
+
+    assert keys(result) == keys(found[0])
+    assert audited.large.texts == TEXTS[2::3]
+    assert audited.stats["audited"] == len(TEXTS) // 3
+    assert audited.stats["escalated"] == 0
+
+
+def test_report_ratios(models, found):
+    checked = cascade(models, min_confidence=1.01)
+    checked.predict_entities(TEXTS)
+    report = checked.report()
+
+    pairs = [(entity_keys(small), entity_keys(large)) for small, large in zip(*found)]
+    small_spans = sum(len(small) for small, _ in pairs)
+    large_spans = sum(len(large) for _, large in pairs)
+    matched = sum(len(small & large) for small, large in pairs)
+    same = sum(small == large for small, large in pairs)
+    assert same < len(TEXTS)
+
+    assert report["texts"] == len(TEXTS)
+    assert report["escalation_rate"] == 1.0
+    assert report["escalated"] == {"low_confidence": len(TEXTS), "entities": 0}
+    assert report["escalated_agreement"] == {
+        "texts": len(TEXTS),
+        "same_entities": same / len(TEXTS),
+        "span_precision": matched / small_spans,
+        "span_recall": matched / large_spans,
+    }
+    assert report["audited_agreement"]["texts"] == 0
+    assert report["audited_agreement"]["same_entities"] is None
+
+
+def test_models_that_agree(models):
+    small, _ = models
+    alone = Cascade(small, small, min_confidence=1.01)
+    alone.predict_entities(TEXTS)
+
+    agreement = alone.report()["escalated_agreement"]
+    assert agreement["same_entities"] == 1.0
+    assert agreement["span_precision"] in (1.0, None)
+
+
+def test_cascade_as_nlp_of_the_pipeline(models):
+    small, large = models
+    entities = list(ENTITY_PLACEHOLDERS) + ["DATE", "EMAIL", "PHONE"]
+    checked = Cascade(small, large, min_confidence=1.01)
+
+    documents = anon_pipeline_batch(TEXTS, entities, False, nlp=checked)
+    expected = anon_pipeline_batch(TEXTS, entities, False, nlp=large)
+
+    assert [document.text for document in documents] == [document.text for document in expected]
+    assert checked.report()["texts"] == len(TEXTS)
@@ -0,0 +1,71 @@
+from src.anon import find_entity_spans, find_regex_spans, merge_spans
+from src.document import AnonymizedDocument
+from src.pseudonyms import EntityIndex
+
+
+def entity(text, word, label="PER", occurrence=0):
+    start = -1
+    for _ in range(occurrence + 1):
+        start = text.index(word, start + 1)
+    return {"entity_group": label, "word": word, "start": start, "end": start + len(word)}
+
+
+def anonymize(text, found, entities=("PER", "LOC", "ORG", "DATE")):
+    spans = merge_spans(find_regex_spans(text, entities), find_entity_spans(text, found, entities))
+    return AnonymizedDocument.from_spans(text, spans)
+
+
+def test_mentions_of_one_person_share_the_placeholder():
+    text = "Dr. Müller rief an. Müller sagte, Müllers Akte sei weg."
+    document = anonymize(text, [entity(text, "Müller")])
+
+    assert document.text == "PERSON_1 rief an. PERSON_1 sagte, PERSON_1 Akte sei weg."
+
+
+def test_postal_codes_do_not_make_another_location():
+    text = "Ich wohne in 50667 Köln, die Stadt Köln ist schön."
+    document = anonymize(text, [entity(text, "Köln", "LOC")])
+
+    assert document.text == "Ich wohne in LOCATION_1, die Stadt LOCATION_1 ist schön."
+    assert [span.text for span in document.spans] == ["50667 Köln", "Köln"]
+
+
+def test_different_people_get_different_placeholders():
+    text = "Frau Henriette Reker traf Herrn Schmidt am 01.05.2021."
+    found = [entity(text, "Henriette"), entity(text, "Reker"), entity(text, "Schmidt")]
+
+    assert anonymize(text, found).text == "PERSON_1 traf PERSON_2 am DATE_1."
+
+
+def test_spans_without_key_are_numbered_by_text():
+    document = AnonymizedDocument.from_spans("a b a", [(0, 1, "ORG"), (2, 3, "ORG"), (4, 5, "ORG")])
+
+    assert document.text == "ORG_1 ORG_2 ORG_1"
+
+
+def test_consistent_numbering_keeps_the_mentions_of_a_person_together():
+    index = EntityIndex()
+    first = "Herr Müller kam. Das ist Müllers Hund."
+    second = "Frau Schmidt traf Frau Müller."
+
+    documents = index.renumber_many(
+        [
+            anonymize(first, [entity(first, "Müller")]),
+            anonymize(second, [entity(second, "Schmidt"), entity(second, "Müller")]),
+        ]
+    )
+
+    assert [document.text for document in documents] == [
+        "PERSON_1 kam. Das ist PERSON_1 Hund.",
+        "PERSON_2 traf PERSON_1.",
+    ]
+
+
+def test_entity_keys_survive_serialization():
+    text = "Herr Müller kam. Das ist Müllers Hund."
+    document = anonymize(text, [entity(text, "Müller")])
+
+    copy = AnonymizedDocument.from_dict(document.to_dict())
+
+    assert [span.key for span in copy.spans] == [span.key for span in document.spans]
+    assert EntityIndex().renumber(copy).text == "PERSON_1 kam. Das ist PERSON_1 Hund."
@@ -0,0 +1,66 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.export import open_writer
+from src.formats import arrow_schema, iter_chunks
+
+# the first chunk of the sparse columns is empty
+ROWS = 25
+NOTES = [None] * 15 + ["text here"] * 10
+NUMBERS = [None] * 12 + list(range(13))
+
+
+def write_parquet(frames, path, schema=None):
+    writer = open_writer(str(path), "parquet", "snappy", schema=schema)
+    for frame in frames:
+        writer.write(frame)
+    writer.close()
+    return pq.read_table(str(path))
+
+
+def test_csv_columns_empty_in_the_first_chunk(tmp_path):
+    source = tmp_path / "in.csv"
+    pd.DataFrame({"id": range(ROWS), "note": NOTES}).to_csv(source, index=False)
+
+    table = write_parquet(
+        iter_chunks(str(source), "csv", chunk_size=10, dtype=str), tmp_path / "out.parquet"
+    )
+
+    assert table.column("note").to_pylist() == NOTES
+    assert table.column("id").to_pylist() == [str(i) for i in range(ROWS)]
+
+
+def test_parquet_keeps_the_types_of_the_input(tmp_path):
+    source = tmp_path / "in.parquet"
+    flags = [None] * 15 + [True] * 10
+    pq.write_table(
+        pa.table(
+            {
+                "note": pa.array(NOTES, pa.string()),
+                "number": pa.array(NUMBERS, pa.int64()),
+                "flag": pa.array(flags, pa.bool_()),
+            }
+        ),
+        str(source),
+    )
+
+    table = write_parquet(
+        iter_chunks(str(source), "parquet", chunk_size=10),
+        tmp_path / "out.parquet",
+        arrow_schema(str(source), "parquet"),
+    )
+
+    assert table.schema.field("number").type == pa.int64()
+    assert table.schema.field("flag").type == pa.bool_()
+    assert table.column("number").to_pylist() == NUMBERS
+    assert table.column("flag").to_pylist() == flags
+    assert table.column("note").to_pylist() == NOTES
+
+
+def test_arrow_schema_of_the_selected_columns(tmp_path):
+    source = tmp_path / "in.parquet"
+    pq.write_table(pa.table({"a": [1], "b": ["x"]}), str(source))
+
+    assert arrow_schema(str(source), "parquet", ["b"]).names == ["b"]
+    assert arrow_schema(str(tmp_path / "in.csv"), "csv") is None
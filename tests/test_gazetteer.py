@@ -0,0 +1,71 @@
+import pytest
+
+from src.gazetteer import Gazetteer
+
+TERMS = [
+    ("PER", "Henriette Reker"),
+    ("PER", "Reker"),
+    ("PER", "Rita"),
+    ("LOC", "Köln"),
+    ("LOC", "Köln-Deutz"),
+    ("ORG", "Stadtwerke Köln"),
+]
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    return Gazetteer(TERMS)
+
+
+def words(gazetteer, text):
+    """(label, word, start) of every term found"""
+    return [
+        (found["entity_group"], found["word"], found["start"]) for found in gazetteer.find(text)
+    ]
+
+
+def test_longest_term_wins_over_its_prefix_and_suffix(gazetteer):
+    text = "Henriette Reker fährt von Köln-Deutz zu den Stadtwerke Köln, Reker bleibt in Köln."
+
+    assert words(gazetteer, text) == [
+        ("PER", "Henriette Reker", 0),
+        ("LOC", "Köln-Deutz", 26),
+        ("ORG", "Stadtwerke Köln", 44),
+        ("PER", "Reker", 61),
+        ("LOC", "Köln", 77),
+    ]
+
+
+def test_failure_links_find_terms_inside_a_failed_match(gazetteer):
+    # "Henriette R" is a prefix of a term, the match continues with "Rita"
+    assert words(gazetteer, "Henriette Rita") == [("PER", "Rita", 10)]
+    assert words(gazetteer, "die Stadtwerke Kölner Straße") == []
+    assert words(gazetteer, "Stadtwerke Kölns") == [("ORG", "Stadtwerke Köln", 0)]
+
+
+def test_terms_start_at_a_word_boundary(gazetteer):
+    assert words(gazetteer, "Dreker und Margarita") == []
+    assert words(gazetteer, "(Reker)") == [("PER", "Reker", 1)]
+
+
+@pytest.mark.parametrize("word", ["Rekers", "Rekern", "Rekerns", "Rekeres"])
+def test_inflection_endings(gazetteer, word):
+    assert words(gazetteer, f"mit {word} Hund") == [("PER", "Reker", 4)]
+
+
+@pytest.mark.parametrize("word", ["Rekerin", "Rekert", "Kölner"])
+def test_other_endings_are_other_words(gazetteer, word):
+    assert words(gazetteer, f"mit {word} Hund") == []
+
+
+def test_matches_ignore_case_and_keep_the_text(gazetteer):
+    assert words(gazetteer, "IN KÖLN UND köln") == [("LOC", "KÖLN", 3), ("LOC", "köln", 12)]
+
+
+def test_from_lines():
+    gazetteer = Gazetteer.from_lines(["# Personen", "", "PER\tReker", "PER\tReker", "LOC\tKöln\n"])
+
+    assert gazetteer.size == 2
+    assert gazetteer.identity == Gazetteer([("PER", "Reker"), ("LOC", "Köln")]).identity
+    with pytest.raises(ValueError, match="line 2"):
+        Gazetteer.from_lines(["PER\tReker", "CITY\tKöln"])
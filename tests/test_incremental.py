@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+from src.anon import ENTITY_PLACEHOLDERS, REGEX_RULES, anon_pipeline
+from src.gazetteer import Gazetteer
+from src.incremental import SentenceCache, anon_incremental, sentence_documents, split_sentences
+
+ENTITIES = list(ENTITY_PLACEHOLDERS) + [placeholder for placeholder, _ in REGEX_RULES]
+
+TEXTS = [
+    "Henriette Reker wohnt in der Domstraße 12 in Köln. Ihre Nummer ist 0221 123456!\n\n"
+    "Frau Reker schreibt an info@example.org. In Köln trifft sie Markus Nutz.",
+    "Markus Nutz kam am 12.03.2021. Was sagt Henriette Reker? Nichts.",
+    "Kein Name. Keine Nummer.",
+    "",
+]
+
+
+class KnownNames:
+    """tags every occurrence of its names, the same in a sentence as in the whole text"""
+
+    def __init__(self, names):
+        self.names = names
+        self.texts = []
+
+    def predict_entities(self, texts, token_budget=None, overlap=None):
+        self.texts.extend(texts)
+        return [
+            [
+                {
+                    "entity_group": label,
+                    "word": match[0],
+                    "start": match.start(),
+                    "end": match.end(),
+                    "score": 1.0,
+                }
+                for name, label in self.names.items()
+                for match in re.finditer(re.escape(name), text)
+            ]
+            for text in texts
+        ]
+
+
+def model():
+    return KnownNames({"Henriette Reker": "PER", "Markus Nutz": "PER", "Köln": "LOC"})
+
+
+@pytest.mark.parametrize("keep_adresses", [False, True])
+@pytest.mark.parametrize("text", TEXTS)
+def test_same_document_as_the_pipeline(text, keep_adresses):
+    incremental = anon_incremental(text, ENTITIES, keep_adresses, SentenceCache("model"), model())
+    expected = anon_pipeline(text, ENTITIES, keep_adresses, nlp=model())
+
+    assert incremental.text == expected.text
+    assert incremental.to_dict() == expected.to_dict()
+
+
+def test_same_document_with_a_gazetteer():
+    gazetteer = Gazetteer([("PER", "Reker"), ("ORG", "Stadtwerke Köln")])
+    text = "Reker ist bei den Stadtwerke Köln. Henriette Reker bleibt."
+
+    cache = SentenceCache("model")
+    incremental = anon_incremental(text, ENTITIES, False, cache, model(), gazetteer=gazetteer)
+    expected = anon_pipeline(text, ENTITIES, False, nlp=model(), gazetteer=gazetteer)
+
+    assert incremental.text == expected.text
+    assert incremental.to_dict() == expected.to_dict()
+
+
+def test_only_changed_sentences_run_on_the_model():
+    cache = SentenceCache("model")
+    nlp = model()
+    first = anon_incremental(TEXTS[0], ENTITIES, False, cache, nlp)
+
+    edited = TEXTS[0].replace("Frau Reker schreibt", "Frau Reker mailt")
+    nlp.texts = []
+    document = anon_incremental(edited, ENTITIES, False, cache, nlp)
+
+    assert nlp.texts == ["Frau Reker mailt an info@example.org. "]
+    assert document.text == first.text.replace("schreibt", "mailt")
+    assert cache.covers(edited, ENTITIES)
+    assert not cache.covers(edited + " Neu.", ENTITIES)
+
+
+def test_sentences_of_a_document():
+    document = anon_incremental(TEXTS[0], ENTITIES, False, SentenceCache("model"), model())
+    parts = sentence_documents(document)
+
+    assert [part.source for part in parts] == split_sentences(TEXTS[0])
+    assert "".join(part.text for part in parts) == document.text
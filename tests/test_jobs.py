@@ -0,0 +1,60 @@
+import json
+import os
+
+import pandas as pd
+
+from src.jobs import MANIFEST, ResumableJob
+from src.pseudonyms import EntityIndex
+
+CHUNKS = [
+    [("PERSON", "Henriette Reker"), ("LOCATION", "Köln")],
+    [("PERSON", "Frau Henriette Reker"), ("PERSON", "Markus Nutz")],
+    [("LOCATION", "50667 Köln"), ("ORG", "Stadtwerke")],
+]
+
+
+def open_job(directory):
+    return ResumableJob.open(str(directory), "hash", {"consistent": True}, "model", 2)
+
+
+def run_chunks(job, index, chunks):
+    for number, entities in enumerate(chunks, start=job.chunks):
+        for label, text in entities:
+            index.number(label, text)
+        job.save_chunk(number, pd.DataFrame({"row": [number]}), index)
+
+
+def test_resumed_job_continues_the_numbering(tmp_path):
+    complete = EntityIndex()
+    run_chunks(open_job(tmp_path / "complete"), complete, CHUNKS)
+
+    run_chunks(open_job(tmp_path / "resumed"), EntityIndex(), CHUNKS[:2])
+    job = open_job(tmp_path / "resumed")
+    index = job.load_index()
+    run_chunks(job, index, CHUNKS[2:])
+
+    assert index.entries() == complete.entries()
+    assert index.counts() == complete.counts() == {"PERSON": 2, "LOCATION": 1, "ORG": 1}
+    assert index.number("PERSON", "Markus Nutz") == 2
+
+
+def test_manifest_does_not_grow_with_the_entities(tmp_path):
+    job = open_job(tmp_path)
+    run_chunks(job, EntityIndex(), CHUNKS)
+
+    with open(os.path.join(str(tmp_path), MANIFEST), encoding="utf-8") as source:
+        manifest = json.load(source)
+    with open(job.entities_path(1), encoding="utf-8") as source:
+        added = json.load(source)
+
+    assert manifest["entities"] == 4
+    assert "Reker" not in json.dumps(manifest)
+    assert added == ["PERSON\tmarkus nutz"]
+
+
+def test_job_without_index(tmp_path):
+    job = open_job(tmp_path)
+    job.save_chunk(0, pd.DataFrame({"row": [0]}))
+
+    assert open_job(tmp_path).load_index() is None
+    assert not os.path.exists(job.entities_path(0))
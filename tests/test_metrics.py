@@ -0,0 +1,20 @@
+import logging
+
+from src.metrics import Aggregator, collect, record_error
+
+
+def test_errors_are_counted_and_logged_not_printed(capsys, caplog):
+    caplog.set_level(logging.DEBUG, logger="anon.metrics")
+
+    with collect() as metrics:
+        try:
+            raise ValueError("kaputt")
+        except ValueError as e:
+            record_error("pipeline", e)
+
+    assert capsys.readouterr().out == ""
+    assert isinstance(metrics, Aggregator)
+    assert metrics.counters[("errors", (("error", "ValueError"), ("stage", "pipeline")))] == 1
+    warning, debug = caplog.records
+    assert warning.levelno == logging.WARNING and "kaputt" in warning.getMessage()
+    assert debug.levelno == logging.DEBUG and debug.exc_info[0] is ValueError
@@ -0,0 +1,40 @@
+import os
+import subprocess
+import sys
+
+import anonymize
+import server
+from src.model import MODEL_NAME, model_identity
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def model_name(**environment):
+    output = subprocess.run(
+        [sys.executable, "-c", "from src.model import MODEL_NAME; print(MODEL_NAME)"],
+        cwd=ROOT,
+        env={**os.environ, "DEPLOYMENT": "", **environment},
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    return output.stdout.decode().strip()
+
+
+def test_anon_model_selects_the_model():
+    assert model_name(ANON_MODEL="models-mapped/") == "models-mapped/"
+    assert model_name(ANON_MODEL="") == "xlm-roberta-large-finetuned-conll03-german"
+
+
+def test_model_option_of_the_command_line_and_the_server():
+    arguments = ["--model", "models-mapped/", "--backend", "mmap"]
+
+    command_line = anonymize.parse_args(["in.csv", "out.csv", "--columns", "answer", *arguments])
+
+    assert command_line.model == "models-mapped/"
+    assert server.parse_args(arguments).model == "models-mapped/"
+    assert server.parse_args([]).model == MODEL_NAME
+
+
+def test_model_identity_names_the_model_directory():
+    assert model_identity("models-mapped/", "mmap") != model_identity("models/", "mmap")
+    assert model_identity("models-mapped/", "mmap") == "models-mapped/@mmap"
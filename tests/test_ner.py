@@ -0,0 +1,77 @@
+import contextlib
+import sys
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.tiny_model import LABELS, build_tiny_model
+from src.model import init_pipeline
+from src.ner import decode_windows, encode_texts, predict_entities
+
+ID2LABEL = dict(enumerate(LABELS))
+O, B_PER, I_PER = (LABELS.index(label) for label in ["O", "B-PER", "I-PER"])
+
+TEXTS = [row["text"] for row in generate_corpus(60, seed=2) if row["text"]]
+
+
+@pytest.fixture(scope="module")
+def nlp(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("models")
+    with contextlib.redirect_stdout(sys.stderr):
+        path = build_tiny_model(str(directory), rows=500, steps=150, hidden_size=16, layers=1)
+        return init_pipeline(path, "fp32")
+
+
+def spans(entities):
+    return {(entity["entity_group"], entity["start"], entity["end"]) for entity in entities}
+
+
+def test_entity_across_the_border_of_two_windows():
+    text = "Herr Henriette Reker wohnt"
+    # [CLS] Herr Henriette Reker [SEP] and [CLS] Henriette Reker wohnt [SEP]
+    offsets = [
+        [(0, 0), (0, 4), (5, 14), (15, 20), (0, 0)],
+        [(0, 0), (5, 14), (15, 20), (21, 26), (0, 0)],
+    ]
+    # both windows are wrong at their border, the token farther from it wins
+    predictions = [
+        ([1.0, 0.9, 0.8, 0.6, 1.0], [O, O, B_PER, O, O]),
+        ([1.0, 0.5, 0.7, 0.9, 1.0], [O, O, I_PER, O, O]),
+    ]
+
+    (found,) = decode_windows([text], offsets, [0, 0], predictions, ID2LABEL)
+
+    assert found == [
+        {"entity_group": "PER", "start": 5, "end": 20, "word": "Henriette Reker", "score": 0.75}
+    ]
+
+
+def test_long_text_is_split_into_overlapping_windows(nlp):
+    text = " ".join(TEXTS)
+    input_ids, offsets, text_ids = encode_texts(nlp.tokenizer, [text], overlap=128)
+
+    assert len(input_ids) > 1
+    assert max(len(ids) for ids in input_ids) == 512
+    assert set(text_ids) == {0}
+    for previous, following in zip(offsets, offsets[1:]):
+        shared = {offset for offset in previous if offset[0] != offset[1]} & set(following)
+        assert len(shared) == 128
+
+
+def test_long_text_finds_the_entities_of_its_parts(nlp):
+    text = " ".join(TEXTS)
+    (found,) = predict_entities(nlp, [text])
+
+    expected = set()
+    shift = 0
+    for part, entities in zip(TEXTS, predict_entities(nlp, TEXTS)):
+        expected |= {(label, start + shift, end + shift) for label, start, end in spans(entities)}
+        shift += len(part) + 1
+
+    # the tokens see more context in the long text, a few entities differ in their extent
+    assert len(spans(found) & expected) >= 0.9 * len(expected)
+    for entity in found:
+        assert entity["word"] == text[entity["start"] : entity["end"]]
+    # entities in the overlap of two windows are found once
+    for previous, following in zip(found, found[1:]):
+        assert previous["end"] <= following["start"]
@@ -0,0 +1,66 @@
+import math
+
+from src.anon import anon_pipeline_batch
+from src.plan import anonymize_column, normalized_offsets
+
+ENTITIES = ["PHONE", "EMAIL"]
+
+
+class Counting:
+    """anon_pipeline_batch that keeps the texts it ran"""
+
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts, entities, keep_adresses, **options):
+        self.texts.extend(texts)
+        return anon_pipeline_batch(texts, entities, keep_adresses, **options)
+
+
+def test_cells_keep_their_text_and_share_a_run():
+    runner = Counting()
+    cells = [
+        "Anruf bei Müller unter 0221 123456",
+        "  Anruf bei Müller unter 0221 123456\n",
+        "Anruf bei Mu\u0308ller unter 0221 123456",
+        "   ",
+        math.nan,
+    ]
+
+    documents, report = anonymize_column(cells, ENTITIES, False, runner=runner)
+
+    assert runner.texts == ["Anruf bei Müller unter 0221 123456"]
+    assert [document.source for document in documents[:4]] == cells[:4]
+    assert [document.text for document in documents] == [
+        "Anruf bei Müller unter PHONE_1",
+        "  Anruf bei Müller unter PHONE_1\n",
+        "Anruf bei Mu\u0308ller unter PHONE_1",
+        "   ",
+        "",
+    ]
+    assert [span.text for span in documents[1].spans] == ["0221 123456"]
+    assert report["unique"] == 1 and report["empty"] == 2
+
+
+def test_spans_after_composed_characters_are_moved():
+    cell = " Müller: info@example.org "
+    documents, _ = anonymize_column([cell], ENTITIES, False)
+
+    assert documents[0].text == " Müller: EMAIL_1 "
+    assert documents[0].mapping == {"EMAIL_1": "info@example.org"}
+
+
+def test_offsets_of_a_normalization_that_joins_starters():
+    # Hangul jamo compose to one syllable, both have combining class 0
+    assert normalized_offsets("\u1100\u1161 0221 123456") is None
+    assert normalized_offsets(" äb ") == [1, 3, 4]
+
+
+def test_unmappable_cells_run_as_they_are():
+    runner = Counting()
+    cell = "\u1100\u1161 Anruf unter 0221 123456"
+
+    documents, _ = anonymize_column([cell], ENTITIES, False, runner=runner)
+
+    assert runner.texts == ["가 Anruf unter 0221 123456", cell]
+    assert documents[0].text == "\u1100\u1161 Anruf unter PHONE_1"
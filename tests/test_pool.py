@@ -0,0 +1,59 @@
+import pandas as pd
+
+import anonymize
+from src import pool as pool_module
+
+TEXTS = [f"Anruf unter 0221 {number:06d}, Mail an info{number}@example.org" for number in range(12)]
+
+
+class CountedPool(pool_module.WorkerPool):
+    """a WorkerPool that keeps its instances"""
+
+    created = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created.append(self)
+
+
+def run(tmp_path, name, *options):
+    source = tmp_path / "in.csv"
+    pd.DataFrame({"answer": TEXTS, "comment": TEXTS[::-1]}).to_csv(source, index=False)
+    anonymize.main(
+        [
+            str(source),
+            str(tmp_path / name),
+            "--columns",
+            "answer",
+            "comment",
+            "--entities",
+            "PHONE",
+            "EMAIL",
+            "--chunk-size",
+            "5",
+            *options,
+        ]
+    )
+    return pd.read_csv(tmp_path / name)
+
+
+def test_one_pool_for_all_chunks_and_columns(tmp_path, monkeypatch):
+    monkeypatch.setattr(anonymize, "WorkerPool", CountedPool)
+    monkeypatch.setattr(CountedPool, "created", [])
+
+    parallel = run(tmp_path, "parallel.csv", "--workers", "2")
+
+    assert len(CountedPool.created) == 1
+    assert parallel.equals(run(tmp_path, "single.csv"))
+    assert parallel["answer_anonymized"][0] == "Anruf unter PHONE_1, Mail an EMAIL_1"
+
+
+def test_pool_runs_in_input_order():
+    with pool_module.WorkerPool(2) as pool:
+        first = pool.run(TEXTS, ["PHONE"], False, chunk_size=2)
+        second = pool.run(TEXTS[::-1], ["PHONE"], False, chunk_size=5)
+
+    assert [document.text for document in first] == [
+        f"Anruf unter PHONE_1, Mail an info{number}@example.org" for number in range(12)
+    ]
+    assert [document.text for document in second] == [document.text for document in first][::-1]
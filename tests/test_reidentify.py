@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+import reidentify
+from src.anon import find_entity_spans, find_regex_spans
+from src.document import AnonymizedDocument
+from src.export import open_writer
+from src.vault import MappingVault
+
+TEXTS = ["Anruf unter 0221 123456", "kein Name", "Mail an info@example.org"]
+
+
+def anonymized_file(path, vault_path):
+    documents = [
+        AnonymizedDocument.from_spans(text, find_regex_spans(text, ["PHONE", "EMAIL"]))
+        for text in TEXTS
+    ]
+    vault = MappingVault(str(vault_path))
+    vault.put_many("job", "answer", range(len(TEXTS)), documents)
+    vault.close()
+
+    fmt = "csv" if path.name.endswith(".csv.gz") else path.suffix.lstrip(".")
+    writer = open_writer(str(path), fmt, "gzip" if fmt == "csv" else None)
+    writer.write(pd.DataFrame({"answer_anonymized": [document.text for document in documents]}))
+    writer.close()
+
+
+@pytest.mark.parametrize("name", ["out.csv.gz", "out.xlsx", "out.parquet"])
+def test_reidentify_reads_every_output_format(tmp_path, name):
+    anonymized_file(tmp_path / name, tmp_path / "vault.sqlite")
+    restored = tmp_path / "restored.parquet"
+
+    reidentify.main(
+        [
+            str(tmp_path / name),
+            str(restored),
+            "--vault",
+            str(tmp_path / "vault.sqlite"),
+            "--job",
+            "job",
+            "--columns",
+            "answer",
+        ]
+    )
+
+    frame = pd.read_parquet(restored)
+    assert frame["answer_anonymized"][0] == "Anruf unter PHONE_1"
+    assert list(frame["answer_reidentified"]) == TEXTS
+
+
+def test_every_spelling_of_an_entity_is_restored(tmp_path):
+    text = "Herr Müller kam. Das ist Müllers Hund."
+    start = text.index("Müller")
+    found = [{"entity_group": "PER", "word": "Müller", "start": start, "end": start + 6}]
+    document = AnonymizedDocument.from_spans(text, find_entity_spans(text, found, ["PER"]))
+    assert document.text == "PERSON_1 kam. Das ist PERSON_1 Hund."
+
+    vault = MappingVault(str(tmp_path / "vault.sqlite"))
+    vault.put_many("job", "answer", [0], [document])
+
+    assert vault.reidentify_many("job", "answer", [0], [document.text]) == [text]
+    vault.close()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import re
+import time
+
+import pytest
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+
+from src.cache import ResultCache, result_identity
+from src.gazetteer import Gazetteer
+from src.metrics import Aggregator
+from src.service import MicroBatcher, make_app
+
+TEXT = "Frau Henriette Reker wohnt in Köln."
+
+
+class KnownNamesModel:
+    """
+    stands in for the model through the predict_entities hook of src.ner: tags every
+    occurrence of its names and counts the texts it sees
+    """
+
+    identity = "known-names"
+
+    def __init__(self, names, delay=0):
+        self.names = names
+        self.delay = delay
+        self.texts = []
+        self.batches = []
+
+    def predict_entities(self, texts, token_budget=None, overlap=None):
+        time.sleep(self.delay)
+        self.texts.extend(texts)
+        self.batches.append(list(texts))
+        return [
+            [
+                {
+                    "entity_group": label,
+                    "word": match[0],
+                    "start": match.start(),
+                    "end": match.end(),
+                    "score": 1.0,
+                }
+                for name, label in self.names.items()
+                for match in re.finditer(re.escape(name), text)
+            ]
+            for text in texts
+        ]
+
+
+def call(app, *requests, concurrent=False):
+    """
+    (status, json) of every (path, body) request to app, sent one after another or,
+    concurrent, all at once in their order
+    """
+
+    async def run():
+        socket, port = bind_unused_port()
+        server = HTTPServer(app)
+        server.add_sockets([socket])
+        client = AsyncHTTPClient()
+
+        async def fetch(path, body):
+            response = await client.fetch(
+                f"http://127.0.0.1:{port}{path}",
+                method="POST",
+                body=json.dumps(body),
+                raise_error=False,
+            )
+            return response.code, json.loads(response.body)
+
+        try:
+            if concurrent:
+                return await asyncio.gather(*(fetch(path, body) for path, body in requests))
+            return [await fetch(path, body) for path, body in requests]
+        finally:
+            server.stop()
+            client.close()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def nlp():
+    return KnownNamesModel({"Henriette Reker": "PER", "Köln": "LOC"})
+
+
+@pytest.fixture
+def app(nlp):
+    gazetteer = Gazetteer.from_lines(["LOC\tKöln"])
+    return make_app(
+        nlp,
+        ResultCache(result_identity(nlp.identity, gazetteer)),
+        gazetteer,
+        ResultCache(result_identity(nlp.identity, gazetteer, fast=True)),
+        max_wait=0,
+    )
+
+
+def test_anonymize(app):
+    [(code, result)] = call(app, ("/anonymize", {"text": TEXT}))
+
+    assert code == 200
+    assert result["text"] == "PERSON_1 wohnt in LOCATION_1."
+    assert result["mapping"] == {"PERSON_1": "Frau Henriette Reker", "LOCATION_1": "Köln"}
+
+
+def test_fast_results_are_not_served_to_model_requests(app, nlp):
+    (_, fast), (_, normal) = call(
+        app, ("/anonymize", {"text": TEXT, "fast": True}), ("/anonymize", {"text": TEXT})
+    )
+
+    assert fast["text"] == "Frau Henriette Reker wohnt in LOCATION_1."
+    assert normal["text"] == "PERSON_1 wohnt in LOCATION_1."
+    assert nlp.texts == [TEXT]
+
+
+def test_model_results_are_not_served_to_fast_requests(app):
+    _, (_, fast) = call(
+        app, ("/anonymize", {"text": TEXT}), ("/anonymize", {"text": TEXT, "fast": True})
+    )
+
+    assert fast["text"] == "Frau Henriette Reker wohnt in LOCATION_1."
+
+
+def test_repeated_texts_come_from_the_cache(app, nlp):
+    _, (_, result) = call(
+        app, ("/anonymize", {"text": TEXT}), ("/anonymize/batch", {"texts": [TEXT, TEXT]})
+    )
+
+    assert [r["text"] for r in result["results"]] == ["PERSON_1 wohnt in LOCATION_1."] * 2
+    assert nlp.texts == [TEXT]
+
+
+def test_consistent_batch(app):
+    [(_, result)] = call(
+        app, ("/anonymize/batch", {"texts": ["Köln ist groß.", TEXT], "consistent": True})
+    )
+
+    assert [r["text"] for r in result["results"]] == [
+        "LOCATION_1 ist groß.",
+        "PERSON_1 wohnt in LOCATION_1.",
+    ]
+
+
+def test_fast_mode_without_gazetteer_is_rejected(nlp):
+    [(code, result)] = call(make_app(nlp), ("/anonymize", {"text": TEXT, "fast": True}))
+
+    assert code == 400
+    assert "gazetteer" in result["error"]
+
+
+def test_invalid_entities_are_rejected(app):
+    [(code, _)] = call(app, ("/anonymize", {"text": TEXT, "entities": ["NAME"]}))
+
+    assert code == 400
+
+
+def test_concurrent_requests_share_a_batch(nlp):
+    texts = [f"Henriette Reker wohnt in Köln, Haus {number}." for number in range(5)]
+    app = make_app(nlp, max_wait=1.0)
+
+    results = call(
+        app,
+        *[("/anonymize", {"text": text, "timings": True}) for text in texts],
+        concurrent=True,
+    )
+
+    assert [result["text"] for _, result in results] == [
+        f"PERSON_1 wohnt in LOCATION_1, Haus {number}." for number in range(5)
+    ]
+    assert [result["timings"]["batch_texts"] for _, result in results] == [5] * 5
+    # the connections may arrive in any order
+    assert [sorted(batch) for batch in nlp.batches] == [texts]
+
+
+def test_requests_beyond_max_pending_are_rejected():
+    nlp = KnownNamesModel({"Köln": "LOC"}, delay=0.3)
+    app = make_app(nlp, max_wait=0, max_pending=2)
+
+    (batch_code, _), (code, result) = call(
+        app,
+        ("/anonymize/batch", {"texts": ["Köln", "Köln ist groß."]}),
+        ("/anonymize", {"text": TEXT}),
+        concurrent=True,
+    )
+
+    assert batch_code == 200
+    assert code == 503
+    assert "waiting" in result["error"]
+
+
+class FailingMetrics(Aggregator):
+    """fails to merge the metrics of the first batch"""
+
+    failed = False
+
+    def merge(self, snapshot):
+        if not self.failed:
+            self.failed = True
+            raise RuntimeError("merge failed")
+        super().merge(snapshot)
+
+
+def test_an_error_fails_its_batch_and_not_the_batcher():
+    batcher = MicroBatcher(lambda texts: [text.upper() for text in texts], max_wait=0)
+
+    batcher.metrics = FailingMetrics()
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(batcher.submit(["erste"], ()), 5)
+        return await asyncio.wait_for(batcher.submit(["zweite"], ()), 5)
+
+    documents, _ = asyncio.run(run())
+
+    assert documents == ["ZWEITE"]
+    assert batcher.pending == 0